@@ -12,5 +12,6 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings.development")
+os.environ.setdefault("GRAPHQL_ASYNC", "1")
 
 application = get_asgi_application()
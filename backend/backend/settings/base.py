@@ -25,12 +25,20 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "ecommerce.apps.EcommerceConfig",
     "graphene_django",
 ]
 
 MIDDLEWARE = [
+    "ecommerce.middleware.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
+    "ecommerce.middleware.SiteMiddleware",
+]
+
+# Run by SiteMiddleware for every path except API_PATHS, which authenticate with
+# a JWT and don't use sessions, CSRF or messages
+SITE_MIDDLEWARE = [
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -39,6 +47,15 @@ MIDDLEWARE = [
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
+API_PATHS = ["/graphql/"]
+
+# The admin's middleware is run by SiteMiddleware, out of sight of its checks
+SILENCED_SYSTEM_CHECKS = ["admin.E408", "admin.E409", "admin.E410"]
+
+# Comma separated addresses, eg. of the Prometheus server, allowed to read
+# /metrics/ and /metrics/catalog-cache/ without logging in as staff
+INTERNAL_IPS = list(filter(None, os.getenv("INTERNAL_IPS", "").split(",")))
+
 ROOT_URLCONF = "backend.urls"
 
 TEMPLATES = [
@@ -70,6 +87,51 @@ DATABASES = {
     }
 }
 
+# Seconds database connections are kept open between requests (0 closes them
+# after each one), persistent connections are pinged before being reused
+DATABASE_CONN_MAX_AGE = int(os.getenv("DATABASE_CONN_MAX_AGE", 60))
+DATABASE_HEALTH_CHECKS = True
+# Connections of the async view's pool per worker process, 0 disables the pool
+DATABASE_POOL_SIZE = int(os.getenv("DATABASE_POOL_SIZE", 0))
+# Seconds to wait for a pooled connection before failing the request
+DATABASE_POOL_TIMEOUT = 10
+
+# Aliases of read replicas of the "default" database. Query operations read from
+# them round-robin, a replica failing to connect is skipped for RETRY_AFTER seconds.
+DATABASE_REPLICAS = []
+DATABASE_REPLICA_RETRY_AFTER = 30
+# Seconds the reads of a user stay on the primary after they order or change their cart
+DATABASE_READ_YOUR_WRITES_WINDOW = 5
+DATABASE_ROUTERS = ["ecommerce.routers.ReplicaRouter"]
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.0/topics/cache/
+# Local memory by default, point CACHE_BACKEND/CACHE_LOCATION at a shared cache
+# (eg. memcached) so every worker sees the same catalog cache and invalidations.
+
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv(
+            "CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": os.getenv("CACHE_LOCATION", "larena"),
+    },
+    # queries registered by clients, in a table so every worker knows them
+    # without a shared cache server, see `manage.py createcachetable`
+    "persisted_queries": {
+        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+        "LOCATION": "graphql_persisted_query_cache",
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    },
+}
+
+# Cached products/product results, invalidated on Product/Photo/Review/Like changes
+CATALOG_CACHE_ENABLED = True
+CATALOG_CACHE_TIMEOUT = 300
+# How long a single request may take to refresh a stale entry
+CATALOG_CACHE_LOCK_TIMEOUT = 10
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
@@ -111,14 +173,68 @@ STATIC_URL = "/static/"
 
 GRAPHENE = {
     "SCHEMA": "backend.schema.schema",
-    "MIDDLEWARE": ["graphql_jwt.middleware.JSONWebTokenMiddleware"],
+    "MIDDLEWARE": [
+        "ecommerce.auth.JSONWebTokenMiddleware",
+        "ecommerce.tracing.TracingMiddleware",
+    ],
 }
 
+# Minimum trigram similarity for a misspelt word to still match a product, set as
+# pg_trgm.word_similarity_threshold on postgres connections
+SEARCH_SIMILARITY_THRESHOLD = 0.3
+
+# Number of parsed and validated documents kept per process
+GRAPHQL_DOCUMENT_CACHE_SIZE = 500
+# Reject documents that weren't registered with `manage.py register_persisted_queries`
+GRAPHQL_PERSISTED_QUERIES_ONLY = False
+# Queries registered by clients through automatic persisted queries are kept in
+# the PERSISTED_QUERY_CACHE this long. Unknown hashes are looked up again after
+# PERSISTED_QUERY_MISS_TTL.
+GRAPHQL_PERSISTED_QUERY_CACHE = "persisted_queries"
+GRAPHQL_PERSISTED_QUERY_TTL = 24 * 60 * 60  # seconds
+GRAPHQL_PERSISTED_QUERY_MISS_TTL = 10  # seconds
+
+# Largest page a connection field may return
+GRAPHQL_MAX_PAGE_SIZE = 100
+
+# Operations nested deeper or estimated costlier than this are rejected before
+# execution, lists without `first` are assumed to hold DEFAULT_LIST_SIZE items
+GRAPHQL_MAX_DEPTH = 10
+GRAPHQL_MAX_COST = 5000
+GRAPHQL_DEFAULT_LIST_SIZE = 20
+# Batch requests, a JSON array of operations, are limited in size and in the
+# total cost of their operations
+GRAPHQL_MAX_BATCH_SIZE = 10
+GRAPHQL_MAX_BATCH_COST = 10000
+
+# GraphQL responses are encoded with JSON_ENCODER, a callable returning bytes
+# (orjson when installed). Bodies from COMPRESS_MIN_SIZE bytes are compressed
+# with brotli or gzip.
+GRAPHQL_JSON_ENCODER = "ecommerce.responses.dumps"
+GRAPHQL_COMPRESS_MIN_SIZE = 1024
+
+# Serve /graphql/ with the async view, set by backend/asgi.py
+GRAPHQL_ASYNC = bool(os.getenv("GRAPHQL_ASYNC"))
+
+# Collect per resolver timings and SQL query counts for every request. Requests
+# sending the header get their own trace in extensions.tracing either way, with
+# DEBUG or from staff users.
+GRAPHQL_TRACING_ENABLED = bool(os.getenv("GRAPHQL_TRACING_ENABLED"))
+GRAPHQL_TRACING_HEADER = "X-Debug-Tracing"
+
 AUTHENTICATION_BACKENDS = [
     "graphql_jwt.backends.JSONWebTokenBackend",
     "django.contrib.auth.backends.ModelBackend",
 ]
 
+GRAPHQL_JWT = {
+    "JWT_GET_USER_BY_NATURAL_KEY_HANDLER": "ecommerce.auth.get_user_by_natural_key",
+}
+
+# Users authenticated by their JWT are cached this long, changes to a user
+# invalidate its copy
+AUTH_USER_CACHE_TIMEOUT = 60  # seconds
+
 EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
 EMAIL_HOST = "smtp.gmail.com"
 EMAIL_HOST_USER = os.getenv("GOOGLE_EMAIL")
@@ -128,3 +244,34 @@ EMAIL_PORT = 587
 EMAIL_USE_TLS = True
 
 ADMINS = [("Gurkirat", "gurkiratsinghchauhan14@gmail.com")]
+
+# Transactional email goes through the ecommerce.outbox table. Each web process
+# drains it with a small thread pool, which retries the emails that failed when
+# they're due. `manage.py drain_outbox --loop` (the worker process of heroku.yml)
+# also picks up the emails left behind by restarted web processes.
+OUTBOX_IN_PROCESS = True
+OUTBOX_WORKERS = 2
+OUTBOX_BATCH_SIZE = 50
+OUTBOX_MAX_ATTEMPTS = 5
+OUTBOX_RETRY_DELAY = 30  # seconds, doubled after every failed attempt
+
+# Appointments are booked per day in this time zone, with a unique (date, slot)
+# constraint allowing SLOTS_PER_DAY of them.
+APPOINTMENT_TIME_ZONE = "Asia/Kolkata"
+APPOINTMENT_SLOTS_PER_DAY = 1
+# Longest range of days availableSlots can be asked for
+APPOINTMENT_MAX_RANGE_DAYS = 366
+
+# Units in a cart are held for HOLD_TTL seconds after it last changed. Expired
+# holds are returned when their product runs short and swept in batches by
+# `manage.py release_expired_holds --loop`. Unheld units are split over SLOTS
+# rows per product so concurrent holds rarely wait on each other.
+INVENTORY_HOLD_TTL = 15 * 60  # seconds
+INVENTORY_SLOTS = 8
+INVENTORY_SWEEP_BATCH_SIZE = 1000
+
+# Responses of orderCart and orderProduct are kept this long for the clients
+# retrying them with the same idempotencyKey, `manage.py purge_idempotency_keys`
+# deletes the expired ones.
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60  # seconds
+IDEMPOTENCY_PURGE_BATCH_SIZE = 1000
@@ -20,7 +20,17 @@ DATABASES = {
         "HOST": os.getenv("DB_HOST"),
         "PASSWORD": os.getenv("DB_PASSWORD"),
         "PORT": os.getenv("DB_PORT"),
+        "CONN_MAX_AGE": DATABASE_CONN_MAX_AGE,
     }
 }
 
+# Comma separated hosts of read replicas
+for i, host in enumerate(filter(None, os.getenv("DB_REPLICA_HOSTS", "").split(",")), 1):
+    DATABASES[f"replica{i}"] = {
+        **DATABASES["default"],
+        "HOST": host,
+        "TEST": {"MIRROR": "default"},
+    }
+    DATABASE_REPLICAS.append(f"replica{i}")
+
 AUTH_USER_MODEL = "ecommerce.User"
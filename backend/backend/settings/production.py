@@ -1,4 +1,5 @@
 import os
+import dj_database_url
 import django_heroku
 
 from .base import *
@@ -11,8 +12,8 @@ ALLOWED_HOSTS = ["*"]
 # White Noise configuration - http://whitenoise.evans.io/en/stable/django.html
 INSTALLED_APPS.extend(["whitenoise.runserver_nostatic"])
 
-# Must insert after SecurityMiddleware, which is first in settings/common.py
-MIDDLEWARE.insert(1, "whitenoise.middleware.WhiteNoiseMiddleware")
+# Must run right after SecurityMiddleware, API requests never ask for static files
+SITE_MIDDLEWARE.insert(0, "whitenoise.middleware.WhiteNoiseMiddleware")
 
 TEMPLATES[0]["DIRS"] = [os.path.join(BASE_DIR, "../", "frontend", "build")]
 
@@ -21,7 +22,17 @@ STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
 STATIC_ROOT = os.path.join(BASE_DIR, "staticfiles")
 
 
-django_heroku.settings(locals())
+# static files are configured above, django_heroku would add WhiteNoise to the
+# API requests too
+django_heroku.settings(locals(), staticfiles=False)
+DATABASES["default"]["CONN_MAX_AGE"] = DATABASE_CONN_MAX_AGE
+
+# Space separated urls of read replicas
+for i, url in enumerate(os.getenv("DATABASE_REPLICA_URLS", "").split(), 1):
+    DATABASES[f"replica{i}"] = dj_database_url.parse(
+        url, conn_max_age=DATABASE_CONN_MAX_AGE, ssl_require=True
+    )
+    DATABASE_REPLICAS.append(f"replica{i}")
+
 STATIC_URL = "/static/"
 WHITENOISE_ROOT = os.path.join(BASE_DIR, "../", "frontend", "build", "root")
-
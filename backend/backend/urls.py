@@ -1,11 +1,25 @@
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, re_path
 from django.views.generic import TemplateView
 from django.views.decorators.csrf import csrf_exempt
-from graphene_django.views import GraphQLView
+
+from ecommerce.views import (
+    AsyncGraphQLView,
+    GraphQLView,
+    catalog_cache_stats,
+    prometheus_metrics,
+)
+
+if settings.GRAPHQL_ASYNC:
+    graphql_view = AsyncGraphQLView.as_view(graphiql=True)
+else:
+    graphql_view = csrf_exempt(GraphQLView.as_view(graphiql=True))
 
 urlpatterns = [
     path("admin/", admin.site.urls),
-    path('graphql/', csrf_exempt(GraphQLView.as_view(graphiql=True))),
+    path("graphql/", graphql_view),
+    path("metrics/", prometheus_metrics),
+    path("metrics/catalog-cache/", catalog_cache_stats),
     re_path(".*", TemplateView.as_view(template_name="index.html")),
 ]
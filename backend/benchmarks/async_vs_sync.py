@@ -0,0 +1,51 @@
+"""
+Compares the throughput of the synchronous WSGI deployment with the ASGI one
+using the async GraphQL view, under the same number of workers and concurrent
+clients.
+
+    DJANGO_SETTINGS_MODULE=backend.settings.development \
+        python benchmarks/async_vs_sync.py --workers 4 --concurrency 50
+
+The database must hold some products, see `manage.py seed_benchmark_data`.
+"""
+import argparse
+import json
+
+from common import run_load, serve
+
+QUERY = """
+{
+  products(first: 20) { id name price photos { url } reviews { id rating } }
+  productsConnection(first: 10) { edges { node { id name } } }
+  bookedDates
+}
+"""
+
+MODES = {
+    "sync": ["backend.wsgi"],
+    "async": ["-k", "uvicorn.workers.UvicornWorker", "backend.asgi:application"],
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    body = json.dumps({"query": QUERY})
+    results = {}
+    for mode, server_args in MODES.items():
+        with serve(["--workers", str(args.workers), *server_args]) as url:
+            run_load(f"{url}/graphql/", body, requests=50, concurrency=5)
+            results[mode] = run_load(
+                f"{url}/graphql/", body, args.requests, args.concurrency
+            )
+        print(mode, results[mode])
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Measures the cost of authenticating a query selecting 50 fields, in process,
+with graphql_jwt's middleware (run for every field, user loaded from the
+database on every request) and with the request scoped authentication, with
+and without the user cache.
+
+    DJANGO_SETTINGS_MODULE=backend.settings.development \
+        python benchmarks/auth_overhead.py --email <user email>
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--email", help="user to authenticate as, the first by default")
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+
+    import django
+
+    django.setup()
+
+    from django.contrib.auth.models import AnonymousUser
+    from django.db import connection, reset_queries
+    from django.test import RequestFactory, override_settings
+    from graphql_jwt.middleware import JSONWebTokenMiddleware
+    from graphql_jwt.shortcuts import get_token
+
+    from common import percentile
+    from ecommerce.models import User
+    from ecommerce.views import GraphQLView
+
+    users = User.objects.order_by("pk")
+    user = users.get(email=args.email) if args.email else users.first()
+    fields = ["id", "name", "email", "phone"]
+    selection = " ".join(f"f{i}: {fields[i % len(fields)]}" for i in range(50))
+    body = json.dumps({"query": f"{{ me {{ {selection} }} }}"})
+    factory = RequestFactory(HTTP_AUTHORIZATION=f"JWT {get_token(user)}")
+
+    views = {
+        "graphql_jwt middleware": (
+            GraphQLView.as_view(middleware=[JSONWebTokenMiddleware()]),
+            {"AUTH_USER_CACHE_TIMEOUT": 0},
+        ),
+        "request scoped, no user cache": (
+            GraphQLView.as_view(),
+            {"AUTH_USER_CACHE_TIMEOUT": 0},
+        ),
+        "request scoped, cached user": (GraphQLView.as_view(), {}),
+    }
+
+    results = {}
+    for name, (view, overrides) in views.items():
+        with override_settings(DEBUG=True, **overrides):
+            latencies, queries = [], []
+            for i in range(args.requests + 50):
+                request = factory.post("/graphql/", body, content_type="application/json")
+                # as set by AuthenticationMiddleware without a session
+                request.user = AnonymousUser()
+                reset_queries()
+                start = time.perf_counter()
+                response = view(request)
+                elapsed = time.perf_counter() - start
+                assert (
+                    response.status_code == 200 and b"errors" not in response.content
+                ), response.content
+                if i >= 50:
+                    latencies.append(elapsed)
+                    queries.append(len(connection.queries))
+        results[name] = {
+            "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+            "mean_ms": round(statistics.mean(latencies) * 1000, 3),
+            "queries_per_request": statistics.mean(queries),
+        }
+        print(f"{name}: {results[name]}")
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
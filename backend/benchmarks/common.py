@@ -0,0 +1,119 @@
+"""
+Helpers shared by the benchmark scripts: starting the app under a server and
+driving it with concurrent keep-alive HTTP clients. Only the standard library is
+used, so the scripts run anywhere the app does.
+"""
+import http.client
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline and process.poll() is None:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Server didn't start on port {port}")
+
+
+@contextmanager
+def serve(args, env=None):
+    """
+    Runs `gunicorn <args>` from the backend directory on a free port, yielding
+    the base url of the server.
+    """
+    port = free_port()
+    command = [
+        sys.executable,
+        "-c",
+        "from gunicorn.app.wsgiapp import run; run()",
+        "--bind",
+        f"127.0.0.1:{port}",
+        "--log-level",
+        "warning",
+        *args,
+    ]
+    process = subprocess.Popen(
+        command, cwd=BACKEND_DIR, env={**os.environ, **(env or {})}
+    )
+    try:
+        wait_for(port, process)
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+def run_load(url, body, requests=1000, concurrency=20, headers=None, method="POST"):
+    """
+    Sends `requests` requests to `url` from `concurrency` threads, each reusing
+    its connection, and returns the throughput and latency percentiles.
+    """
+    parts = urlsplit(url)
+    headers = {"Content-Type": "application/json", **(headers or {})}
+    latencies = []
+    errors = []
+    remaining = iter(range(requests))
+    lock = threading.Lock()
+
+    def client():
+        connection = http.client.HTTPConnection(parts.hostname, parts.port, timeout=60)
+        while True:
+            with lock:
+                if next(remaining, None) is None:
+                    break
+            start = time.perf_counter()
+            try:
+                connection.request(method, parts.path or "/", body=body, headers=headers)
+                response = connection.getresponse()
+                response.read()
+                if response.status >= 400:
+                    errors.append(response.status)
+            except (OSError, http.client.HTTPException) as e:
+                errors.append(repr(e))
+                connection.close()
+                connection = http.client.HTTPConnection(parts.hostname, parts.port)
+            latencies.append(time.perf_counter() - start)
+        connection.close()
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "seconds": round(elapsed, 3),
+        "requests_per_second": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 2),
+    }
@@ -0,0 +1,56 @@
+"""
+Compares the per-request latency of a small query with a new database
+connection per request (CONN_MAX_AGE=0) and with persistent, health checked
+connections, on the sync deployment and on the async one with its pool.
+
+    DJANGO_SETTINGS_MODULE=backend.settings.development \
+        python benchmarks/connections.py --token <JWT>
+
+Without a token the query is `bookedDates`, with one it is `me`.
+"""
+import argparse
+import json
+
+from common import run_load, serve
+
+SERVERS = {
+    "sync": ["backend.wsgi"],
+    "async": ["-k", "uvicorn.workers.UvicornWorker", "backend.asgi:application"],
+}
+
+SETTINGS = {
+    "new connection per request": {"DATABASE_CONN_MAX_AGE": "0"},
+    "persistent connections": {"DATABASE_CONN_MAX_AGE": "60", "DATABASE_POOL_SIZE": "4"},
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--token", help="JWT of a user, to benchmark `me`")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=1)
+    args = parser.parse_args()
+
+    if args.token:
+        body = json.dumps({"query": "{ me { id name email } }"})
+        headers = {"Authorization": f"JWT {args.token}"}
+    else:
+        body = json.dumps({"query": "{ bookedDates }"})
+        headers = {}
+
+    results = {}
+    for server, server_args in SERVERS.items():
+        for name, env in SETTINGS.items():
+            with serve(["--workers", "1", *server_args], env) as url:
+                run_load(f"{url}/graphql/", body, 50, 1, headers)
+                result = run_load(
+                    f"{url}/graphql/", body, args.requests, args.concurrency, headers
+                )
+            results[f"{server}, {name}"] = result
+            print(f"{server}, {name}: {result}")
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Replays the operations of the frontend (see ecommerce/operations) as a user of
+the seeded data, and reports the throughput, latency percentiles and SQL queries
+of each as JSON, to diff between commits.
+
+    DJANGO_SETTINGS_MODULE=backend.settings.development \
+        python manage.py seed_benchmark_data
+    DJANGO_SETTINGS_MODULE=backend.settings.development \
+        python benchmarks/graphql_mix.py --output before.json
+
+By default the mix runs in process through the Django test client, one operation
+after the other. With --mode http the app is served by gunicorn and every
+operation is sent by concurrent clients; orderCart is then sent in a batch after
+the setCart refilling the cart, and SQL queries aren't counted.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+from common import percentile, run_load, serve
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SERVERS = {
+    "sync": ["backend.wsgi"],
+    "async": ["-k", "uvicorn.workers.UvicornWorker", "backend.asgi:application"],
+}
+
+
+def summarize(latencies, queries):
+    return {
+        "operations": len(latencies),
+        "operations_per_second": round(len(latencies) / sum(latencies), 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 2),
+        "queries_per_operation": round(statistics.mean(queries), 2),
+    }
+
+
+def run_client(token, bodies, rounds, warmup):
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import CaptureQueriesContext
+
+    client = Client(HTTP_AUTHORIZATION=f"JWT {token}")
+    latencies = {name: [] for name in bodies}
+    queries = {name: [] for name in bodies}
+    start = time.perf_counter()
+    for i in range(warmup + rounds):
+        if i == warmup:
+            start = time.perf_counter()
+        for name in bodies:
+            with CaptureQueriesContext(connection) as captured:
+                operation_start = time.perf_counter()
+                response = client.post(
+                    "/graphql/", bodies[name](), content_type="application/json"
+                )
+                elapsed = time.perf_counter() - operation_start
+            result = response.json()
+            assert response.status_code == 200 and "errors" not in result, (name, result)
+            if i >= warmup:
+                latencies[name].append(elapsed)
+                queries[name].append(len(captured))
+    elapsed = time.perf_counter() - start
+
+    results = {name: summarize(latencies[name], queries[name]) for name in bodies}
+    results["mix"] = {
+        "operations_per_second": round(rounds * len(bodies) / elapsed, 1),
+        "queries_per_round": round(sum(sum(queries[name]) for name in bodies) / rounds, 2),
+    }
+    return results
+
+
+def run_http(token, bodies, requests, concurrency, server, workers):
+    headers = {"Authorization": f"JWT {token}"}
+    results = {}
+    with serve(["--workers", str(workers), *SERVERS[server]]) as url:
+        for name in bodies:
+            body = bodies[name]()
+            # an order empties the cart, so orders are placed one at a time
+            clients = concurrency
+            if name == "orderCart":
+                body = f"[{bodies['setCart']()},{body}]"
+                clients = 1
+            run_load(f"{url}/graphql/", body, 50, 1, headers)
+            results[name] = run_load(f"{url}/graphql/", body, requests, clients, headers)
+            print(f"{name}: {results[name]}", file=sys.stderr)
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--mode", choices=["client", "http"], default="client")
+    parser.add_argument(
+        "--email", help="user to replay as, the first seeded one by default"
+    )
+    parser.add_argument(
+        "--requests",
+        type=int,
+        default=200,
+        help="Rounds of the mix, or requests per operation over http.",
+    )
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--server", choices=SERVERS, default="sync")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--output", help="file to write the JSON report to")
+    args = parser.parse_args()
+
+    import django
+
+    django.setup()
+
+    from graphql_jwt.shortcuts import get_token
+
+    from ecommerce import workload
+    from ecommerce.models import Address, Like, Order, Product, Review, User
+
+    users = User.objects.filter(email__startswith="bench").order_by("pk")
+    user = User.objects.get(email=args.email) if args.email else users.first()
+    address = Address.objects.filter(user=user).first()
+    product_ids = list(Product.objects.order_by("pk").values_list("pk", flat=True)[:1000])
+    if user is None or address is None or not product_ids:
+        parser.error("seed the database first, see `manage.py seed_benchmark_data`")
+
+    documents = workload.operations()
+    rng = random.Random(0)
+
+    def body(name):
+        def make():
+            product_id = rng.choice(product_ids)
+            variables = workload.operation_variables(name, product_id, address.pk)
+            return json.dumps({"query": documents[name], "variables": variables})
+
+        return make
+
+    # in the order of a visit, which the runs follow
+    bodies = {name: body(name) for name in workload.VISIT}
+    token = get_token(user)
+    if args.mode == "client":
+        results = run_client(token, bodies, args.requests, args.warmup)
+    else:
+        results = run_http(
+            token, bodies, args.requests, args.concurrency, args.server, args.workers
+        )
+
+    report = {
+        "revision": git_revision(),
+        "mode": args.mode,
+        "data": {
+            "products": Product.objects.count(),
+            "reviews": Review.objects.count(),
+            "likes": Like.objects.count(),
+            "orders": Order.objects.count(),
+        },
+        "operations": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Measures the CPU time and SQL queries the middleware adds to a /graphql/ request,
+in process, with the full chain of the site and with the API chain, where
+SiteMiddleware skips sessions, CSRF and messages. Requests carry a JWT and, as
+they would from a browser, the session cookie of a user logged into the site.
+
+    DJANGO_SETTINGS_MODULE=backend.settings.development \
+        python benchmarks/middleware.py --email <user email>
+"""
+import argparse
+import importlib.util
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--email", help="user to authenticate as, the first by default")
+    parser.add_argument("--requests", type=int, default=1000)
+    args = parser.parse_args()
+
+    import django
+
+    django.setup()
+
+    from django.conf import settings
+    from django.db import connection, reset_queries
+    from django.test import Client, override_settings
+    from graphql_jwt.shortcuts import get_token
+
+    from common import percentile
+    from ecommerce.models import User
+
+    users = User.objects.order_by("pk")
+    user = users.get(email=args.email) if args.email else users.first()
+    body = json.dumps({"query": "{ __typename }"})
+
+    site_middleware = list(settings.SITE_MIDDLEWARE)
+    if importlib.util.find_spec("whitenoise"):
+        # as in production, see settings/production.py
+        site_middleware.insert(0, "whitenoise.middleware.WhiteNoiseMiddleware")
+    chains = {
+        "full chain": {
+            "MIDDLEWARE": settings.MIDDLEWARE[:2] + site_middleware,
+        },
+        "API chain": {
+            "MIDDLEWARE": settings.MIDDLEWARE,
+            "SITE_MIDDLEWARE": site_middleware,
+        },
+    }
+
+    results = {}
+    for name, overrides in chains.items():
+        with override_settings(DEBUG=True, **overrides):
+            client = Client(HTTP_AUTHORIZATION=f"JWT {get_token(user)}")
+            client.force_login(user, backend="django.contrib.auth.backends.ModelBackend")
+            cpu, queries = [], []
+            for i in range(args.requests + 50):
+                reset_queries()
+                start = time.process_time()
+                response = client.post("/graphql/", body, content_type="application/json")
+                elapsed = time.process_time() - start
+                assert response.status_code == 200, response.content
+                if i >= 50:
+                    cpu.append(elapsed)
+                    queries.append(len(connection.queries))
+        results[name] = {
+            "cpu_p50_ms": round(percentile(cpu, 50) * 1000, 3),
+            "cpu_mean_ms": round(statistics.mean(cpu) * 1000, 3),
+            "queries_per_request": statistics.mean(queries),
+        }
+        print(f"{name}: {results[name]}")
+
+    full, api = results["full chain"], results["API chain"]
+    results["cpu_saved_ms"] = round(full["cpu_mean_ms"] - api["cpu_mean_ms"], 3)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
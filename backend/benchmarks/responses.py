@@ -0,0 +1,94 @@
+"""
+Times encoding and compressing a realistic `products` response of 500
+products, with the stdlib json module and the configured encoder, and with
+gzip and brotli at the levels used by the view.
+
+    python benchmarks/responses.py
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ecommerce import responses  # noqa: E402
+
+
+def products(count):
+    return {
+        "data": {
+            "products": [
+                {
+                    "id": str(i),
+                    "name": f"Hand made gold ring {i}",
+                    "price": 1000 + i,
+                    "discount": i % 30,
+                    "stock": i % 17,
+                    "kind": "Jewellery" if i % 2 else "Cloth",
+                    "description": "Hallmarked 22 carat gold, polished by hand in our "
+                    f"workshop. Every piece is unique, item number {i}. " * 3,
+                    "rating": round(3 + (i % 20) / 10, 1),
+                    "photos": [
+                        {"url": f"https://res.cloudinary.com/larena/image/{i}-{n}.jpg"}
+                        for n in range(3)
+                    ],
+                    "reviews": [
+                        {
+                            "id": str(i * 10 + n),
+                            "rating": 4,
+                            "desc": "Beautiful finish, exactly like the photos.",
+                            "user": {"name": f"Customer {n}"},
+                        }
+                        for n in range(2)
+                    ],
+                }
+                for i in range(count)
+            ]
+        }
+    }
+
+
+def timed(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return result, round(statistics.median(times) * 1000, 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--products", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    data = products(args.products)
+    results = {}
+
+    encoders = {
+        "json": lambda: json.dumps(data, separators=(",", ":")).encode(),
+        "orjson"
+        if responses.orjson
+        else "json (orjson not installed)": lambda: (responses.dumps(data)),
+    }
+    for name, encode in encoders.items():
+        content, ms = timed(encode, args.repeat)
+        results[f"encode, {name}"] = {"ms": ms, "bytes": len(content)}
+
+    for encoding in ("gzip", "br"):
+        if encoding == "br" and responses.brotli is None:
+            continue
+        compressed, ms = timed(lambda: responses.compress(content, encoding), args.repeat)
+        results[f"compress, {encoding}"] = {"ms": ms, "bytes": len(compressed)}
+
+    for name, result in results.items():
+        print(f"{name}: {result}")
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,11 @@
-from .models import Product
+from django import forms
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.admin import TabularInline
 from django.utils.translation import ugettext_lazy as _
 
-from .models import User, Address, Product, Photo, Review, Order, OrderObj
+from . import inventory
+from .models import User, Address, Product, Photo, Review, Order, OrderObj, OutboxEmail
 
 
 class AddressInline(TabularInline):
@@ -43,8 +44,52 @@ class CustomUserAdmin(UserAdmin):
 
 admin.site.register(User, CustomUserAdmin)
 admin.site.register(Address)
-admin.site.register(Product)
+
+
+class ProductForm(forms.ModelForm):
+    restock = forms.IntegerField(
+        required=False,
+        help_text=_("Units delivered, negative to write some off."),
+    )
+
+
+class ProductAdmin(admin.ModelAdmin):
+    # Product.stock isn't decremented by sales, the units left are only counted
+    # by ecommerce.inventory, so existing products are restocked by a delta
+    form = ProductForm
+
+    def get_fields(self, request, obj=None):
+        fields = super().get_fields(request, obj)
+        if obj is None:
+            fields.remove("restock")
+        return fields
+
+    def get_readonly_fields(self, request, obj=None):
+        if obj is None:
+            return ()
+        return ("stock", "on_hand")
+
+    def on_hand(self, product):
+        return inventory.on_hand([product.pk])[product.pk]
+
+    on_hand.short_description = _("units on hand")
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if change and form.cleaned_data.get("restock"):
+            inventory.restock(obj.pk, form.cleaned_data["restock"])
+
+
+admin.site.register(Product, ProductAdmin)
 admin.site.register(Photo)
 admin.site.register(OrderObj)
 admin.site.register(Order)
 admin.site.register(Review)
+
+
+class OutboxEmailAdmin(admin.ModelAdmin):
+    list_display = ("id", "subject", "status", "attempts", "created_at", "sent_at")
+    list_filter = ("status",)
+
+
+admin.site.register(OutboxEmail, OutboxEmailAdmin)
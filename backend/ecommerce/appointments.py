@@ -0,0 +1,70 @@
+import datetime
+from collections import Counter
+
+import pytz
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import Appointment
+
+
+def get_setting(name, default):
+    return getattr(settings, f"APPOINTMENT_{name}", default)
+
+
+def time_zone():
+    """The time zone appointments are booked in."""
+    return pytz.timezone(get_setting("TIME_ZONE", "Asia/Kolkata"))
+
+
+def local_date(timestamp):
+    """The day of `timestamp` in the time zone appointments are booked in."""
+    if timezone.is_naive(timestamp):
+        timestamp = timezone.make_aware(timestamp)
+    return timestamp.astimezone(time_zone()).date()
+
+
+def book(user, timestamp):
+    """
+    Books the first free slot of the day of `timestamp`. The unique constraint
+    on (date, slot) decides between concurrent bookings, the loser moves on to
+    the next slot or fails when the day is full.
+    """
+    date = local_date(timestamp)
+    taken = set(Appointment.objects.filter(date=date).values_list("slot", flat=True))
+    for slot in range(get_setting("SLOTS_PER_DAY", 1)):
+        if slot in taken:
+            continue
+        try:
+            with transaction.atomic():
+                return Appointment.objects.create(
+                    user=user, timestamp=timestamp, date=date, slot=slot
+                )
+        except IntegrityError:
+            # booked concurrently
+            continue
+    raise Exception("No slot on that day!")
+
+
+def available_slots(start, end):
+    """
+    Returns (date, number of free slots) for the days from `start` to `end`
+    with at least one free slot, ignoring past days.
+    """
+    start = max(start, local_date(timezone.now()))
+    if (end - start).days > get_setting("MAX_RANGE_DAYS", 366):
+        raise Exception("Date range is too long")
+    booked = Counter(
+        Appointment.objects.filter(date__range=(start, end)).values_list(
+            "date", flat=True
+        )
+    )
+    per_day = get_setting("SLOTS_PER_DAY", 1)
+    days = []
+    date = start
+    while date <= end:
+        if booked[date] < per_day:
+            days.append((date, per_day - booked[date]))
+        date += datetime.timedelta(days=1)
+    return days
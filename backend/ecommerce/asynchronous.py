@@ -0,0 +1,86 @@
+import asyncio
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import SynchronousOnlyOperation
+from django.db import close_old_connections
+from django.db.models import Manager, QuerySet
+from graphql.execution.executors.asyncio import AsyncioExecutor
+from promise import is_thenable
+
+from .db import check_connections, get_pool
+
+
+def get_running_loop():
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+def database_sync_to_async(func):
+    """
+    Like sync_to_async, but in any worker thread so calls run concurrently, or
+    in the connection pool when DATABASE_POOL_SIZE is set. The connections of
+    that thread are closed when expired or, checked once per request, unusable,
+    as Django does around requests.
+    """
+
+    def run(*args, **kwargs):
+        close_old_connections()
+        check_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    pool = get_pool()
+    if pool is not None:
+        return partial(pool.run, run)
+    return sync_to_async(run, thread_sensitive=False)
+
+
+def evaluate(result):
+    """Returns the rows of `result` if it is a lazy QuerySet or a Manager."""
+    if isinstance(result, Manager):
+        result = result.all()
+    if isinstance(result, QuerySet):
+        result = list(result)
+    return result
+
+
+def evaluated(fn):
+    """
+    Wraps the resolver `fn` so lazy QuerySets it returns are evaluated by the
+    call, in the calling thread, instead of when the executor iterates them.
+    """
+
+    def resolve(*args, **kwargs):
+        return evaluate(fn(*args, **kwargs))
+
+    return resolve
+
+
+class ThreadedAsyncioExecutor(AsyncioExecutor):
+    """
+    Runs the root fields of a query concurrently in worker threads, as their
+    resolvers query the database, which Django forbids on the event loop. Nested
+    fields resolve on the loop from the objects prefetched by the root ones, and
+    the few that still query the database are run again in a worker thread.
+    DataLoaders offload their batches themselves.
+    """
+
+    def execute(self, fn, *args, **kwargs):
+        info = args[1]
+        fn = evaluated(fn)
+        if len(info.path) == 1:
+            return super().execute(database_sync_to_async(fn), *args, **kwargs)
+
+        try:
+            result = fn(*args, **kwargs)
+            if is_thenable(result) and result.is_rejected:
+                result.get()
+        except SynchronousOnlyOperation:
+            # resolvers of queries have no side effects, running them twice is fine
+            return super().execute(database_sync_to_async(fn), *args, **kwargs)
+        return super().execute(lambda: result)
@@ -0,0 +1,88 @@
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.core.cache import cache
+from django.db import transaction
+from graphql_jwt import utils
+from graphql_jwt.exceptions import JSONWebTokenError
+from graphql_jwt.utils import get_http_authorization
+
+from .cache import bump_version, get_versions
+
+
+def get_setting(name, default):
+    return getattr(settings, f"AUTH_{name}", default)
+
+
+def version_key(username):
+    return f"auth:version:{username}"
+
+
+def user_key(username):
+    return f"auth:user:{username}"
+
+
+def get_user_by_natural_key(username):
+    """
+    JWT_GET_USER_BY_NATURAL_KEY_HANDLER serving users from the cache for up to
+    USER_CACHE_TIMEOUT seconds. Entries are stored with the version of the user
+    they were read at, so one read concurrently with invalidate_user() can't be
+    cached after it.
+    """
+    timeout = get_setting("USER_CACHE_TIMEOUT", 60)
+    if not timeout:
+        return utils.get_user_by_natural_key(username)
+
+    found = cache.get_many([version_key(username), user_key(username)])
+    version = found.get(version_key(username))
+    if version is None:
+        (version,) = get_versions(cache, [version_key(username)])
+    entry = found.get(user_key(username))
+    if entry is not None and entry[0] == version:
+        return entry[1]
+
+    user = utils.get_user_by_natural_key(username)
+    if user is not None:
+        cache.set(user_key(username), (version, user), timeout=timeout)
+    return user
+
+
+def invalidate_user(user):
+    """
+    Drops the cached copy of `user`, right away and again once the current
+    transaction commits, as requests may cache the old row in between.
+    """
+    key = version_key(user.get_username())
+    bump_version(cache, key)
+    transaction.on_commit(lambda: bump_version(cache, key))
+
+
+def authenticate_request(request):
+    """
+    Verifies the JWT of `request` once, ahead of execution, and sets the user
+    it belongs to. Returns False if the token is invalid, the error is then
+    raised on every root field by JSONWebTokenMiddleware.
+    """
+    if not hasattr(request, "jwt_error"):
+        request.jwt_error = None
+        if get_http_authorization(request) is not None and request.user.is_anonymous:
+            try:
+                user = authenticate(request=request)
+            except JSONWebTokenError as e:
+                request.jwt_error = e
+            else:
+                if user is not None:
+                    request.user = user
+    return request.jwt_error is None
+
+
+class JSONWebTokenMiddleware:
+    """
+    Replaces graphql_jwt's middleware, which runs for every field. Requests are
+    authenticated once by the view and this middleware is only kept for those
+    with an invalid token, to report the error on their root fields.
+    """
+
+    def resolve(self, next, root, info, **kwargs):
+        if len(info.path) == 1 and not authenticate_request(info.context):
+            raise info.context.jwt_error
+        return next(root, info, **kwargs)
@@ -0,0 +1,131 @@
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from graphql.language.printer import print_ast
+
+from . import metrics
+
+STATS = ("hit", "stale", "miss")
+
+
+def get_setting(name, default):
+    return getattr(settings, f"CATALOG_CACHE_{name}", default)
+
+
+def get_cache():
+    return caches[get_setting("ALIAS", "default")]
+
+
+def version_key(scope):
+    return f"catalog:version:{scope}"
+
+
+def stat_key(stat):
+    return f"catalog:stats:{stat}"
+
+
+def incr(cache, key, initial=1):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # missing key, add() so concurrent first increments don't overwrite each other
+        if cache.add(key, initial, timeout=None):
+            return initial
+        return cache.incr(key)
+
+
+def new_version():
+    # versions start from the clock rather than 0, so a version key the cache
+    # evicted can't come back at a value that entries were stored with
+    return time.time_ns()
+
+
+def get_versions(cache, keys):
+    """Returns the version stored at each of `keys`, starting the missing ones."""
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            cache.add(key, new_version(), timeout=None)
+            found[key] = cache.get(key, new_version())
+    return [found[key] for key in keys]
+
+
+def bump_version(cache, key):
+    return incr(cache, key, initial=new_version())
+
+
+def record(cache, stat):
+    incr(cache, stat_key(stat))
+    metrics.CATALOG_CACHE_REQUESTS.labels(stat).inc()
+
+
+def selection_signature(info):
+    """
+    Identifies the fields selected under the current field, as they decide which
+    relations were prefetched on the cached objects.
+    """
+    parts = [print_ast(field_ast) for field_ast in info.field_asts]
+    parts += [print_ast(info.fragments[name]) for name in sorted(info.fragments)]
+    return "\n".join(parts)
+
+
+def get_or_set(name, info, arguments, scopes, compute):
+    """
+    Returns the cached result of `compute()` for the field `name` called with
+    `arguments`, recomputing it when any of `scopes` was invalidated since.
+
+    Entries are stored under a key that doesn't include the scope versions, so
+    when an entry goes stale only the request winning a short lock recomputes it
+    while concurrent requests keep serving the previous value.
+    """
+    if not get_setting("ENABLED", True):
+        return compute()
+
+    cache = get_cache()
+    versions = get_versions(cache, [version_key(scope) for scope in scopes])
+
+    digest = hashlib.sha256(
+        json.dumps([name, arguments, selection_signature(info)], sort_keys=True).encode()
+    ).hexdigest()
+    key = f"catalog:entry:{digest}"
+
+    entry = cache.get(key)
+    if entry is not None:
+        entry_versions, value = entry
+        if entry_versions == versions:
+            record(cache, "hit")
+            return value
+        if not cache.add(f"{key}:lock", 1, timeout=get_setting("LOCK_TIMEOUT", 10)):
+            record(cache, "stale")
+            return value
+
+    record(cache, "miss")
+    value = compute()
+    cache.set(key, (versions, value), timeout=get_setting("TIMEOUT", 300))
+    cache.delete(f"{key}:lock")
+    return value
+
+
+def invalidate(*scopes):
+    """Bumps the version of `scopes` once the current transaction commits."""
+
+    def bump():
+        cache = get_cache()
+        for scope in scopes:
+            bump_version(cache, version_key(scope))
+
+    transaction.on_commit(bump)
+
+
+def invalidate_products(product_ids):
+    invalidate("products", *(f"product:{pk}" for pk in product_ids))
+
+
+def stats():
+    cache = get_cache()
+    found = cache.get_many([stat_key(stat) for stat in STATS])
+    return {stat: found.get(stat_key(stat), 0) for stat in STATS}
@@ -0,0 +1,101 @@
+import math
+
+from django.db import transaction
+
+from . import inventory
+from .models import CartObj, Order, OrderObj, Product
+
+
+def discounted_price(product):
+    return math.ceil(product.price - (product.discount * product.price) / 100)
+
+
+def _create_order(user, address, items):
+    order = Order.objects.create(
+        user=user,
+        name=address.name,
+        phone=address.phone,
+        address1=address.address1,
+        address2=address.address2,
+        pincode=address.pincode,
+        city=address.city,
+        state=address.state,
+        country=address.country,
+    )
+    OrderObj.objects.bulk_create(
+        OrderObj(order=order, product=product, qty=qty, price=discounted_price(product))
+        for product, qty in items
+    )
+    return order
+
+
+@transaction.atomic
+def order_cart(user, address):
+    """Turns the cart of `user` into an order, all or nothing."""
+    cart = list(CartObj.objects.filter(user=user).select_related("product"))
+    if not cart:
+        raise Exception("Cart is empty")
+
+    items = [(cart_obj.product, cart_obj.qty) for cart_obj in cart]
+    inventory.convert(user, items)
+    order = _create_order(user, address, items)
+    CartObj.objects.filter(pk__in=[cart_obj.pk for cart_obj in cart]).delete()
+    return order
+
+
+@transaction.atomic
+def order_product(user, address, product_id, qty):
+    """Orders `qty` of a single product, all or nothing."""
+    items = [(Product.objects.get(pk=product_id), qty)]
+    inventory.convert(user, items)
+    return _create_order(user, address, items)
+
+
+@transaction.atomic
+def set_cart_items(user, items, merge=False):
+    """
+    Sets the quantity of every (product_id, qty) in `items` in the cart of
+    `user`, adding to the current quantities when `merge` is true and otherwise
+    replacing the whole cart with `items`. Products left with a quantity of 0 or
+    less are removed. The units in the cart are held for the user, see
+    inventory.hold_cart.
+    """
+    quantities = {}
+    for product_id, qty in items:
+        try:
+            product_id = int(product_id)
+        except ValueError:
+            raise Exception(f"Product {product_id} does not exist")
+        quantities[product_id] = quantities.get(product_id, 0) + qty
+
+    found = set(Product.objects.filter(pk__in=quantities).values_list("pk", flat=True))
+    for product_id in quantities:
+        if product_id not in found:
+            raise Exception(f"Product {product_id} does not exist")
+
+    to_update, to_delete = [], []
+    for cart_obj in CartObj.objects.select_for_update().filter(user=user):
+        if cart_obj.product_id not in quantities:
+            if not merge:
+                to_delete.append(cart_obj.pk)
+            continue
+        if merge:
+            qty = cart_obj.qty + quantities.pop(cart_obj.product_id)
+        else:
+            qty = quantities.pop(cart_obj.product_id)
+        if qty > 0:
+            cart_obj.qty = qty
+            to_update.append(cart_obj)
+        else:
+            to_delete.append(cart_obj.pk)
+
+    if to_delete:
+        CartObj.objects.filter(pk__in=to_delete).delete()
+    if to_update:
+        CartObj.objects.bulk_update(to_update, ["qty"])
+    CartObj.objects.bulk_create(
+        CartObj(user=user, product_id=product_id, qty=qty)
+        for product_id, qty in quantities.items()
+        if qty > 0
+    )
+    inventory.hold_cart(user)
@@ -0,0 +1,174 @@
+from django.conf import settings
+from graphql import GraphQLError
+from graphql.language import ast
+from graphql.type.definition import GraphQLList, GraphQLNonNull, get_named_type
+
+from .pagination import max_page_size
+
+
+def get_setting(name, default):
+    return getattr(settings, f"GRAPHQL_{name}", default)
+
+
+class QueryComplexityError(GraphQLError):
+    def __init__(self, message, code, complexity):
+        super().__init__(message, extensions={"code": code, "complexity": complexity})
+
+
+def is_list(graphql_type):
+    if isinstance(graphql_type, GraphQLNonNull):
+        graphql_type = graphql_type.of_type
+    return isinstance(graphql_type, GraphQLList)
+
+
+class Analyzer:
+    """
+    Estimates the cost of an operation without executing it: every object
+    returned costs 1, multiplied by the number of items of the lists containing
+    it. Lists are assumed to hold `first`/`last` items when those are given and
+    DEFAULT_LIST_SIZE otherwise; the edges of a connection are bounded by the
+    page size of the connection field itself.
+    """
+
+    def __init__(self, schema, document_ast, variables=None):
+        self.schema = schema
+        self.variables = variables or {}
+        self.operations = []
+        self.fragments = {}
+        for definition in document_ast.definitions:
+            if isinstance(definition, ast.OperationDefinition):
+                self.operations.append(definition)
+            elif isinstance(definition, ast.FragmentDefinition):
+                self.fragments[definition.name.value] = definition
+        self.list_size = get_setting("DEFAULT_LIST_SIZE", 20)
+
+    def value(self, node):
+        if isinstance(node, ast.Variable):
+            return self.variables.get(node.name.value)
+        if isinstance(node, ast.IntValue):
+            return int(node.value)
+        return None
+
+    def multiplier(self, field_def, field_ast, paged):
+        arguments = {
+            argument.name.value: self.value(argument.value)
+            for argument in field_ast.arguments or ()
+        }
+        size = arguments.get("first")
+        if size is None:
+            size = arguments.get("last")
+        if size is not None:
+            # negative sizes are rejected by the resolvers, they must not lower the cost
+            size = max(size, 0)
+        if "first" in field_def.args and not is_list(field_def.type):
+            # connection, its edges are counted here
+            return max_page_size() if size is None else size, True
+        if is_list(field_def.type):
+            if paged:
+                return 1, False
+            return self.list_size if size is None else size, False
+        return 1, False
+
+    def selection_set(self, parent_type, selection_set, paged=False):
+        """Returns the (cost, depth) of the fields selected on `parent_type`."""
+        cost = depth = 0
+        for selection in selection_set.selections:
+            if isinstance(selection, ast.Field):
+                field_cost, field_depth = self.field(parent_type, selection, paged)
+            else:
+                if isinstance(selection, ast.FragmentSpread):
+                    selection = self.fragments[selection.name.value]
+                fragment_type = parent_type
+                if selection.type_condition:
+                    fragment_type = self.schema.get_type(
+                        selection.type_condition.name.value
+                    )
+                field_cost, field_depth = self.selection_set(
+                    fragment_type, selection.selection_set, paged
+                )
+            cost += field_cost
+            depth = max(depth, field_depth)
+        return cost, depth
+
+    def field(self, parent_type, field_ast, paged):
+        name = field_ast.name.value
+        field_def = getattr(parent_type, "fields", {}).get(name)
+        if field_ast.selection_set is None or field_def is None or name.startswith("__"):
+            # scalars, and introspection which is bounded by the schema
+            return 0, 0
+        multiplier, paged = self.multiplier(field_def, field_ast, paged)
+        cost, depth = self.selection_set(
+            get_named_type(field_def.type), field_ast.selection_set, paged
+        )
+        return multiplier * (1 + cost), depth + 1
+
+    def operation(self, operation_name=None):
+        operations = [
+            operation
+            for operation in self.operations
+            if operation_name is None
+            or (operation.name and operation.name.value == operation_name)
+        ]
+        if len(operations) != 1:
+            # let execution report the missing or ambiguous operation
+            return 0, 0
+        operation = operations[0]
+        root_type = {
+            "query": self.schema.get_query_type,
+            "mutation": self.schema.get_mutation_type,
+            "subscription": self.schema.get_subscription_type,
+        }[operation.operation]()
+        for definition in operation.variable_definitions or ():
+            name = definition.variable.name.value
+            if self.variables.get(name) is None and definition.default_value:
+                self.variables[name] = self.value(definition.default_value)
+        return self.selection_set(root_type, operation.selection_set)
+
+
+def analyze(schema, document_ast, variables=None, operation_name=None):
+    """Returns the (cost, depth) of the operation `operation_name` of a document."""
+    analyzer = Analyzer(schema, document_ast, dict(variables or {}))
+    return analyzer.operation(operation_name)
+
+
+def check(schema, document_ast, variables=None, operation_name=None, context=None):
+    """
+    Raises QueryComplexityError when the operation is deeper than MAX_DEPTH or
+    costlier than MAX_COST, otherwise returns its complexity for the response
+    extensions.
+
+    Operations of a batch request also count towards its MAX_BATCH_COST, the
+    cost of the batch so far is kept on the request (`context`).
+    """
+    cost, depth = analyze(schema, document_ast, variables, operation_name)
+    complexity = {
+        "cost": cost,
+        "maxCost": get_setting("MAX_COST", 5000),
+        "depth": depth,
+        "maxDepth": get_setting("MAX_DEPTH", 10),
+    }
+    if depth > complexity["maxDepth"]:
+        raise QueryComplexityError(
+            f"Query depth {depth} exceeds the maximum of {complexity['maxDepth']}",
+            "QUERY_TOO_DEEP",
+            complexity,
+        )
+    if cost > complexity["maxCost"]:
+        raise QueryComplexityError(
+            f"Query cost {cost} exceeds the maximum of {complexity['maxCost']}",
+            "QUERY_TOO_COMPLEX",
+            complexity,
+        )
+    batch_cost = getattr(context, "batch_cost", None)
+    if batch_cost is not None:
+        complexity["batchCost"] = batch_cost + cost
+        complexity["maxBatchCost"] = get_setting("MAX_BATCH_COST", 10000)
+        if complexity["batchCost"] > complexity["maxBatchCost"]:
+            raise QueryComplexityError(
+                f"Batch cost {complexity['batchCost']} exceeds the maximum of "
+                f"{complexity['maxBatchCost']}",
+                "BATCH_TOO_COMPLEX",
+                complexity,
+            )
+        context.batch_cost = complexity["batchCost"]
+    return complexity
@@ -0,0 +1,79 @@
+from django.db.models import Count, F, Sum
+
+from .models import Like, Product, Review
+
+# Incremental maintenance, call inside the transaction changing the rows. The
+# *_removed ones only once delete() reported the row deleted, a concurrent
+# request may have deleted it first and decremented already.
+
+
+def review_added(review):
+    Product.objects.filter(pk=review.product_id).update(
+        review_count=F("review_count") + 1, rating_sum=F("rating_sum") + review.rating
+    )
+
+
+def review_removed(review):
+    Product.objects.filter(pk=review.product_id).update(
+        review_count=F("review_count") - 1, rating_sum=F("rating_sum") - review.rating
+    )
+
+
+def like_added(like):
+    Review.objects.filter(pk=like.review_id).update(likes_count=F("likes_count") + 1)
+
+
+def like_removed(like):
+    Review.objects.filter(pk=like.review_id).update(likes_count=F("likes_count") - 1)
+
+
+# Bulk rebuild
+
+
+def _recompute(model, fields, expected, fix, batch_size):
+    """
+    Compares `fields` of every `model` row with `expected` (pk -> tuple of
+    values, missing meaning all zero) and bulk updates the rows that drifted.
+    Returns the number of drifted rows.
+    """
+    drifted = []
+    zeros = (0,) * len(fields)
+    for obj in model.objects.only("pk", *fields).order_by("pk").iterator():
+        values = expected.get(obj.pk, zeros)
+        if tuple(getattr(obj, field) for field in fields) != values:
+            for field, value in zip(fields, values):
+                setattr(obj, field, value)
+            drifted.append(obj)
+
+    if fix and drifted:
+        model.objects.bulk_update(drifted, fields, batch_size=batch_size)
+    return len(drifted)
+
+
+def recompute(fix=True, batch_size=1000):
+    """
+    Rebuilds the denormalized counters from the Review and Like rows. Returns the
+    number of drifted rows per model.
+    """
+    reviews = (
+        Review.objects.order_by()
+        .values_list("product_id")
+        .annotate(count=Count("pk"), total=Sum("rating"))
+    )
+    likes = Like.objects.order_by().values_list("review_id").annotate(count=Count("pk"))
+    return {
+        "product": _recompute(
+            Product,
+            ["review_count", "rating_sum"],
+            {pk: (count, total) for pk, count, total in reviews},
+            fix,
+            batch_size,
+        ),
+        "review": _recompute(
+            Review,
+            ["likes_count"],
+            {pk: (count,) for pk, count in likes},
+            fix,
+            batch_size,
+        ),
+    }
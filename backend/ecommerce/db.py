@@ -0,0 +1,109 @@
+import asyncio
+import contextvars
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.db import connections
+
+from . import metrics
+
+
+# connections already checked, or opened, during the current request
+_checked = contextvars.ContextVar("checked_connections", default=None)
+
+
+def start_request(**kwargs):
+    """request_started receiver, the connections are checked again on next use."""
+    _checked.set(set())
+    check_connections()
+
+
+def check_connections():
+    """
+    Closes the persistent connections that stopped working since their last use,
+    eg. after a database restart or an idle timeout, so the next query opens a
+    fresh one instead of failing. Django only closes connections that already
+    raised an error or outlived CONN_MAX_AGE.
+
+    Called when a request starts and by every thread hop of the async view, each
+    connection is checked at most once per request.
+    """
+    if not getattr(settings, "DATABASE_HEALTH_CHECKS", False):
+        return
+    checked = _checked.get()
+    for connection in connections.all():
+        if checked is not None:
+            if connection in checked:
+                continue
+            checked.add(connection)
+        if (
+            connection.connection is None
+            # closed after every request, never reused
+            or not connection.settings_dict["CONN_MAX_AGE"]
+            or connection.in_atomic_block
+        ):
+            continue
+        start = time.perf_counter()
+        usable = connection.is_usable()
+        metrics.HEALTH_CHECK_DURATION.observe(time.perf_counter() - start)
+        if not usable:
+            metrics.CONNECTIONS_DISCARDED.labels(connection.alias).inc()
+            connection.close()
+
+
+class ConnectionPool:
+    """
+    Runs the database work of the async view on at most `size` threads, each
+    keeping its own persistent connection, so a worker process never holds more
+    than `size` connections per database. Callers wait up to `timeout` seconds
+    for a free one.
+    """
+
+    def __init__(self, size, timeout):
+        self.size = size
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(size, thread_name_prefix="db-pool")
+        # asyncio primitives are bound to the loop they are created in
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    def semaphore(self):
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.size)
+        return semaphore
+
+    async def run(self, func, *args, **kwargs):
+        semaphore = self.semaphore()
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(semaphore.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            metrics.POOL_TIMEOUTS.inc()
+            raise Exception("Timed out waiting for a database connection")
+        metrics.POOL_WAIT.observe(time.perf_counter() - start)
+        try:
+            # like sync_to_async, the thread sees the caller's context variables
+            context = contextvars.copy_context()
+            return await asyncio.get_running_loop().run_in_executor(
+                self.executor, partial(context.run, func, *args, **kwargs)
+            )
+        finally:
+            semaphore.release()
+
+
+_pool = None
+
+
+def get_pool():
+    """Returns the pool of the async view, None unless DATABASE_POOL_SIZE is set."""
+    global _pool
+    size = getattr(settings, "DATABASE_POOL_SIZE", 0)
+    if not size:
+        return None
+    if _pool is None:
+        _pool = ConnectionPool(size, getattr(settings, "DATABASE_POOL_TIMEOUT", 10))
+    return _pool
@@ -0,0 +1,270 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError
+from graphql import GraphQLError
+from graphql.backend.base import GraphQLBackend, GraphQLDocument
+from graphql.execution import ExecutionResult, execute
+from graphql.language.base import parse
+from graphql.validation import validate
+from promise import Promise, is_thenable
+
+from . import complexity, metrics
+from .models import PersistedQuery
+
+
+def get_setting(name, default):
+    return getattr(settings, f"GRAPHQL_{name}", default)
+
+
+def query_hash(query):
+    return hashlib.sha256(query.encode()).hexdigest()
+
+
+class LRUCache:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            return self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+def _invalid(errors, *args, **kwargs):
+    return ExecutionResult(errors=errors, invalid=True)
+
+
+def _execute(
+    schema, document_ast, *args, variable_values=None, operation_name=None, **kwargs
+):
+    # cost depends on the variables, so it is checked on every execution
+    try:
+        extensions = {
+            "complexity": complexity.check(
+                schema,
+                document_ast,
+                variable_values,
+                operation_name,
+                kwargs.get("context_value"),
+            )
+        }
+    except complexity.QueryComplexityError as e:
+        return ExecutionResult(errors=[e], invalid=True)
+    result = execute(
+        schema,
+        document_ast,
+        *args,
+        variable_values=variable_values,
+        operation_name=operation_name,
+        **kwargs,
+    )
+    if is_thenable(result):
+        # return_promise=True, as used by the async view
+        return Promise.resolve(result).then(
+            lambda result: _add_extensions(result, extensions)
+        )
+    return _add_extensions(result, extensions)
+
+
+def _add_extensions(result, extensions):
+    result.extensions.update(extensions)
+    return result
+
+
+class CachedBackend(GraphQLBackend):
+    """
+    Parses and validates every distinct document once, keeping the most recently
+    used ones in an LRU keyed by the sha256 of their text. Cached documents
+    execute without validating again, once their cost is within limits.
+    """
+
+    def __init__(self, maxsize=None):
+        self.documents = LRUCache(maxsize or get_setting("DOCUMENT_CACHE_SIZE", 500))
+
+    def document_from_string(self, schema, document_string):
+        key = query_hash(document_string)
+        document = self.documents.get(key)
+        if document is None or document.schema is not schema:
+            document = self.build_document(schema, document_string)
+            self.documents.set(key, document)
+        return document
+
+    def build_document(self, schema, document_string):
+        # syntax errors are raised, the view reports them as an invalid request
+        document_ast = parse(document_string)
+        errors = validate(schema, document_ast)
+        if errors:
+            run = partial(_invalid, errors)
+        else:
+            run = partial(_execute, schema, document_ast)
+        return GraphQLDocument(
+            schema=schema,
+            document_string=document_string,
+            document_ast=document_ast,
+            execute=run,
+        )
+
+
+backend = CachedBackend()
+
+
+# Automatic persisted queries
+# https://www.apollographql.com/docs/apollo-server/performance/apq/
+
+
+class PersistedQueryError(GraphQLError):
+    def __init__(self, message, code):
+        super().__init__(message, extensions={"code": code})
+
+
+# queries registered with `manage.py register_persisted_queries`
+registered_queries = LRUCache(get_setting("DOCUMENT_CACHE_SIZE", 500))
+# hashes found nowhere, with when to look again. The first request of the protocol
+# sends the hash of a query that is mostly unknown, and any client can send
+# random ones, so they aren't looked up every time.
+missing_queries = LRUCache(get_setting("DOCUMENT_CACHE_SIZE", 500))
+
+
+def get_cache():
+    """The cache of the queries registered by clients, shared by the workers."""
+    return caches[get_setting("PERSISTED_QUERY_CACHE", "default")]
+
+
+def client_query_key(sha256):
+    return f"graphql:apq:{sha256}"
+
+
+def is_missing(sha256):
+    retry_at = missing_queries.get(sha256)
+    return retry_at is not None and retry_at > time.monotonic()
+
+
+def set_missing(sha256):
+    ttl = get_setting("PERSISTED_QUERY_MISS_TTL", 10)
+    missing_queries.set(sha256, time.monotonic() + ttl)
+
+
+def lookup_registered(sha256):
+    query = registered_queries.get(sha256)
+    if query is None and not is_missing(sha256):
+        query = (
+            PersistedQuery.objects.filter(sha256=sha256)
+            .values_list("query", flat=True)
+            .first()
+        )
+        if query is not None:
+            registered_queries.set(sha256, query)
+        else:
+            set_missing(sha256)
+    return query
+
+
+def lookup(sha256):
+    """Returns the query registered by the deployment or by a client, or None."""
+    query = registered_queries.get(sha256)
+    if query is None and not is_missing(sha256):
+        query = get_cache().get(client_query_key(sha256))
+        if query is None:
+            query = lookup_registered(sha256)
+    return query
+
+
+def register(query):
+    """Stores `query` so clients can send its hash instead. Returns the hash."""
+    sha256 = query_hash(query)
+    try:
+        PersistedQuery.objects.get_or_create(sha256=sha256, defaults={"query": query})
+    except IntegrityError:
+        # registered concurrently
+        pass
+    registered_queries.set(sha256, query)
+    missing_queries.pop(sha256)
+    metrics.known_operations.cache_clear()
+    return sha256
+
+
+def register_client_query(sha256, query):
+    """
+    Remembers a query a client sent along with its hash for PERSISTED_QUERY_TTL
+    seconds, in the cache rather than the database as any client can send them.
+    """
+    get_cache().set(
+        client_query_key(sha256), query, get_setting("PERSISTED_QUERY_TTL", 86400)
+    )
+    missing_queries.pop(sha256)
+
+
+def resolve_query(query, extensions):
+    """
+    Returns the query text of a request, given its `query` and `extensions`
+    parameters, following the automatic persisted queries protocol: clients send
+    only the sha256 of known documents and register unknown ones by sending both.
+    """
+    if isinstance(extensions, str):
+        try:
+            extensions = json.loads(extensions)
+        except ValueError:
+            extensions = None
+    persisted = (extensions or {}).get("persistedQuery")
+    # with PERSISTED_QUERIES_ONLY, only the queries registered by the deployment
+    only_registered = get_setting("PERSISTED_QUERIES_ONLY", False)
+    find = lookup_registered if only_registered else lookup
+    if not persisted:
+        if query and only_registered and not find(query_hash(query)):
+            raise PersistedQueryError(
+                "Only persisted queries are allowed", "PERSISTED_QUERY_NOT_SUPPORTED"
+            )
+        return query
+
+    sha256 = persisted.get("sha256Hash")
+    if persisted.get("version", 1) != 1 or not sha256:
+        raise PersistedQueryError(
+            "Unsupported persisted query version", "PERSISTED_QUERY_NOT_SUPPORTED"
+        )
+
+    if not query:
+        query = find(sha256)
+        if query is None:
+            raise PersistedQueryError(
+                "PersistedQueryNotFound", "PERSISTED_QUERY_NOT_FOUND"
+            )
+        return query
+
+    if query_hash(query) != sha256:
+        raise PersistedQueryError("provided sha does not match query", "BAD_REQUEST")
+    if find(sha256) is None:
+        if only_registered:
+            raise PersistedQueryError(
+                "Only persisted queries are allowed", "PERSISTED_QUERY_NOT_SUPPORTED"
+            )
+        register_client_query(sha256, query)
+    return query
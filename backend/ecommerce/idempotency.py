@@ -0,0 +1,75 @@
+import datetime
+import hashlib
+import json
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import metrics
+from .models import IdempotencyKey
+
+
+def get_setting(name, default):
+    return getattr(settings, f"IDEMPOTENCY_{name}", default)
+
+
+def request_hash(operation, arguments):
+    return hashlib.sha256(
+        json.dumps([operation, arguments], sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+def place_order_once(user, key, operation, arguments, place_order):
+    """
+    Calls `place_order` and returns the order it placed, unless `user` already
+    made the same request with the idempotency `key` less than KEY_TTL seconds
+    ago, in which case the order of that request is returned instead.
+
+    The key row is inserted in the same transaction as the order: concurrent
+    requests with the same key wait on its unique constraint until the first
+    one commits, and if placing the order fails the key is released by the
+    rollback so the request can be retried.
+    """
+    if key is None:
+        return place_order()
+
+    digest = request_hash(operation, arguments)
+    expires_at = timezone.now() + datetime.timedelta(
+        seconds=get_setting("KEY_TTL", 24 * 60 * 60)
+    )
+    with transaction.atomic():
+        record, created = IdempotencyKey.objects.get_or_create(
+            user=user,
+            key=key,
+            defaults={
+                "operation": operation,
+                "request_hash": digest,
+                "expires_at": expires_at,
+            },
+        )
+        if not created:
+            record = IdempotencyKey.objects.select_for_update().get(pk=record.pk)
+            if record.expires_at > timezone.now():
+                if record.operation != operation or record.request_hash != digest:
+                    raise Exception("Idempotency key was used for a different request")
+                metrics.IDEMPOTENT_REPLAYS.labels(operation).inc()
+                return record.order
+            record.operation = operation
+            record.request_hash = digest
+            record.expires_at = expires_at
+
+        record.order = place_order()
+        record.save()
+        return record.order
+
+
+def purge(batch_size=None):
+    """Deletes up to `batch_size` expired keys, returns how many were deleted."""
+    batch_size = batch_size or get_setting("PURGE_BATCH_SIZE", 1000)
+    expired = IdempotencyKey.objects.filter(expires_at__lte=timezone.now())
+    pks = list(expired.values_list("pk", flat=True)[:batch_size])
+    if not pks:
+        return 0
+    IdempotencyKey.objects.filter(pk__in=pks).delete()
+    return len(pks)
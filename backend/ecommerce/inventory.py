@@ -0,0 +1,310 @@
+import datetime
+import random
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from . import metrics
+from .models import CartObj, Product, StockHold, StockSlot
+
+# Transactions lock Product rows, then StockHold rows, then StockSlot rows by
+# product and slot, so restocks, holds and checkouts don't deadlock. The only
+# exception is _take reclaiming the expired holds of other users once it has
+# updated a slot, it skips the holds locked elsewhere rather than waiting.
+
+
+def get_setting(name, default):
+    return getattr(settings, f"INVENTORY_{name}", default)
+
+
+def hold_expiry():
+    return timezone.now() + datetime.timedelta(seconds=get_setting("HOLD_TTL", 15 * 60))
+
+
+def distribute(total, count):
+    """Splits `total` units over `count` slots as evenly as possible."""
+    return [total // count + (1 if i < total % count else 0) for i in range(count)]
+
+
+def rebalance(product_ids):
+    """
+    Spreads the units of `product_ids` that aren't held over their slots,
+    creating the missing ones. Called when products are created or restocked.
+    """
+    count = get_setting("SLOTS", 8)
+    with transaction.atomic():
+        stock = dict(
+            Product.objects.select_for_update()
+            .filter(pk__in=product_ids)
+            .order_by("pk")
+            .values_list("pk", "stock")
+        )
+        held = dict(
+            StockHold.objects.filter(product_id__in=stock)
+            .order_by()
+            .values_list("product_id")
+            .annotate(Sum("qty"))
+        )
+        slots = defaultdict(dict)
+        for slot in (
+            StockSlot.objects.select_for_update()
+            .filter(product_id__in=stock)
+            .order_by("product_id", "slot")
+        ):
+            slots[slot.product_id][slot.slot] = slot
+
+        to_update, to_create = [], []
+        for product_id, units in stock.items():
+            existing = slots[product_id]
+            numbers = sorted(set(range(count)) | set(existing))
+            available = max(units - held.get(product_id, 0), 0)
+            for number, share in zip(numbers, distribute(available, len(numbers))):
+                if number in existing:
+                    existing[number].available = share
+                    to_update.append(existing[number])
+                else:
+                    to_create.append(
+                        StockSlot(product_id=product_id, slot=number, available=share)
+                    )
+        StockSlot.objects.bulk_update(to_update, ["available"])
+        StockSlot.objects.bulk_create(to_create)
+
+
+def on_hand(product_ids):
+    """Units of `product_ids` that weren't sold, held or not, by product id."""
+    units = dict.fromkeys(product_ids, 0)
+    for model, field in ((StockSlot, "available"), (StockHold, "qty")):
+        for product_id, total in (
+            model.objects.filter(product_id__in=product_ids)
+            .order_by()
+            .values_list("product_id")
+            .annotate(Sum(field))
+        ):
+            units[product_id] += total
+    return units
+
+
+def restock(product_id, units):
+    """
+    Adds `units` to the units on hand of a product, negative to write some off.
+    Product.stock is set to the new total, which rebalance spreads over the
+    slots after the holds.
+    """
+    with transaction.atomic():
+        # no unit may be sold or released between counting and rebalancing
+        list(Product.objects.select_for_update().filter(pk=product_id).values("pk"))
+        list(
+            StockHold.objects.select_for_update()
+            .filter(product_id=product_id)
+            .order_by("pk")
+            .values("pk")
+        )
+        slots = list(
+            StockSlot.objects.select_for_update()
+            .filter(product_id=product_id)
+            .order_by("slot")
+            .values("pk")
+        )
+        if not slots:
+            # created with bulk_create, which doesn't send post_save
+            rebalance([product_id])
+        stock = max(on_hand([product_id])[product_id] + units, 0)
+        Product.objects.filter(pk=product_id).update(stock=stock)
+        rebalance([product_id])
+    return stock
+
+
+def _expire(holds):
+    """Deletes `holds` and returns their units to their slots."""
+    released = defaultdict(int)
+    for hold in holds:
+        released[hold.product_id, hold.slot] += hold.qty
+    StockHold.objects.filter(pk__in=[hold.pk for hold in holds]).delete()
+    _give_back(released)
+    metrics.HOLDS_EXPIRED.inc(len(holds))
+
+
+def _reclaim_expired(product_id, user):
+    """
+    Returns the units of the expired holds of other users on a product to its
+    slots. Called with slots already locked, so holds locked by another
+    transaction are skipped rather than waited on.
+    """
+    holds = list(
+        StockHold.objects.select_for_update(skip_locked=True)
+        .filter(product_id=product_id, expires_at__lte=timezone.now())
+        .exclude(user=user)
+    )
+    if holds:
+        _expire(holds)
+
+
+def _take(user, product_id, qty):
+    """
+    Takes `qty` units from the slots of a product for `user`, preferably from a
+    single random slot. Returns the [(slot, qty)] taken, or None if there
+    aren't enough units available.
+    """
+    count = get_setting("SLOTS", 8)
+    # a couple of tries, scanning every slot would mostly fail when stock is low
+    for slot in random.sample(range(count), min(count, 2)):
+        if StockSlot.objects.filter(
+            product_id=product_id, slot=slot, available__gte=qty
+        ).update(available=F("available") - qty):
+            return [(slot, qty)]
+
+    # no single slot has enough left, the units of abandoned carts come back
+    # first rather than on the next `manage.py release_expired_holds`, then
+    # take from several slots
+    _reclaim_expired(product_id, user)
+    slots = list(
+        StockSlot.objects.select_for_update()
+        .filter(product_id=product_id, available__gt=0)
+        .order_by("slot")
+    )
+    if not slots and not StockSlot.objects.filter(product_id=product_id).exists():
+        # created with bulk_create, which doesn't send post_save
+        rebalance([product_id])
+        return _take(user, product_id, qty)
+    if sum(slot.available for slot in slots) < qty:
+        return None
+    taken, remaining = [], qty
+    for slot in slots:
+        units = min(slot.available, remaining)
+        slot.available -= units
+        taken.append((slot.slot, units))
+        remaining -= units
+        if not remaining:
+            break
+    StockSlot.objects.bulk_update(slots, ["available"])
+    return taken
+
+
+def _give_back(released):
+    """Returns units to their slots, `released` maps (product_id, slot) to qty."""
+    for (product_id, slot), qty in sorted(released.items()):
+        if qty:
+            StockSlot.objects.filter(product_id=product_id, slot=slot).update(
+                available=F("available") + qty
+            )
+
+
+def _release(holds, qty):
+    """
+    Releases `qty` units of `holds`, all for the same product, newest first.
+    Returns the holds that are left.
+    """
+    released = defaultdict(int)
+    to_delete, to_update = [], []
+    holds = sorted(holds, key=lambda hold: hold.pk)
+    while qty > 0 and holds:
+        hold = holds[-1]
+        units = min(hold.qty, qty)
+        released[hold.product_id, hold.slot] += units
+        qty -= units
+        hold.qty -= units
+        if hold.qty:
+            to_update.append(hold)
+        else:
+            to_delete.append(hold.pk)
+            holds.pop()
+    StockHold.objects.filter(pk__in=to_delete).delete()
+    StockHold.objects.bulk_update(to_update, ["qty"])
+    _give_back(released)
+    return holds
+
+
+def _held(user, product_ids=None):
+    holds = StockHold.objects.select_for_update().filter(user=user)
+    if product_ids is not None:
+        holds = holds.filter(product_id__in=product_ids)
+    grouped = defaultdict(list)
+    for hold in holds.order_by("product_id", "pk"):
+        grouped[hold.product_id].append(hold)
+    return grouped
+
+
+@transaction.atomic
+def hold_cart(user):
+    """
+    Makes the holds of `user` match the quantities in their cart and extends
+    them for another HOLD_TTL seconds. Raises if a product doesn't have enough
+    units available.
+    """
+    quantities = defaultdict(int)
+    for product_id, qty in CartObj.objects.filter(user=user).values_list(
+        "product_id", "qty"
+    ):
+        quantities[product_id] += qty
+
+    held = _held(user)
+    expires_at = hold_expiry()
+    to_create = []
+    for product_id in sorted(set(quantities) | set(held)):
+        holds = held.get(product_id, [])
+        missing = quantities.get(product_id, 0) - sum(hold.qty for hold in holds)
+        if missing < 0:
+            _release(holds, -missing)
+        elif missing > 0:
+            taken = _take(user, product_id, missing)
+            if taken is None:
+                raise Exception("Stock Error")
+            to_create += [
+                StockHold(
+                    user=user,
+                    product_id=product_id,
+                    slot=slot,
+                    qty=qty,
+                    expires_at=expires_at,
+                )
+                for slot, qty in taken
+            ]
+    StockHold.objects.bulk_create(to_create)
+    StockHold.objects.filter(user=user).update(expires_at=expires_at)
+
+
+def convert(user, items):
+    """
+    Sells the (product, qty) in `items`, using the holds of `user` on them and
+    taking the units that weren't held from the slots. Raises if any product
+    doesn't have enough units available. Call inside the order's transaction.
+
+    The Product rows aren't updated, so concurrent orders of a product only
+    wait on each other when they take units from the same slot, and the catalog
+    cache is kept as the stock fields are resolved from the slots and holds.
+    """
+    items = sorted(items, key=lambda item: item[0].pk)
+    for product, qty in items:
+        if qty <= 0:
+            raise Exception("Quantity must be positive")
+
+    held = _held(user, [product.pk for product, qty in items])
+    used = []
+    for product, qty in items:
+        holds = held.get(product.pk, [])
+        missing = qty - sum(hold.qty for hold in holds)
+        if missing < 0:
+            holds = _release(holds, -missing)
+        elif missing > 0 and _take(user, product.pk, missing) is None:
+            raise Exception("Stock Error")
+        used += [hold.pk for hold in holds]
+    StockHold.objects.filter(pk__in=used).delete()
+
+
+def release_expired(batch_size=None):
+    """
+    Returns the units of up to `batch_size` expired holds to their slots.
+    Returns the number of holds released.
+    """
+    batch_size = batch_size or get_setting("SWEEP_BATCH_SIZE", 1000)
+    with transaction.atomic():
+        holds = list(
+            StockHold.objects.select_for_update(skip_locked=True)
+            .filter(expires_at__lte=timezone.now())
+            .order_by("expires_at")[:batch_size]
+        )
+        _expire(holds)
+    return len(holds)
@@ -0,0 +1,131 @@
+import asyncio
+from collections import defaultdict
+
+from django.db.models import Sum
+from promise import Promise
+from promise.dataloader import DataLoader
+
+from .asynchronous import database_sync_to_async, get_running_loop
+from .models import CartObj, Like, OrderObj, StockHold, StockSlot
+
+
+class QuerySetLoader(DataLoader):
+    """
+    Base for loaders that resolve a batch of parent ids with one query over
+    `queryset`, filtering on the `key` column (eg. "review_id").
+    """
+
+    def __init__(self, queryset, key):
+        super().__init__()
+        self.queryset = queryset
+        self.key = key
+
+    def get_rows(self, keys):
+        return self.queryset.filter(**{f"{self.key}__in": keys})
+
+    def batch_load_fn(self, keys):
+        if get_running_loop() is not None:
+            # executed by the async view, keep the query off the event loop
+            future = asyncio.ensure_future(database_sync_to_async(self.load_batch)(keys))
+            return Promise.resolve(future)
+        return Promise.resolve(self.load_batch(keys))
+
+    def load_batch(self, keys):
+        raise NotImplementedError
+
+
+class SumLoader(QuerySetLoader):
+    """Sum of the `field` column per key, using a single grouped aggregate."""
+
+    def __init__(self, queryset, key, field):
+        super().__init__(queryset, key)
+        self.field = field
+
+    def load_batch(self, keys):
+        sums = dict(
+            self.get_rows(keys)
+            .order_by()
+            .values_list(self.key)
+            .annotate(total=Sum(self.field))
+        )
+        return [sums.get(key, 0) for key in keys]
+
+
+class ExistsLoader(QuerySetLoader):
+    """Whether at least one row exists per key."""
+
+    def load_batch(self, keys):
+        found = set(self.get_rows(keys).values_list(self.key, flat=True))
+        return [key in found for key in keys]
+
+
+class ListLoader(QuerySetLoader):
+    """All rows per key, grouped in python."""
+
+    def load_batch(self, keys):
+        grouped = defaultdict(list)
+        for obj in self.get_rows(keys):
+            grouped[getattr(obj, self.key)].append(obj)
+        return [grouped[key] for key in keys]
+
+
+class Loaders:
+    """
+    Registry of the DataLoaders used while executing a single request. Loaders
+    are created lazily so a query only pays for the ones it touches.
+    """
+
+    def __init__(self, context):
+        self.context = context
+        self._loaders = {}
+
+    def get(self, name, factory):
+        loader = self._loaders.get(name)
+        if loader is None:
+            loader = self._loaders[name] = factory()
+        return loader
+
+    @property
+    def review_is_liked(self):
+        user = self.context.user
+        return self.get(
+            ("review_is_liked", user.pk),
+            lambda: ExistsLoader(Like.objects.filter(user=user), "review_id"),
+        )
+
+    @property
+    def available_stock(self):
+        return self.get(
+            "available_stock",
+            lambda: SumLoader(StockSlot.objects.all(), "product_id", "available"),
+        )
+
+    @property
+    def held_stock(self):
+        return self.get(
+            "held_stock",
+            lambda: SumLoader(StockHold.objects.all(), "product_id", "qty"),
+        )
+
+    @property
+    def order_product_objects(self):
+        return self.get(
+            "order_product_objects",
+            lambda: ListLoader(OrderObj.objects.select_related("product"), "order_id"),
+        )
+
+    @property
+    def user_cart(self):
+        return self.get(
+            "user_cart",
+            lambda: ListLoader(CartObj.objects.select_related("product"), "user_id"),
+        )
+
+
+def get_loaders(info):
+    """Returns the loaders of the current request, creating them on first use."""
+    context = info.context
+    loaders = getattr(context, "loaders", None)
+    if loaders is None:
+        loaders = context.loaders = Loaders(context)
+    return loaders
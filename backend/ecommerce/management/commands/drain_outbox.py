@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from ecommerce import outbox
+
+
+class Command(BaseCommand):
+    help = "Sends the emails waiting in the outbox, including retries of failed ones."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=None)
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep polling the outbox instead of exiting once it's empty.",
+        )
+        parser.add_argument(
+            "--interval", type=float, default=5, help="Seconds between polls."
+        )
+
+    def handle(self, *args, batch_size, loop, interval, **options):
+        while True:
+            sent = 0
+            while True:
+                claimed = outbox.deliver(batch_size)
+                if not claimed:
+                    break
+                sent += claimed
+            if sent:
+                self.stdout.write(f"Processed {sent} emails")
+            if not loop:
+                break
+            time.sleep(interval)
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from ecommerce import idempotency
+
+
+class Command(BaseCommand):
+    help = "Deletes the expired idempotency keys, in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=None)
+
+    def handle(self, *args, batch_size, **options):
+        purged = 0
+        while True:
+            deleted = idempotency.purge(batch_size)
+            if not deleted:
+                break
+            purged += deleted
+        self.stdout.write(f"Purged {purged} idempotency keys")
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from ecommerce import counters
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the review and like counters from scratch and reports any drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run", action="store_true", help="Only report, don't fix the drift."
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, dry_run, batch_size, **options):
+        drift = counters.recompute(fix=not dry_run, batch_size=batch_size)
+        for model, count in drift.items():
+            action = "found" if dry_run else "fixed"
+            self.stdout.write(f"{model}: {count} drifted rows {action}")
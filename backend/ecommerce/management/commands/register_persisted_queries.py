@@ -0,0 +1,62 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from graphene_django.settings import graphene_settings
+from graphql.language.base import parse
+from graphql.validation import validate
+
+from ecommerce import documents
+
+
+def read_documents(path):
+    """
+    Yields the documents of a .graphql/.gql file, or of a JSON manifest mapping
+    hashes to documents (or documents to ids, as written by persistgraphql).
+    """
+    with open(path) as f:
+        if not path.endswith(".json"):
+            yield f.read()
+            return
+        manifest = json.load(f)
+    for key, value in manifest.items():
+        yield value if isinstance(value, str) and "{" in value else key
+
+
+def find_files(paths):
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs[:] = [d for d in dirs if d != "node_modules"]
+            for name in sorted(files):
+                if name.endswith((".graphql", ".gql")):
+                    yield os.path.join(root, name)
+
+
+class Command(BaseCommand):
+    help = (
+        "Registers the GraphQL documents of the frontend as persisted queries, so "
+        "clients can send their sha256 instead of the full text."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "paths",
+            nargs="+",
+            help=".graphql/.gql files, directories containing them or JSON manifests.",
+        )
+
+    def handle(self, *args, paths, **options):
+        schema = graphene_settings.SCHEMA
+        count = 0
+        for path in find_files(paths):
+            for query in read_documents(path):
+                errors = validate(schema, parse(query))
+                if errors:
+                    raise CommandError(f"{path}: {errors[0].message}")
+                sha256 = documents.register(query)
+                self.stdout.write(f"{sha256} {path}")
+                count += 1
+        self.stdout.write(f"Registered {count} documents")
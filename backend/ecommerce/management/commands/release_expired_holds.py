@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from ecommerce import inventory
+
+
+class Command(BaseCommand):
+    help = "Returns the units of expired stock holds to the available stock."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=None)
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep sweeping instead of exiting once no hold has expired.",
+        )
+        parser.add_argument(
+            "--interval", type=float, default=30, help="Seconds between sweeps."
+        )
+
+    def handle(self, *args, batch_size, loop, interval, **options):
+        while True:
+            released = 0
+            while True:
+                count = inventory.release_expired(batch_size)
+                if not count:
+                    break
+                released += count
+            if released:
+                self.stdout.write(f"Released {released} expired holds")
+            if not loop:
+                break
+            time.sleep(interval)
@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from ecommerce import workload
+
+
+class Command(BaseCommand):
+    help = (
+        "Adds synthetic users, products, reviews, likes and orders for benchmarks, "
+        "eg. --products 100000 --reviews 1000000 --likes 5000000 --orders 500000."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=100)
+        parser.add_argument("--products", type=int, default=1000)
+        parser.add_argument("--reviews", type=int, default=10000)
+        parser.add_argument("--likes", type=int, default=50000)
+        parser.add_argument("--orders", type=int, default=5000)
+        parser.add_argument("--photos-per-product", type=int, default=2)
+        parser.add_argument("--items-per-order", type=int, default=3)
+        parser.add_argument(
+            "--stock", type=int, default=1000, help="Units in stock of every product."
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--seed", type=int, default=0, help="Same seed, same generated data."
+        )
+
+    def handle(self, *args, seed, **options):
+        options = {
+            name: options[name]
+            for name in (
+                "users",
+                "products",
+                "reviews",
+                "likes",
+                "orders",
+                "photos_per_product",
+                "items_per_order",
+                "stock",
+                "batch_size",
+            )
+        }
+        start = time.perf_counter()
+        created = workload.seed(random_seed=seed, **options)
+        for model, count in created.items():
+            self.stdout.write(f"{model}: {count} rows")
+        self.stdout.write(f"Seeded in {time.perf_counter() - start:.1f}s")
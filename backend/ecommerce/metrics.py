@@ -0,0 +1,184 @@
+import os
+from functools import lru_cache
+
+from graphql import GraphQLError
+from graphql.language import ast
+from graphql.language.base import parse
+from prometheus_client import (
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client.core import GaugeMetricFamily
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+RESOLVER_DURATION = Histogram(
+    "graphql_resolver_duration_seconds",
+    "Time spent resolving a field, including its SQL queries.",
+    ["field"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+RESOLVER_QUERIES = Histogram(
+    "graphql_resolver_sql_queries",
+    "Number of SQL queries issued while resolving a field.",
+    ["field"],
+    buckets=(0, 1, 2, 5, 10, 25, 50, 100),
+)
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Time spent handling a request.",
+    buckets=LATENCY_BUCKETS,
+)
+OPERATION_DURATION = Histogram(
+    "graphql_operation_duration_seconds",
+    "Time spent executing a GraphQL operation, by operation name.",
+    ["operation"],
+    buckets=LATENCY_BUCKETS,
+)
+MUTATION_ERRORS = Counter(
+    "graphql_mutation_errors",
+    "Errors raised by mutations.",
+    ["mutation"],
+)
+REQUEST_QUERIES = Histogram(
+    "db_request_queries",
+    "Number of SQL queries issued by a request.",
+    buckets=(0, 1, 2, 5, 10, 25, 50, 100, 250),
+)
+REQUEST_QUERY_DURATION = Histogram(
+    "db_request_query_duration_seconds",
+    "Time a request spent waiting for SQL queries.",
+    buckets=LATENCY_BUCKETS,
+)
+CONNECTIONS_CREATED = Counter(
+    "db_connections_created",
+    "Database connections opened, compare with http_request_duration_seconds_count "
+    "for the reuse ratio.",
+    ["alias"],
+)
+CONNECTIONS_DISCARDED = Counter(
+    "db_connections_discarded",
+    "Persistent database connections closed after failing their health check.",
+    ["alias"],
+)
+HEALTH_CHECK_DURATION = Histogram(
+    "db_health_check_duration_seconds",
+    "Time spent checking persistent connections before reusing them.",
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1),
+)
+POOL_WAIT = Histogram(
+    "db_pool_wait_seconds",
+    "Time the async view waited for a connection of the pool.",
+    buckets=(0.0001, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5),
+)
+POOL_TIMEOUTS = Counter(
+    "db_pool_timeouts",
+    "Requests of the async view that timed out waiting for a connection.",
+)
+REPLICA_FAILURES = Counter(
+    "db_replica_failures",
+    "Read replicas skipped after failing to connect.",
+    ["alias"],
+)
+CATALOG_CACHE_REQUESTS = Counter(
+    "catalog_cache_requests",
+    "Catalog cache lookups by result (hit, stale or miss).",
+    ["result"],
+)
+HOLDS_EXPIRED = Counter(
+    "inventory_holds_expired",
+    "Stock holds released by the sweeper after expiring.",
+)
+IDEMPOTENT_REPLAYS = Counter(
+    "idempotent_replays",
+    "Retried mutations answered from their idempotency key, by mutation.",
+    ["operation"],
+)
+
+
+def operation_names(query):
+    try:
+        document = parse(query)
+    except GraphQLError:
+        return set()
+    return {
+        definition.name.value
+        for definition in document.definitions
+        if isinstance(definition, ast.OperationDefinition) and definition.name
+    }
+
+
+@lru_cache(maxsize=None)
+def known_operations():
+    """
+    Names of the operations of the frontend, see ecommerce/operations, and of
+    the persisted queries registered by the deployment, read once per process.
+    """
+    from .models import PersistedQuery
+    from .workload import operations
+
+    queries = [
+        *operations().values(),
+        *PersistedQuery.objects.values_list("query", flat=True),
+    ]
+    return frozenset(name for query in queries for name in operation_names(query))
+
+
+def operation_label(operation_name):
+    # names come from clients, only known ones get their own series
+    if not operation_name:
+        return "anonymous"
+    if operation_name not in known_operations():
+        return "other"
+    return operation_name
+
+
+def observe_operation(schema, operation_name, result, duration):
+    OPERATION_DURATION.labels(operation_label(operation_name)).observe(duration)
+    if result is None or not result.errors:
+        return
+    mutation_type = schema.get_mutation_type()
+    for error in result.errors:
+        path = getattr(error, "path", None)
+        field = path and mutation_type.fields.get(path[0])
+        if field is not None:
+            MUTATION_ERRORS.labels(str(field.type)).inc()
+
+
+class OutboxCollector:
+    """Emails waiting in the outbox, counted when scraped."""
+
+    def collect(self):
+        from django.db.models import Count
+
+        from .models import OutboxEmail
+
+        gauge = GaugeMetricFamily(
+            "outbox_emails", "Emails in the outbox, by status.", labels=["status"]
+        )
+        counts = dict(
+            OutboxEmail.objects.order_by()
+            .values_list("status")
+            .annotate(count=Count("pk"))
+        )
+        for status in OutboxEmail.Status.values:
+            gauge.add_metric([status], counts.get(status, 0))
+        yield gauge
+
+
+def export():
+    """
+    Returns the metrics in the Prometheus text format. When the gunicorn workers
+    share PROMETHEUS_MULTIPROC_DIR, the metrics of all of them are aggregated.
+    """
+    registry = CollectorRegistry()
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry.register(REGISTRY)
+    registry.register(OutboxCollector())
+    return generate_latest(registry)
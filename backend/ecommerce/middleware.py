@@ -0,0 +1,162 @@
+import asyncio
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.handlers.base import BaseHandler
+from django.core.handlers.exception import convert_exception_to_response
+from django.utils.module_loading import import_string
+
+from . import metrics
+
+# queries of the current request, a context variable so the queries issued from
+# worker threads by the async view are counted too
+request_queries = ContextVar("request_queries", default=None)
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+
+def count_queries(execute, sql, params, many, context):
+    """Execute wrapper installed on every connection, see signals.py."""
+    counter = request_queries.get()
+    if counter is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        counter.count += 1
+        counter.duration += time.perf_counter() - start
+
+
+class MetricsMiddleware:
+    """Records the latency and SQL queries of every request."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        start = time.perf_counter()
+        counter = QueryCounter()
+        token = request_queries.set(counter)
+        try:
+            return self.get_response(request)
+        finally:
+            request_queries.reset(token)
+            self.observe(start, counter)
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        counter = QueryCounter()
+        token = request_queries.set(counter)
+        try:
+            return await self.get_response(request)
+        finally:
+            request_queries.reset(token)
+            self.observe(start, counter)
+
+    def observe(self, start, counter):
+        metrics.REQUEST_DURATION.observe(time.perf_counter() - start)
+        metrics.REQUEST_QUERIES.observe(counter.count)
+        metrics.REQUEST_QUERY_DURATION.observe(counter.duration)
+
+
+class SiteMiddleware:
+    """
+    Runs SITE_MIDDLEWARE (sessions, CSRF, messages...) for every path but the
+    API_PATHS. API requests authenticate with a JWT, so they skip that chain and
+    never read or write a session.
+
+    The chain is built like Django builds MIDDLEWARE, and its process_view,
+    process_template_response and process_exception hooks run for site paths.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.api_paths = tuple(settings.API_PATHS)
+        is_async = asyncio.iscoroutinefunction(get_response)
+        if is_async:
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+        self.view_middleware = []
+        self.template_response_middleware = []
+        self.exception_middleware = []
+        adapt = BaseHandler().adapt_method_mode
+        handler, handler_is_async = get_response, is_async
+        for middleware_path in reversed(settings.SITE_MIDDLEWARE):
+            middleware = import_string(middleware_path)
+            if not handler_is_async and getattr(middleware, "sync_capable", True):
+                middleware_is_async = False
+            else:
+                middleware_is_async = getattr(middleware, "async_capable", False)
+            try:
+                handler = adapt(middleware_is_async, handler, handler_is_async)
+                mw_instance = middleware(handler)
+            except MiddlewareNotUsed:
+                continue
+
+            # hooks are called by the synchronous methods below
+            if hasattr(mw_instance, "process_view"):
+                self.view_middleware.insert(0, adapt(False, mw_instance.process_view))
+            if hasattr(mw_instance, "process_template_response"):
+                self.template_response_middleware.append(
+                    adapt(False, mw_instance.process_template_response)
+                )
+            if hasattr(mw_instance, "process_exception"):
+                self.exception_middleware.append(
+                    adapt(False, mw_instance.process_exception)
+                )
+            handler = convert_exception_to_response(mw_instance)
+            handler_is_async = middleware_is_async
+        self.site_chain = adapt(is_async, handler, handler_is_async)
+
+    def is_api(self, request):
+        return request.path_info.startswith(self.api_paths)
+
+    def __call__(self, request):
+        if self.is_api(request):
+            # as AuthenticationMiddleware without a session, the view then
+            # authenticates the JWT, see auth.authenticate_request
+            request.user = AnonymousUser()
+            return self.get_response(request)
+        return self.site_chain(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if self.is_api(request):
+            return None
+        for process_view in self.view_middleware:
+            response = process_view(request, view_func, view_args, view_kwargs)
+            if response:
+                return response
+        return None
+
+    def process_template_response(self, request, response):
+        if not self.is_api(request):
+            for process_template_response in self.template_response_middleware:
+                response = process_template_response(request, response)
+        return response
+
+    def process_exception(self, request, exception):
+        if self.is_api(request):
+            return None
+        for process_exception in self.exception_middleware:
+            response = process_exception(request, exception)
+            if response:
+                return response
+        return None
@@ -0,0 +1,47 @@
+# Generated by Django 3.1.4 on 2026-10-18 08:33
+
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'CREATE INDEX ecommerce_product_search_vector_gin '
+        'ON ecommerce_product USING gin (search_vector)'
+    )
+    schema_editor.execute(
+        'CREATE INDEX ecommerce_product_name_trgm '
+        'ON ecommerce_product USING gin (name gin_trgm_ops)'
+    )
+    schema_editor.execute(
+        "UPDATE ecommerce_product SET search_vector = "
+        "setweight(to_tsvector(COALESCE(name, '')), 'A') || "
+        "setweight(to_tsvector(COALESCE(description, '')), 'B')"
+    )
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS ecommerce_product_search_vector_gin')
+    schema_editor.execute('DROP INDEX IF EXISTS ecommerce_product_name_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce', '0016_merge_20210116_1102'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.1.4 on 2026-10-18 08:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce', '0017_product_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', 'order_timestamp', 'id'], name='ecommerce_o_user_id_3d942d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['price', 'id'], name='ecommerce_p_price_c5041e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['name', 'id'], name='ecommerce_p_name_165000_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['kind', 'id'], name='ecommerce_p_kind_a9823b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['product', 'created_on', 'id'], name='ecommerce_r_product_26ebbf_idx'),
+        ),
+    ]
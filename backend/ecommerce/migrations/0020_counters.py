@@ -0,0 +1,51 @@
+# Generated by Django 3.1.4 on 2026-10-18 08:38
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Product = apps.get_model('ecommerce', 'Product')
+    Review = apps.get_model('ecommerce', 'Review')
+    Like = apps.get_model('ecommerce', 'Like')
+
+    reviews = Review.objects.filter(product=OuterRef('pk')).order_by().values('product')
+    Product.objects.update(
+        review_count=Coalesce(Subquery(reviews.annotate(c=Count('pk')).values('c')), 0),
+        rating_sum=Coalesce(Subquery(reviews.annotate(s=Sum('rating')).values('s')), 0),
+    )
+    likes = Like.objects.filter(review=OuterRef('pk')).order_by().values('review')
+    Review.objects.update(
+        likes_count=Coalesce(Subquery(likes.annotate(c=Count('pk')).values('c')), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce', '0019_outboxemail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='review_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='review',
+            name='likes_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['review_count', 'id'], name='ecommerce_p_review__42f5f2_idx'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 3.1.4 on 2026-10-18 09:04
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_slots(apps, schema_editor):
+    Product = apps.get_model('ecommerce', 'Product')
+    StockSlot = apps.get_model('ecommerce', 'StockSlot')
+    count = getattr(settings, 'INVENTORY_SLOTS', 8)
+
+    slots = []
+    for pk, stock in Product.objects.values_list('pk', 'stock').iterator():
+        stock = max(stock, 0)
+        for i in range(count):
+            available = stock // count + (1 if i < stock % count else 0)
+            slots.append(StockSlot(product_id=pk, slot=i, available=available))
+    StockSlot.objects.bulk_create(slots, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce', '0022_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockHold',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slot', models.IntegerField()),
+                ('qty', models.IntegerField()),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='ecommerce.product')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StockSlot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slot', models.IntegerField()),
+                ('available', models.IntegerField(default=0)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_slots', to='ecommerce.product')),
+            ],
+            options={
+                'unique_together': {('product', 'slot')},
+            },
+        ),
+        migrations.AddIndex(
+            model_name='stockhold',
+            index=models.Index(fields=['user', 'product'], name='ecommerce_s_user_id_244080_idx'),
+        ),
+        migrations.RunPython(fill_slots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 3.1.4 on 2026-10-18 09:20
+
+from django.conf import settings
+from django.db import migrations, models
+import pytz
+
+
+def fill_slots(apps, schema_editor):
+    Appointment = apps.get_model('ecommerce', 'Appointment')
+    tz = pytz.timezone(getattr(settings, 'APPOINTMENT_TIME_ZONE', 'Asia/Kolkata'))
+
+    # days booked twice by concurrent requests keep both, in different slots
+    slots = {}
+    appointments = list(Appointment.objects.order_by('timestamp', 'pk'))
+    for appointment in appointments:
+        appointment.date = appointment.timestamp.astimezone(tz).date()
+        appointment.slot = slots.get(appointment.date, 0)
+        slots[appointment.date] = appointment.slot + 1
+    Appointment.objects.bulk_update(appointments, ['date', 'slot'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce', '0023_stock_holds'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='date',
+            field=models.DateField(null=True),
+        ),
+        migrations.AddField(
+            model_name='appointment',
+            name='slot',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(fill_slots, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='appointment',
+            name='date',
+            field=models.DateField(),
+        ),
+        migrations.AddConstraint(
+            model_name='appointment',
+            constraint=models.UniqueConstraint(fields=('date', 'slot'), name='unique_appointment_slot'),
+        ),
+    ]
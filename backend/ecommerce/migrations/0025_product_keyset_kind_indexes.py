@@ -0,0 +1,25 @@
+# Generated by Django 3.1.4 on 2026-10-18 10:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce', '0024_appointment_slots'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['kind', 'price', 'id'], name='ecommerce_p_kind_d3f402_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['kind', 'name', 'id'], name='ecommerce_p_kind_f62701_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['kind', 'review_count', 'id'], name='ecommerce_p_kind_617928_idx'),
+        ),
+    ]
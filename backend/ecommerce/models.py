@@ -1,4 +1,6 @@
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin
 from django.core.validators import (
     MaxLengthValidator,
@@ -17,6 +19,8 @@ class Product(models.Model):
     name = models.CharField(max_length=255)
     price = models.IntegerField()
     discount = models.IntegerField(default=0)
+    # units on hand when the product was last restocked, sales and holds are
+    # counted on its StockSlot and StockHold rows, see ecommerce.inventory
     stock = models.IntegerField(default=0)
 
     class Kind(models.TextChoices):
@@ -25,10 +29,41 @@ class Product(models.Model):
 
     kind = models.CharField(max_length=50, choices=Kind.choices)
     description = models.TextField()
+    # maintained by ecommerce.search, indexed with GIN on postgres
+    search_vector = SearchVectorField(null=True, editable=False)
+    # kept in sync by the review mutations, see `manage.py recompute_counters`
+    review_count = models.IntegerField(default=0, editable=False)
+    rating_sum = models.IntegerField(default=0, editable=False)
+
+    class Meta:
+        # keyset pagination orders by (key, id) for every ProductOrdering, with
+        # or without the kind filter
+        indexes = [
+            models.Index(fields=["price", "id"]),
+            models.Index(fields=["name", "id"]),
+            models.Index(fields=["review_count", "id"]),
+            models.Index(fields=["kind", "id"]),
+            models.Index(fields=["kind", "price", "id"]),
+            models.Index(fields=["kind", "name", "id"]),
+            models.Index(fields=["kind", "review_count", "id"]),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        product = super().from_db(db, field_names, values)
+        # saving another stock restocks the product, see signals.product_restocked
+        product._loaded_stock = product.__dict__.get("stock")
+        return product
 
     def __str__(self):
         return self.name
 
+    @property
+    def rating(self):
+        if not self.review_count:
+            return None
+        return self.rating_sum / self.review_count
+
 
 class Photo(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="photos")
@@ -101,6 +136,9 @@ class Order(models.Model):
         max_length=3, choices=DeliveryStatus.choices, default=DeliveryStatus.OR
     )
 
+    class Meta:
+        indexes = [models.Index(fields=["user", "order_timestamp", "id"])]
+
 
 class OrderObj(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE)
@@ -120,10 +158,12 @@ class Review(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="reviews")
     rating = models.IntegerField(validators=[MinValueValidator(1), MaxValueValidator(5)])
     text = models.CharField(max_length=255, null=True)
-    created_on=models.DateField(auto_now_add=True)
+    created_on = models.DateField(auto_now_add=True)
+    likes_count = models.IntegerField(default=0, editable=False)
 
     class Meta:
         unique_together = ("user", "product")
+        indexes = [models.Index(fields=["product", "created_on", "id"])]
 
 
 class Like(models.Model):
@@ -137,3 +177,109 @@ class Like(models.Model):
 class Appointment(models.Model):
     timestamp = models.DateTimeField()
     user = models.ForeignKey(User, on_delete=models.DO_NOTHING)
+    # day of the timestamp in APPOINTMENT_TIME_ZONE, see ecommerce.appointments
+    date = models.DateField()
+    slot = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["date", "slot"], name="unique_appointment_slot"
+            )
+        ]
+
+
+# Registered GraphQL documents, see ecommerce.documents
+
+
+class PersistedQuery(models.Model):
+    sha256 = models.CharField(max_length=64, unique=True)
+    query = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.sha256
+
+
+# Stock reservations, see ecommerce.inventory
+
+
+class StockSlot(models.Model):
+    """
+    A share of the units of a product that nobody holds. Holds take units from
+    a random slot so concurrent buyers of a popular product don't all wait on
+    the same row.
+    """
+
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name="stock_slots"
+    )
+    slot = models.IntegerField()
+    available = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ("product", "slot")
+
+
+class StockHold(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    # the slot the units were taken from, and go back to when the hold expires
+    slot = models.IntegerField()
+    qty = models.IntegerField()
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["user", "product"])]
+
+
+# Retried mutations, see ecommerce.idempotency
+
+
+class IdempotencyKey(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    key = models.CharField(max_length=255)
+    operation = models.CharField(max_length=64)
+    # sha256 of the arguments, a key can't be reused for a different request
+    request_hash = models.CharField(max_length=64)
+    # the response of the first request
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "key"], name="unique_idempotency_key")
+        ]
+
+    def __str__(self):
+        return f"{self.operation} {self.key}"
+
+
+# Outgoing mail, delivered by ecommerce.outbox
+
+
+class OutboxEmail(models.Model):
+    class Status(models.TextChoices):
+        PENDING = "pending"
+        SENT = "sent"
+        FAILED = "failed"
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=255)
+    recipients = models.JSONField()
+    status = models.CharField(
+        max_length=10, choices=Status.choices, default=Status.PENDING
+    )
+    attempts = models.IntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "next_attempt_at"])]
+
+    def __str__(self):
+        return f"{self.subject} ({self.status})"
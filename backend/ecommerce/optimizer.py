@@ -0,0 +1,205 @@
+from django.db.models import Prefetch, prefetch_related_objects
+from graphene.utils.str_converters import to_camel_case
+from graphene_django import DjangoObjectType
+from graphql.language import ast
+from graphql.type.definition import get_named_type
+
+
+class Hint:
+    """
+    Tells the optimizer how to load a field that is not a plain model field, eg.
+    a custom resolver reading a reverse relation under another name.
+
+    `prefetch` is the relation accessor to prefetch when the field is selected and
+    `only` lists the model columns its resolver reads.
+    """
+
+    def __init__(self, prefetch=None, only=()):
+        self.prefetch = prefetch
+        self.only = tuple(only)
+
+
+class Plan:
+    def __init__(self):
+        self.only = set()
+        self.select = []
+        self.prefetch = []
+
+    def apply(self, queryset):
+        if self.select:
+            queryset = queryset.select_related(*self.select)
+        if self.prefetch:
+            queryset = queryset.prefetch_related(*self.prefetch)
+        if self.only is not None:
+            queryset = queryset.only(*self.only)
+        return queryset
+
+    @property
+    def lookups(self):
+        return self.select + self.prefetch
+
+
+def optimize(queryset, info, path=(), only=()):
+    """
+    Applies select_related, prefetch_related and only() to `queryset` based on
+    the fields selected under the current GraphQL field.
+
+    `path` names the fields between the current field and the objects of the
+    queryset, eg. ("edges", "node") for a connection, and `only` lists extra
+    columns the caller reads from the objects.
+    """
+    plan = get_plan(queryset.model, info, path)
+    if plan is None:
+        return queryset
+    if plan.only is not None:
+        plan.only.update(only)
+    return plan.apply(queryset)
+
+
+def optimize_instance(instance, info, path=()):
+    """Prefetches the selected relations on an already loaded model instance."""
+    plan = get_plan(type(instance), info, path)
+    if plan and plan.lookups:
+        prefetch_related_objects([instance], *plan.lookups)
+    return instance
+
+
+def prefetched(instance, accessor):
+    """
+    Returns the rows prefetched for the reverse foreign key or many to many
+    `accessor` of `instance`, or None if they weren't prefetched.
+    """
+    cache = getattr(instance, "_prefetched_objects_cache", {})
+    if accessor in cache:
+        return list(cache[accessor])
+    return None
+
+
+def get_plan(model, info, path=()):
+    object_type = get_named_type(info.return_type)
+    selections = _collect(info.field_asts, info)
+    for name in path:
+        field = object_type.fields[name]
+        object_type = get_named_type(field.type)
+        selections = _collect(selections.get(name, []), info)
+    return _plan(model, object_type, selections, info)
+
+
+def _collect(field_asts, info):
+    """Groups the sub-fields selected under `field_asts` by field name."""
+    selected = {}
+
+    def visit(selection_set):
+        if selection_set is None:
+            return
+        for selection in selection_set.selections:
+            if isinstance(selection, ast.Field):
+                selected.setdefault(selection.name.value, []).append(selection)
+            elif isinstance(selection, ast.FragmentSpread):
+                visit(info.fragments[selection.name.value].selection_set)
+            elif isinstance(selection, ast.InlineFragment):
+                visit(selection.selection_set)
+
+    for field_ast in field_asts:
+        visit(field_ast.selection_set)
+    return selected
+
+
+def _model_fields(model):
+    fields = {}
+    for field in model._meta.get_fields():
+        if field.auto_created and not field.concrete:
+            fields[field.get_accessor_name()] = field
+        else:
+            fields[field.name] = field
+    return fields
+
+
+def _plan(model, object_type, selections, info, prefix=""):
+    graphene_type = getattr(object_type, "graphene_type", None)
+    if not (
+        graphene_type
+        and issubclass(graphene_type, DjangoObjectType)
+        and issubclass(model, graphene_type._meta.model)
+    ):
+        return None
+
+    plan = Plan()
+    plan.only.add(prefix + model._meta.pk.attname)
+    # foreign keys are cheap and often read by resolvers to compare owners
+    plan.only.update(
+        prefix + field.attname
+        for field in model._meta.concrete_fields
+        if field.is_relation
+    )
+
+    names = {to_camel_case(name): name for name in graphene_type._meta.fields}
+    model_fields = _model_fields(model)
+    hints = getattr(graphene_type, "optimizer_hints", {})
+
+    for gql_name, field_asts in selections.items():
+        name = names.get(gql_name)
+        if name is None:
+            continue
+        gql_field = object_type.fields[gql_name]
+        sub_selections = _collect(field_asts, info)
+        hint = hints.get(name)
+
+        if hint is not None:
+            if plan.only is not None:
+                plan.only.update(prefix + column for column in hint.only)
+            if hint.prefetch:
+                field = model_fields[hint.prefetch]
+                _add_prefetch(
+                    plan, field, hint.prefetch, gql_field, sub_selections, info, prefix
+                )
+            continue
+
+        field = model_fields.get(name)
+        if field is None:
+            # custom resolver without a hint, we can't tell which columns it reads
+            plan.only = None
+            continue
+
+        if not field.is_relation:
+            if plan.only is not None:
+                plan.only.add(prefix + field.attname)
+        elif field.concrete and (field.many_to_one or field.one_to_one):
+            _add_select(plan, field, gql_field, sub_selections, info, prefix)
+        else:
+            _add_prefetch(plan, field, name, gql_field, sub_selections, info, prefix)
+
+    return plan
+
+
+def _add_select(plan, field, gql_field, selections, info, prefix):
+    path = prefix + field.name
+    plan.select.append(path)
+    nested = _plan(
+        field.related_model, get_named_type(gql_field.type), selections, info, path + "__"
+    )
+    if nested is None:
+        if plan.only is not None:
+            plan.only.update(
+                f"{path}__{related.attname}"
+                for related in field.related_model._meta.concrete_fields
+            )
+        return
+    plan.select.extend(nested.select)
+    plan.prefetch.extend(nested.prefetch)
+    if plan.only is None or nested.only is None:
+        plan.only = None
+    else:
+        plan.only.update(nested.only)
+
+
+def _add_prefetch(plan, field, accessor, gql_field, selections, info, prefix):
+    related_model = field.related_model
+    queryset = related_model._default_manager.all()
+    nested = _plan(related_model, get_named_type(gql_field.type), selections, info)
+    if nested is not None:
+        if nested.only is not None and field.one_to_many:
+            # the reverse foreign key is needed to attach rows to their parent
+            nested.only.add(field.field.attname)
+        queryset = nested.apply(queryset)
+    plan.prefetch.append(Prefetch(prefix + accessor, queryset=queryset))
@@ -0,0 +1,205 @@
+import datetime
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connections, transaction
+from django.db.models import Min
+from django.utils import timezone
+
+from .models import OutboxEmail
+
+logger = logging.getLogger(__name__)
+
+# how long a claimed message is hidden from other workers while being sent
+CLAIM_TIMEOUT = datetime.timedelta(minutes=5)
+
+
+def get_setting(name, default):
+    return getattr(settings, f"OUTBOX_{name}", default)
+
+
+def send_mail(subject, message, from_email, recipient_list):
+    """
+    Queues an email in the outbox, same arguments as django's send_mail. The row
+    is part of the current transaction so the email only goes out if it commits.
+    """
+    email = OutboxEmail.objects.create(
+        subject=subject,
+        body=message,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        recipients=list(recipient_list),
+    )
+    transaction.on_commit(worker.kick)
+    return email
+
+
+def mail_admins(subject, message):
+    """Queues an email to settings.ADMINS, like django's mail_admins."""
+    if not settings.ADMINS:
+        return None
+    return send_mail(
+        f"{settings.EMAIL_SUBJECT_PREFIX}{subject}",
+        message,
+        settings.SERVER_EMAIL,
+        [email for _, email in settings.ADMINS],
+    )
+
+
+def retry_delay(attempts):
+    """Exponential backoff: base delay, doubled for every failed attempt."""
+    base = get_setting("RETRY_DELAY", 30)
+    return datetime.timedelta(seconds=base * 2 ** (attempts - 1))
+
+
+def claim(batch_size):
+    """
+    Takes up to `batch_size` due emails, pushing their next attempt into the
+    future so concurrent workers don't pick them up too.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        emails = list(
+            OutboxEmail.objects.select_for_update(skip_locked=True)
+            .filter(status=OutboxEmail.Status.PENDING, next_attempt_at__lte=now)
+            .order_by("next_attempt_at", "id")[:batch_size]
+        )
+        OutboxEmail.objects.filter(pk__in=[email.pk for email in emails]).update(
+            next_attempt_at=now + CLAIM_TIMEOUT
+        )
+    return emails
+
+
+def record_failure(email, error, max_attempts):
+    email.last_error = str(error)
+    if email.attempts >= max_attempts:
+        email.status = OutboxEmail.Status.FAILED
+    else:
+        email.next_attempt_at = timezone.now() + retry_delay(email.attempts)
+
+
+def deliver(batch_size=None):
+    """
+    Sends one batch of due emails over a single connection and records the
+    outcome of each. Returns the number of emails claimed.
+    """
+    emails = claim(batch_size or get_setting("BATCH_SIZE", 50))
+    if not emails:
+        return 0
+
+    max_attempts = get_setting("MAX_ATTEMPTS", 5)
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as e:
+        logger.warning("Opening the outbox mail connection failed: %s", e)
+        for email in emails:
+            email.attempts += 1
+            record_failure(email, e, max_attempts)
+    else:
+        for email in emails:
+            message = EmailMessage(
+                email.subject,
+                email.body,
+                email.from_email,
+                email.recipients,
+                connection=connection,
+            )
+            email.attempts += 1
+            try:
+                connection.send_messages([message])
+            except Exception as e:
+                logger.warning("Sending outbox email %s failed: %s", email.pk, e)
+                record_failure(email, e, max_attempts)
+            else:
+                email.status = OutboxEmail.Status.SENT
+                email.sent_at = timezone.now()
+    finally:
+        connection.close()
+
+    OutboxEmail.objects.bulk_update(
+        emails, ["status", "attempts", "next_attempt_at", "last_error", "sent_at"]
+    )
+    return len(emails)
+
+
+def drain():
+    """Delivers batches until no email is due."""
+    while deliver():
+        pass
+
+
+def next_attempt():
+    """When the next pending email is due, or None."""
+    return OutboxEmail.objects.filter(status=OutboxEmail.Status.PENDING).aggregate(
+        at=Min("next_attempt_at")
+    )["at"]
+
+
+class Worker:
+    """
+    Bounded pool delivering the outbox in the background of the web process.
+    Kicks coming in while every thread is busy only flag the running drains to
+    go around once more, so the number of threads never grows with traffic.
+    Emails that failed are retried by a timer kicking the pool when they're due.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pool = None
+        self._running = 0
+        self._dirty = False
+        self._timer = None
+        self._timer_at = None
+
+    def kick(self):
+        if not get_setting("IN_PROCESS", True):
+            return
+        size = get_setting("WORKERS", 2)
+        with self._lock:
+            self._dirty = True
+            if self._running >= size:
+                return
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(
+                    max_workers=size, thread_name_prefix="outbox"
+                )
+            self._running += 1
+        self._pool.submit(self._run)
+
+    def _run(self):
+        try:
+            while True:
+                with self._lock:
+                    if not self._dirty:
+                        self._running -= 1
+                        return
+                    self._dirty = False
+                try:
+                    drain()
+                    self.schedule_retry()
+                except Exception:
+                    logger.exception("Outbox worker crashed")
+        finally:
+            connections.close_all()
+
+    def schedule_retry(self):
+        """Kicks the pool again when the next pending email is due."""
+        at = next_attempt()
+        if at is None:
+            return
+        delay = max((at - timezone.now()).total_seconds(), 0)
+        with self._lock:
+            if self._timer is not None and self._timer.is_alive():
+                if self._timer_at <= at:
+                    return
+                self._timer.cancel()
+            self._timer = threading.Timer(delay, self.kick)
+            self._timer.daemon = True
+            self._timer_at = at
+            self._timer.start()
+
+
+worker = Worker()
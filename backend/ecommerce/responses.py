@@ -0,0 +1,108 @@
+import hashlib
+import json
+import re
+import zlib
+from functools import lru_cache
+
+from django.conf import settings
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.module_loading import import_string
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+GZIP_LEVEL = 6
+# 11, the default, is too slow to run on every response
+BROTLI_QUALITY = 5
+
+
+def get_setting(name, default):
+    return getattr(settings, f"GRAPHQL_{name}", default)
+
+
+def dumps(obj):
+    """Encodes `obj` as compact JSON bytes, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":")).encode()
+
+
+@lru_cache(maxsize=None)
+def _import(path):
+    return import_string(path)
+
+
+def get_encoder():
+    return _import(get_setting("JSON_ENCODER", "ecommerce.responses.dumps"))
+
+
+class GzipCompressor:
+    def __init__(self):
+        self.compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def process(self, data):
+        return self.compressor.compress(data)
+
+    def finish(self):
+        return self.compressor.flush()
+
+
+def get_compressor(encoding):
+    if encoding == "br":
+        return brotli.Compressor(quality=BROTLI_QUALITY)
+    return GzipCompressor()
+
+
+def compress(content, encoding):
+    compressor = get_compressor(encoding)
+    return compressor.process(content) + compressor.finish()
+
+
+def accepted_encoding(request):
+    """The preferred encoding accepted by the client: "br", "gzip" or None."""
+    accepted = set()
+    for part in request.META.get("HTTP_ACCEPT_ENCODING", "").split(","):
+        name, _, params = part.partition(";")
+        q = re.search(r"q=([0-9.]+)", params)
+        if q is None or float(q.group(1)) > 0:
+            accepted.add(name.strip().lower())
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def finalize(request, response):
+    """
+    Adds an ETag to the JSON response of a GET request, answering 304 when it
+    matches If-None-Match, and compresses bodies of at least COMPRESS_MIN_SIZE
+    bytes with brotli or gzip as negotiated.
+    """
+    content = response.content
+    patch_vary_headers(response, ["Accept-Encoding"])
+
+    if request.method == "GET" and response.status_code == 200:
+        # weak, the compressed representations have the same one
+        response["ETag"] = f'W/"{hashlib.blake2b(content, digest_size=16).hexdigest()}"'
+        conditional = get_conditional_response(
+            request, etag=response["ETag"], response=response
+        )
+        if conditional is not response:
+            return conditional
+
+    encoding = None
+    if len(content) >= get_setting("COMPRESS_MIN_SIZE", 1024):
+        encoding = accepted_encoding(request)
+
+    if encoding:
+        response.content = compress(content, encoding)
+        response["Content-Encoding"] = encoding
+    return response
@@ -0,0 +1,140 @@
+import itertools
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections, transaction
+
+from . import metrics
+
+# signed cookie pinning the reads of a client to the primary, see pin_to_primary
+PIN_COOKIE = "read_primary"
+
+# routing of the current request, None outside of query operations. A mutable
+# object so the writes of worker threads, which get a copy of the context, are
+# seen by the rest of the request.
+_routing = ContextVar("database_routing", default=None)
+
+_next_replica = itertools.count()
+# alias -> time.monotonic() until which the replica is skipped
+_unavailable = {}
+
+
+def get_setting(name, default):
+    return getattr(settings, f"DATABASE_{name}", default)
+
+
+class Routing:
+    def __init__(self):
+        self.alias = None
+        self.written = False
+
+
+def is_available(alias):
+    connection = connections[alias]
+    if connection.connection is not None:
+        # checked by check_connections before the request
+        return True
+    try:
+        connection.ensure_connection()
+    except DatabaseError:
+        _unavailable[alias] = time.monotonic() + get_setting("REPLICA_RETRY_AFTER", 30)
+        metrics.REPLICA_FAILURES.labels(alias).inc()
+        return False
+    return True
+
+
+def choose_replica():
+    """Returns the next available replica, round-robin, or None if all are down."""
+    replicas = get_setting("REPLICAS", [])
+    start = next(_next_replica)
+    now = time.monotonic()
+    for i in range(len(replicas)):
+        alias = replicas[(start + i) % len(replicas)]
+        if _unavailable.get(alias, 0) > now:
+            continue
+        if is_available(alias):
+            return alias
+    return None
+
+
+def pin_to_primary(request):
+    """
+    Keeps the reads of the client sending `request` on the primary for
+    READ_YOUR_WRITES_WINDOW seconds after the current transaction commits, so
+    they see their own changes even when the replicas lag behind. The pin is a
+    signed cookie added to the response by pin_response, so it holds whichever
+    worker process serves the next request.
+    """
+    if get_setting("READ_YOUR_WRITES_WINDOW", 0) and get_setting("REPLICAS", []):
+        transaction.on_commit(lambda: setattr(request, "pinned_to_primary", True))
+
+
+def pin_response(request, response):
+    if getattr(request, "pinned_to_primary", False):
+        response.set_signed_cookie(
+            PIN_COOKIE,
+            "1",
+            salt=PIN_COOKIE,
+            max_age=get_setting("READ_YOUR_WRITES_WINDOW", 0),
+            secure=request.is_secure(),
+            httponly=True,
+            samesite="Lax",
+        )
+
+
+def is_pinned(request):
+    window = get_setting("READ_YOUR_WRITES_WINDOW", 0)
+    if not window:
+        return False
+    # the signature carries the time it was set at, older pins are ignored
+    pin = request.get_signed_cookie(PIN_COOKIE, None, salt=PIN_COOKIE, max_age=window)
+    return pin is not None
+
+
+@contextmanager
+def route_request(request, operation_type):
+    """
+    Sends the reads issued inside the block to a replica when executing a
+    query operation, unless the user was pinned to the primary by a recent
+    write.
+    """
+    if operation_type != "query" or not get_setting("REPLICAS", []) or is_pinned(request):
+        yield
+        return
+    token = _routing.set(Routing())
+    try:
+        yield
+    finally:
+        _routing.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Routes the reads of query operations to a replica, one per request, and
+    everything else to the primary. Once a request writes, its later reads go to
+    the primary too.
+    """
+
+    def db_for_read(self, model, **hints):
+        routing = _routing.get()
+        if routing is None or routing.written:
+            return DEFAULT_DB_ALIAS
+        if routing.alias is None:
+            routing.alias = choose_replica() or DEFAULT_DB_ALIAS
+        return routing.alias
+
+    def db_for_write(self, model, **hints):
+        routing = _routing.get()
+        if routing is not None:
+            routing.written = True
+        # explicitly, instances read from a replica would be saved there otherwise
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in get_setting("REPLICAS", [])
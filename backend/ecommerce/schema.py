@@ -1,15 +1,28 @@
 import datetime
 
-from django.db.models import Q
-from django.core.mail import send_mail, mail_admins
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
 import graphene
 from graphene_django import DjangoObjectType
 from graphql_jwt.decorators import login_required
-import math
-import pytz
-
+from promise import Promise
+
+from . import (
+    appointments,
+    cache,
+    checkout,
+    counters,
+    idempotency,
+    inventory,
+    outbox,
+    routers,
+)
+from .loaders import get_loaders
 from .models import *
-from .utils import run_async
+from .optimizer import Hint, optimize, optimize_instance, prefetched
+from .pagination import paginate
+from .search import search_products
 
 
 class CartType(DjangoObjectType):
@@ -21,15 +34,13 @@ class ReviewType(DjangoObjectType):
     class Meta:
         model = Review
 
-    likes_count = graphene.Int()
     is_liked = graphene.Boolean()
 
-    def resolve_likes_count(parent, info):
-        return Like.objects.filter(review=parent).count()
+    optimizer_hints = {"is_liked": Hint()}
 
     @login_required
     def resolve_is_liked(parent, info):
-        return Like.objects.filter(review=parent, user=info.context.user).count()
+        return get_loaders(info).review_is_liked.load(parent.id)
 
 
 class LikeType(DjangoObjectType):
@@ -47,9 +58,68 @@ class AppointmentType(DjangoObjectType):
         model = Appointment
 
 
+class AvailableSlotsType(graphene.ObjectType):
+    date = graphene.Date()
+    available = graphene.Int()
+
+
+class ReviewConnection(graphene.relay.Connection):
+    class Meta:
+        node = ReviewType
+
+
 class ProductType(DjangoObjectType):
     class Meta:
         model = Product
+        exclude = ("search_vector",)
+
+    rating = graphene.Float()
+    stock = graphene.Int()
+    available_stock = graphene.Int()
+    reviews_connection = graphene.relay.ConnectionField(ReviewConnection)
+
+    optimizer_hints = {
+        "rating": Hint(only=("review_count", "rating_sum")),
+        "stock": Hint(),
+        "available_stock": Hint(),
+        "reviews_connection": Hint(),
+    }
+
+    def resolve_stock(parent, info):
+        # units on hand, the column only changes when the product is restocked
+        loaders = get_loaders(info)
+        return Promise.all(
+            [
+                loaders.available_stock.load(parent.id),
+                loaders.held_stock.load(parent.id),
+            ]
+        ).then(sum)
+
+    def resolve_available_stock(parent, info):
+        # stock that isn't held in a cart, see ecommerce.inventory
+        return get_loaders(info).available_stock.load(parent.id)
+
+    def resolve_reviews_connection(parent, info, **kwargs):
+        return paginate(
+            ReviewConnection,
+            Review.objects.filter(product=parent),
+            info,
+            "-created_on",
+            **kwargs,
+        )
+
+
+class ProductConnection(graphene.relay.Connection):
+    class Meta:
+        node = ProductType
+
+
+class ProductOrdering(graphene.Enum):
+    NEWEST = "-id"
+    PRICE_ASC = "price"
+    PRICE_DESC = "-price"
+    NAME = "name"
+    MOST_REVIEWED = "-review_count"
 
 
 class PhotoType(DjangoObjectType):
@@ -57,6 +127,11 @@ class PhotoType(DjangoObjectType):
         model = Photo
 
 
+class CartMode(graphene.Enum):
+    REPLACE = "replace"
+    MERGE = "merge"
+
+
 class ProductOrderInputType(graphene.InputObjectType):
     product_id = graphene.String(required=True)
     qty = graphene.Int(required=True)
@@ -84,8 +159,18 @@ class OrderType(DjangoObjectType):
 
     product_objects = graphene.List(OrderObjType)
 
+    optimizer_hints = {"product_objects": Hint(prefetch="orderobj_set")}
+
     def resolve_product_objects(parent, info):
-        return OrderObj.objects.filter(order=parent)
+        rows = prefetched(parent, "orderobj_set")
+        if rows is not None:
+            return rows
+        return get_loaders(info).order_product_objects.load(parent.id)
+
+
+class OrderConnection(graphene.relay.Connection):
+    class Meta:
+        node = OrderType
 
 
 class UserType(DjangoObjectType):
@@ -95,8 +180,13 @@ class UserType(DjangoObjectType):
 
     cart = graphene.List(CartType)
 
+    optimizer_hints = {"cart": Hint(prefetch="cartobj_set")}
+
     def resolve_cart(parent, info):
-        return CartObj.objects.filter(user=parent)
+        rows = prefetched(parent, "cartobj_set")
+        if rows is not None:
+            return rows
+        return get_loaders(info).user_cart.load(parent.id)
 
 
 class Query(graphene.ObjectType):
@@ -109,55 +199,110 @@ class Query(graphene.ObjectType):
         search=graphene.String(),
         kind=graphene.String(),
     )
+    products_connection = graphene.relay.ConnectionField(
+        ProductConnection,
+        kind=graphene.String(),
+        min_rating=graphene.Float(),
+        order_by=ProductOrdering(default_value=ProductOrdering.NEWEST.value),
+    )
     product = graphene.Field(ProductType, id=graphene.String())
 
     orders = graphene.List(OrderType)
+    orders_connection = graphene.relay.ConnectionField(OrderConnection)
     order = graphene.Field(OrderType, id=graphene.String())
     booked_dates = graphene.List(graphene.DateTime)
+    available_slots = graphene.List(
+        AvailableSlotsType,
+        from_=graphene.Date(required=True, name="from"),
+        to=graphene.Date(required=True),
+    )
 
     @login_required
     def resolve_me(self, info):
-        return info.context.user
+        return optimize_instance(info.context.user, info)
 
     @login_required
     def resolve_orders(self, info):
-        return Order.objects.filter(user=info.context.user)
+        return optimize(Order.objects.filter(user=info.context.user), info)
+
+    @login_required
+    def resolve_orders_connection(self, info, **kwargs):
+        return paginate(
+            OrderConnection,
+            Order.objects.filter(user=info.context.user),
+            info,
+            "-order_timestamp",
+            **kwargs,
+        )
 
     @login_required
     def resolve_order(self, info, id):
-        product = Order.objects.get(pk=id)
-        if product.user != info.context.user:
+        product = optimize(Order.objects.all(), info).get(pk=id)
+        if product.user_id != info.context.user.id:
             raise Exception("Not the owner of the order")
         return product
 
     def resolve_booked_dates(self, info):
-        appointments = Appointment.objects.filter(
-            timestamp__gt=datetime.datetime.now().astimezone()
+        now = timezone.now()
+        return list(
+            Appointment.objects.filter(
+                date__gte=appointments.local_date(now), timestamp__gt=now
+            ).values_list("timestamp", flat=True)
         )
-        booked_dates = [appointment.timestamp for appointment in appointments]
-        return booked_dates
+
+    def resolve_available_slots(self, info, from_, to):
+        return [
+            AvailableSlotsType(date=date, available=available)
+            for date, available in appointments.available_slots(from_, to)
+        ]
 
     def resolve_product(self, info, id, **kwargs):
-        return Product.objects.get(pk=id)
+        return cache.get_or_set(
+            "product",
+            info,
+            {"id": id},
+            [f"product:{id}"],
+            lambda: optimize(Product.objects.all(), info).get(pk=id),
+        )
 
     def resolve_products(
         self, info, first=None, skip=None, search=None, kind=None, **kwargs
     ):
-        qs = Product.objects.all()
+        def products():
+            qs = optimize(Product.objects.order_by("id"), info)
+
+            if kind:
+                qs = qs.filter(Q(kind=kind))
+
+            if search:
+                qs = search_products(qs, search)
+
+            if skip:
+                qs = qs[skip:]
+
+            if first:
+                qs = qs[:first]
+
+            return list(qs)
+
+        arguments = {"first": first, "skip": skip, "search": search, "kind": kind}
+        return cache.get_or_set("products", info, arguments, ["products"], products)
 
-        if search:
-            qs = qs.filter(Q(name__icontains=search))
+    def resolve_products_connection(
+        self, info, order_by, kind=None, min_rating=None, **kwargs
+    ):
+        qs = Product.objects.all()
 
         if kind:
             qs = qs.filter(Q(kind=kind))
 
-        if skip:
-            qs = qs[skip:]
-
-        if first:
-            qs = qs[:first]
+        if min_rating is not None:
+            # average >= min_rating without dividing, products without reviews excluded
+            qs = qs.filter(
+                review_count__gt=0, rating_sum__gte=F("review_count") * min_rating
+            )
 
-        return qs
+        return paginate(ProductConnection, qs, info, order_by, **kwargs)
 
 
 class CreateAddress(graphene.Mutation):
@@ -270,7 +415,9 @@ class AddReview(graphene.Mutation):
         text = kwargs.get("text", None)
         user = info.context.user
         review = Review(user=user, product_id=productId, rating=rating, text=text)
-        review.save()
+        with transaction.atomic():
+            review.save()
+            counters.review_added(review)
 
         return AddReview(id=review.id, rating=review.rating, text=review.text)
 
@@ -289,7 +436,10 @@ class DeleteReview(graphene.Mutation):
         if review.user.id != user.id:
             raise Exception("You must be author of the review to delete it.")
 
-        review.delete()
+        with transaction.atomic():
+            _, deleted = review.delete()
+            if deleted.get(Review._meta.label):
+                counters.review_removed(review)
 
         return DeleteReview(id=reviewId)
 
@@ -304,7 +454,9 @@ class LikeReview(graphene.Mutation):
     def mutate(self, info, reviewId):
         user = info.context.user
         like = Like(user=user, review_id=reviewId)
-        like.save()
+        with transaction.atomic():
+            like.save()
+            counters.like_added(like)
 
         return LikeReview(id=like.id)
 
@@ -320,7 +472,10 @@ class UnlikeReview(graphene.Mutation):
         user = info.context.user
         like = Like.objects.get(user=user, review_id=reviewId)
         id = like.id
-        like.delete()
+        with transaction.atomic():
+            _, deleted = like.delete()
+            if deleted.get(Like._meta.label):
+                counters.like_removed(like)
 
         return UnlikeReview(id=id)
 
@@ -383,64 +538,40 @@ class OrderCart(graphene.Mutation):
 
     class Arguments:
         address_id = graphene.String()
+        idempotency_key = graphene.String()
 
     @login_required
-    def mutate(self, info, address_id):
-        address = Address.objects.get(pk=address_id)
+    def mutate(self, info, address_id, idempotency_key=None):
         user = info.context.user
-        order = Order.objects.create(
-            user=user,
-            name=address.name,
-            phone=address.phone,
-            address1=address.address1,
-            address2=address.address2,
-            pincode=address.pincode,
-            city=address.city,
-            state=address.state,
-            country=address.country,
+        order = idempotency.place_order_once(
+            user,
+            idempotency_key,
+            "orderCart",
+            {"address_id": address_id},
+            lambda: OrderCart.place_order(user, address_id),
         )
-        cart = CartObj.objects.filter(user=info.context.user)
-
-        for cart_obj in cart:
-            product = cart_obj.product
-
-            if product.stock < cart_obj.qty:
-                raise Exception("Stock Error")
-
-            product.stock -= cart_obj.qty
-            product.save()
-
-            order.product_objects.add(
-                product.id,
-                through_defaults={
-                    "qty": cart_obj.qty,
-                    "price": math.ceil(
-                        product.price - (product.discount * product.price) / 100
-                    ),
-                },
-            )
+        routers.pin_to_primary(info.context)
+        return OrderCart(order=order)
 
-            cart_obj.delete()
+    @staticmethod
+    def place_order(user, address_id):
+        address = Address.objects.get(pk=address_id)
+        with transaction.atomic():
+            order = checkout.order_cart(user, address)
 
-        run_async(
-            send_mail,
-            [
+            outbox.send_mail(
                 f"Order Confirmed Id: {order.id}",
                 f"Dear {user.name},\n\n Your order is confirmed with order id: {order.id}. Please go to your orders section in app to see the order details",
                 "Larena Team",
                 [user.email],
-            ],
-        )
+            )
 
-        run_async(
-            mail_admins,
-            [
+            outbox.mail_admins(
                 f"Order Confirmed Id: {order.id}",
                 f"A order has been placed with order id : {order.id}",
-            ],
-        )
+            )
 
-        return OrderCart(order=order)
+        return order
 
 
 class OrderProduct(graphene.Mutation):
@@ -449,59 +580,46 @@ class OrderProduct(graphene.Mutation):
     class Arguments:
         product_obj = ProductOrderInputType()
         address_id = graphene.String()
+        idempotency_key = graphene.String()
 
     @login_required
-    def mutate(self, info, product_obj, address_id):
-        address = Address.objects.get(pk=address_id)
+    def mutate(self, info, product_obj, address_id, idempotency_key=None):
         user = info.context.user
-        order = Order.objects.create(
-            user=user,
-            name=address.name,
-            phone=address.phone,
-            address1=address.address1,
-            address2=address.address2,
-            pincode=address.pincode,
-            city=address.city,
-            state=address.state,
-            country=address.country,
-        )
-
-        product = Product.objects.get(pk=product_obj.product_id)
-        if product.stock < product_obj.qty:
-            raise Exception("Stock Error")
-
-        product.stock -= product_obj.qty
-        product.save()
-
-        order.product_objects.add(
-            product.id,
-            through_defaults={
+        order = idempotency.place_order_once(
+            user,
+            idempotency_key,
+            "orderProduct",
+            {
+                "product_id": product_obj.product_id,
                 "qty": product_obj.qty,
-                "price": math.ceil(
-                    product.price - (product.discount * product.price) / 100
-                ),
+                "address_id": address_id,
             },
+            lambda: OrderProduct.place_order(user, product_obj, address_id),
         )
+        routers.pin_to_primary(info.context)
+        return OrderProduct(order=order)
 
-        run_async(
-            send_mail,
-            [
+    @staticmethod
+    def place_order(user, product_obj, address_id):
+        address = Address.objects.get(pk=address_id)
+        with transaction.atomic():
+            order = checkout.order_product(
+                user, address, product_obj.product_id, product_obj.qty
+            )
+
+            outbox.send_mail(
                 f"Order Confirmed Id: {order.id}",
                 f"Dear {user.name},\n\n Your order is confirmed with order id: {order.id}. Please go to your orders section in app to see the order details",
                 "Larena Team",
                 [user.email],
-            ],
-        )
+            )
 
-        run_async(
-            mail_admins,
-            [
+            outbox.mail_admins(
                 f"Order Confirmed Id: {order.id}",
                 f"A order has been placed with order id : {order.id}",
-            ],
-        )
+            )
 
-        return OrderProduct(order=order)
+        return order
 
 
 class SetCart(graphene.Mutation):
@@ -515,22 +633,48 @@ class SetCart(graphene.Mutation):
     def mutate(self, info, cart_obj, **kwargs):
         user = info.context.user
         add = kwargs.get("add", False)
-        try:
-            _cart_obj = CartObj.objects.get(user=user, product_id=cart_obj.product_id)
-            if add:
-                _cart_obj.qty += cart_obj.qty
-                _cart_obj.save()
-            else:
-                if cart_obj.qty > 0:
-                    _cart_obj.qty = cart_obj.qty
+        with transaction.atomic():
+            try:
+                _cart_obj = CartObj.objects.get(user=user, product_id=cart_obj.product_id)
+                if add:
+                    _cart_obj.qty += cart_obj.qty
                     _cart_obj.save()
                 else:
-                    user.cart.remove(cart_obj.product_id)
-        except CartObj.DoesNotExist:
-            if cart_obj.qty > 0:
-                user.cart.add(cart_obj.product_id, through_defaults={"qty": cart_obj.qty})
+                    if cart_obj.qty > 0:
+                        _cart_obj.qty = cart_obj.qty
+                        _cart_obj.save()
+                    else:
+                        user.cart.remove(cart_obj.product_id)
+            except CartObj.DoesNotExist:
+                if cart_obj.qty > 0:
+                    user.cart.add(
+                        cart_obj.product_id, through_defaults={"qty": cart_obj.qty}
+                    )
+            inventory.hold_cart(user)
+
+        routers.pin_to_primary(info.context)
+        cart = optimize(CartObj.objects.filter(user=user), info, path=("cart",))
+        return SetCart(cart=cart)
+
+
+class SetCartItems(graphene.Mutation):
+    cart = graphene.List(CartType)
+
+    class Arguments:
+        items = graphene.List(graphene.NonNull(ProductOrderInputType), required=True)
+        mode = CartMode(default_value=CartMode.REPLACE.value)
 
-        return SetCart(cart=CartObj.objects.filter(user=user))
+    @login_required
+    def mutate(self, info, items, mode):
+        user = info.context.user
+        checkout.set_cart_items(
+            user,
+            [(item.product_id, item.qty) for item in items],
+            merge=mode == CartMode.MERGE.value,
+        )
+        routers.pin_to_primary(info.context)
+        cart = optimize(CartObj.objects.filter(user=user), info, path=("cart",))
+        return SetCartItems(cart=cart)
 
 
 class BookAppointment(graphene.Mutation):
@@ -541,43 +685,35 @@ class BookAppointment(graphene.Mutation):
 
     @login_required
     def mutate(self, info, timestamp):
-        _appoint = Appointment.objects.filter(timestamp__startswith=timestamp.date())
-
-        if len(_appoint) > 0:
-            raise Exception("No slot on that day!")
         user = info.context.user
-        new_appoint = Appointment.objects.create(user=user, timestamp=timestamp)
+        # the emails are only queued if the booking commits, and the other way round
+        with transaction.atomic():
+            new_appoint = appointments.book(user, timestamp)
 
-        _time: datetime.datetime = new_appoint.timestamp.astimezone(
-            pytz.timezone("Asia/Kolkata")
-        )
+            _time: datetime.datetime = new_appoint.timestamp.astimezone(
+                appointments.time_zone()
+            )
 
-        formatted_time = _time.strftime("%-I:%M on %A, %-d{} %B")
-        if _time.day == 1:
-            formatted_time = formatted_time.format("st")
-        elif _time.day == 2:
-            formatted_time = formatted_time.format("nd")
-        elif _time.day == 3:
-            formatted_time = formatted_time.format("rd")
-        else:
-            formatted_time = formatted_time.format("th")
-        run_async(
-            send_mail,
-            [
+            formatted_time = _time.strftime("%-I:%M on %A, %-d{} %B")
+            if _time.day == 1:
+                formatted_time = formatted_time.format("st")
+            elif _time.day == 2:
+                formatted_time = formatted_time.format("nd")
+            elif _time.day == 3:
+                formatted_time = formatted_time.format("rd")
+            else:
+                formatted_time = formatted_time.format("th")
+            outbox.send_mail(
                 "Appointment Confirmed",
                 f"Dear {user.name},\n\tThank you for booking appointment.\n\tYour appointment is at {formatted_time}.\n\nThanks,\n Larena team",
                 "Larena Team",
                 [user.email],
-            ],
-        )
+            )
 
-        run_async(
-            mail_admins,
-            [
+            outbox.mail_admins(
                 "Appointment Confirmed",
                 f"New appoitment booked by {user.name} Phn: {user.phone} at {formatted_time}",
-            ],
-        )
+            )
 
         return BookAppointment(appointment=new_appoint)
 
@@ -594,5 +730,6 @@ class Mutation(graphene.ObjectType):
     update_password = UpdatePassword.Field()
     order_cart = OrderCart.Field()
     set_cart = SetCart.Field()
+    set_cart_items = SetCartItems.Field()
     book_appointment = BookAppointment.Field()
     order_product = OrderProduct.Field()
@@ -0,0 +1,184 @@
+import re
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connections
+from django.db.models import (
+    Case,
+    CharField,
+    F,
+    FloatField,
+    Func,
+    IntegerField,
+    Q,
+    Value,
+    When,
+)
+from django.db.models.lookups import PostgresOperatorLookup
+
+from .models import Product
+
+TOKEN_RE = re.compile(r"\w+")
+
+# name matches rank above description matches, like the "A"/"B" weights below
+SEARCH_VECTOR = SearchVector("name", weight="A") + SearchVector("description", weight="B")
+FIELD_WEIGHTS = {"name": 1.0, "description": 0.4}
+
+
+@CharField.register_lookup
+class TrigramWordSimilar(PostgresOperatorLookup):
+    """
+    `name %> search`, whether some words of the name are similar to `search`,
+    unlike % which compares it with the whole name. Built in from Django 3.2.
+    """
+
+    lookup_name = "trigram_word_similar"
+    postgres_operator = "%%>"
+
+
+class TrigramWordSimilarity(Func):
+    function = "WORD_SIMILARITY"
+    output_field = FloatField()
+
+    def __init__(self, string, expression, **extra):
+        if not hasattr(string, "resolve_expression"):
+            string = Value(string)
+        super().__init__(string, expression, **extra)
+
+
+def similarity_threshold():
+    return getattr(settings, "SEARCH_SIMILARITY_THRESHOLD", 0.3)
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+def is_postgres(using):
+    return connections[using].vendor == "postgresql"
+
+
+def set_similarity_threshold(connection):
+    """Makes the %> operator of a postgres connection use similarity_threshold()."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SET pg_trgm.word_similarity_threshold = %s", [similarity_threshold()]
+        )
+
+
+def update_search_vector(product_ids, using="default"):
+    """Recomputes the stored tsvector of the given products (postgres only)."""
+    if is_postgres(using):
+        Product.objects.using(using).filter(pk__in=product_ids).update(
+            search_vector=SEARCH_VECTOR
+        )
+    else:
+        product_index.invalidate()
+
+
+def search_products(queryset, search):
+    """
+    Filters `queryset` to products matching `search` and orders them by relevance.
+    Uses the tsvector/trigram indexes on postgres and an in-process inverted index
+    on other databases.
+    """
+    if is_postgres(queryset.db):
+        return _search_postgres(queryset, search)
+    return _search_index(queryset, search)
+
+
+def _search_postgres(queryset, search):
+    tokens = tokenize(search)
+    if not tokens:
+        return queryset.none()
+    # prefix match every word so results show up while the user is typing
+    query = SearchQuery(" & ".join(f"{token}:*" for token in tokens), search_type="raw")
+    # both conditions can use an index, the gin (name gin_trgm_ops) one only
+    # through the %> operator and not a comparison of word_similarity(), which
+    # is only computed for the matches to order them
+    return (
+        queryset.filter(Q(search_vector=query) | Q(name__trigram_word_similar=search))
+        .annotate(
+            rank=SearchRank(F("search_vector"), query),
+            similarity=TrigramWordSimilarity(search, "name"),
+        )
+        .order_by("-rank", "-similarity", "id")
+    )
+
+
+def _search_index(queryset, search):
+    ranked = product_index.search(search)
+    if not ranked:
+        return queryset.none()
+    position = Case(
+        *[When(pk=pk, then=Value(i)) for i, pk in enumerate(ranked)],
+        output_field=IntegerField(),
+    )
+    return (
+        queryset.filter(pk__in=ranked)
+        .annotate(search_position=position)
+        .order_by("search_position")
+    )
+
+
+def trigrams(token):
+    padded = f"  {token} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def trigram_similarity(a, b):
+    a, b = trigrams(a), trigrams(b)
+    return len(a & b) / len(a | b)
+
+
+class ProductIndex:
+    """
+    Inverted index over product names and descriptions, built lazily from the
+    database and thrown away whenever a product changes. Only meant for sqlite
+    based development and tests, postgres uses the search_vector column.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings = None
+
+    def invalidate(self):
+        with self._lock:
+            self._postings = None
+
+    def build(self):
+        postings = defaultdict(lambda: defaultdict(float))
+        rows = Product.objects.values_list("id", "name", "description")
+        for pk, *values in rows.iterator():
+            for field, text in zip(FIELD_WEIGHTS, values):
+                for token in tokenize(text or ""):
+                    postings[token][pk] += FIELD_WEIGHTS[field]
+        return postings
+
+    def get_postings(self):
+        with self._lock:
+            if self._postings is None:
+                self._postings = self.build()
+            return self._postings
+
+    def search(self, text):
+        """Returns the ids of the matching products, most relevant first."""
+        postings = self.get_postings()
+        threshold = similarity_threshold()
+        scores = defaultdict(float)
+        for query_token in tokenize(text):
+            for token, products in postings.items():
+                if token.startswith(query_token):
+                    similarity = 1.0
+                else:
+                    similarity = trigram_similarity(query_token, token)
+                    if similarity < threshold:
+                        continue
+                for pk, weight in products.items():
+                    scores[pk] += weight * similarity
+        return sorted(scores, key=lambda pk: (-scores[pk], pk))
+
+
+product_index = ProductIndex()
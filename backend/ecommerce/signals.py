@@ -0,0 +1,72 @@
+from django.core.signals import request_started
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import auth, cache, inventory, metrics
+from .db import start_request
+from .middleware import count_queries
+from .models import Like, Photo, Product, Review, User
+from .search import product_index, set_similarity_threshold, update_search_vector
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, using, **kwargs):
+    transaction.on_commit(lambda: update_search_vector([instance.pk], using), using)
+
+
+@receiver(post_save, sender=Product)
+def product_restocked(sender, instance, created, update_fields, **kwargs):
+    if update_fields is not None and "stock" not in update_fields:
+        return
+    # the stock column isn't decremented by sales, saving it unchanged (eg. after
+    # editing the price) must not bring the units sold since back
+    if created or instance.stock != getattr(instance, "_loaded_stock", None):
+        inventory.rebalance([instance.pk])
+        instance._loaded_stock = instance.stock
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    product_index.invalidate()
+
+
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_product(sender, instance, **kwargs):
+    cache.invalidate_products([instance.pk])
+
+
+@receiver([post_save, post_delete], sender=Photo)
+@receiver([post_save, post_delete], sender=Review)
+def invalidate_product_relation(sender, instance, **kwargs):
+    cache.invalidate_products([instance.product_id])
+
+
+@receiver([post_save, post_delete], sender=Like)
+def invalidate_like(sender, instance, **kwargs):
+    product_ids = Review.objects.filter(pk=instance.review_id).values_list(
+        "product_id", flat=True
+    )
+    cache.invalidate_products(list(product_ids))
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_user(sender, instance, **kwargs):
+    auth.invalidate_user(instance)
+
+
+@receiver(connection_created)
+def count_connection(sender, connection, **kwargs):
+    metrics.CONNECTIONS_CREATED.labels(connection.alias).inc()
+    if count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_queries)
+
+
+@receiver(connection_created)
+def configure_search(sender, connection, **kwargs):
+    if connection.vendor == "postgresql":
+        set_similarity_threshold(connection)
+
+
+request_started.connect(start_request)
@@ -1,3 +1,1642 @@
-from django.test import TestCase
+import datetime
+import gzip
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import brotli
+from django.core import mail
+from django.core.signals import request_started
+from django.http import HttpResponse
+from django.core.management import call_command
+from django.db.backends.postgresql.base import DatabaseWrapper as PostgresWrapper
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.db.models import Sum
+from django.test import (
+    AsyncClient,
+    Client,
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import path
+from django.utils import timezone
+from graphql.execution import ExecutionResult
+from graphql_jwt.shortcuts import get_token
+from promise import Promise
+
+from . import (
+    auth,
+    cache,
+    checkout,
+    db,
+    counters,
+    documents,
+    inventory,
+    loaders,
+    metrics,
+    outbox,
+    routers,
+    search,
+    workload,
+)
+from .models import (
+    Address,
+    Appointment,
+    CartObj,
+    IdempotencyKey,
+    Like,
+    Order,
+    OrderObj,
+    OutboxEmail,
+    PersistedQuery,
+    Photo,
+    Product,
+    Review,
+    StockHold,
+    StockSlot,
+    User,
+)
+from .asynchronous import database_sync_to_async
+from .schema import ProductOrdering
+from .views import AsyncGraphQLView
+
+
+def create_user(email):
+    user = User.objects.create_user(
+        email=email, password="password", name="Test", phone="9999999999"
+    )
+    address = Address.objects.create(
+        user=user,
+        name="Test",
+        phone="9999999999",
+        address1="Street",
+        address2="Area",
+        pincode=110001,
+        city="Delhi",
+        state="Delhi",
+        country="India",
+    )
+    return user, address
+
+
+def graphql(user, query, variables=None):
+    client = Client(HTTP_AUTHORIZATION=f"JWT {get_token(user)}")
+    response = client.post(
+        "/graphql/",
+        json.dumps({"query": query, "variables": variables}),
+        content_type="application/json",
+    )
+    return response.json()
+
+
+fast_hashing = override_settings(
+    PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"]
+)
+
+
+ORDER_CART = """
+mutation OrderCart($addressId: String) {
+  orderCart(addressId: $addressId) { order { id } }
+}
+"""
+
+
+@fast_hashing
+class OrderCartTest(TestCase):
+    def setUp(self):
+        self.user, self.address = create_user("buyer@larena.test")
+        self.ring = Product.objects.create(
+            name="Ring", price=1000, discount=10, stock=5, kind="Jewellery"
+        )
+        self.shirt = Product.objects.create(
+            name="Shirt", price=500, stock=1, kind="Cloth"
+        )
+
+    def test_order_cart(self):
+        CartObj.objects.create(user=self.user, product=self.ring, qty=2)
+        CartObj.objects.create(user=self.user, product=self.shirt, qty=1)
+
+        result = graphql(self.user, ORDER_CART, {"addressId": str(self.address.id)})
+
+        order = Order.objects.get(pk=result["data"]["orderCart"]["order"]["id"])
+        self.assertEqual(
+            set(order.orderobj_set.values_list("product__name", "qty", "price")),
+            {("Ring", 2, 900), ("Shirt", 1, 500)},
+        )
+        self.assertEqual(
+            inventory.on_hand([self.ring.pk, self.shirt.pk]),
+            {self.ring.pk: 3, self.shirt.pk: 0},
+        )
+        self.assertFalse(CartObj.objects.filter(user=self.user).exists())
+
+    def test_stock_error_rolls_back(self):
+        CartObj.objects.create(user=self.user, product=self.ring, qty=2)
+        CartObj.objects.create(user=self.user, product=self.shirt, qty=2)
+
+        result = graphql(self.user, ORDER_CART, {"addressId": str(self.address.id)})
+
+        self.assertEqual(result["errors"][0]["message"], "Stock Error")
+        self.assertEqual(inventory.on_hand([self.ring.pk]), {self.ring.pk: 5})
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(CartObj.objects.filter(user=self.user).count(), 2)
+
+
+ORDER_PRODUCT = """
+mutation OrderProduct($productObj: ProductOrderInputType, $addressId: String, $key: String) {
+  orderProduct(productObj: $productObj, addressId: $addressId, idempotencyKey: $key) {
+    order { id }
+  }
+}
+"""
+
+
+@fast_hashing
+class IdempotencyTest(TestCase):
+    def setUp(self):
+        self.user, self.address = create_user("buyer@larena.test")
+        self.ring = Product.objects.create(
+            name="Ring", price=1000, stock=5, kind="Jewellery"
+        )
+
+    def order(self, qty=1, key="retry-1"):
+        return graphql(
+            self.user,
+            ORDER_PRODUCT,
+            {
+                "productObj": {"productId": str(self.ring.id), "qty": qty},
+                "addressId": str(self.address.id),
+                "key": key,
+            },
+        )
+
+    def test_retry_returns_the_first_order(self):
+        first, retry = self.order(), self.order()
+
+        self.assertEqual(retry, first)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(inventory.on_hand([self.ring.pk]), {self.ring.pk: 4})
+        self.assertEqual(OutboxEmail.objects.count(), 2)
+
+    def test_key_reused_for_another_request(self):
+        self.order()
+        result = self.order(qty=2)
+
+        self.assertEqual(
+            result["errors"][0]["message"],
+            "Idempotency key was used for a different request",
+        )
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_failed_request_can_be_retried(self):
+        self.assertEqual(self.order(qty=10)["errors"][0]["message"], "Stock Error")
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.ring.stock = 10
+        self.ring.save()
+        self.assertNotIn("errors", self.order(qty=10))
+
+    def test_purge(self):
+        self.order(key="old")
+        self.order(key="new")
+        IdempotencyKey.objects.filter(key="old").update(expires_at=timezone.now())
+
+        call_command("purge_idempotency_keys", batch_size=1, stdout=StringIO())
+
+        self.assertEqual(
+            list(IdempotencyKey.objects.values_list("key", flat=True)), ["new"]
+        )
+
+
+PRODUCTS_CONNECTION = """
+query Products($orderBy: ProductOrdering, $first: Int, $after: String, $last: Int,
+               $before: String) {
+  productsConnection(orderBy: $orderBy, first: $first, after: $after, last: $last,
+                     before: $before) {
+    edges { node { id } }
+    pageInfo { startCursor endCursor hasPreviousPage hasNextPage }
+  }
+}
+"""
+
+
+class PaginationTest(TestCase):
+    def setUp(self):
+        prices = [300, 100, 300, 200, 300]
+        self.products = [
+            Product.objects.create(name=f"Ring {i}", price=price, kind="Jewellery")
+            for i, price in enumerate(prices)
+        ]
+
+    def page(self, **variables):
+        result = (
+            Client()
+            .post(
+                "/graphql/",
+                json.dumps({"query": PRODUCTS_CONNECTION, "variables": variables}),
+                content_type="application/json",
+            )
+            .json()
+        )
+        if "errors" in result:
+            return result["errors"][0]["message"]
+        connection = result["data"]["productsConnection"]
+        ids = [int(edge["node"]["id"]) for edge in connection["edges"]]
+        return ids, connection["pageInfo"]
+
+    def expected(self, ordering):
+        descending = ordering.startswith("-")
+        key = ordering.lstrip("-")
+        products = sorted(self.products, key=lambda p: (getattr(p, key), p.pk))
+        return [p.pk for p in (products[::-1] if descending else products)]
+
+    def test_forward(self):
+        for order_by, ordering in (("PRICE_ASC", "price"), ("PRICE_DESC", "-price")):
+            ids, after = [], None
+            while True:
+                page, info = self.page(orderBy=order_by, first=2, after=after)
+                self.assertEqual(info["hasPreviousPage"], after is not None)
+                ids += page
+                after = info["endCursor"]
+                if not info["hasNextPage"]:
+                    break
+            self.assertEqual(ids, self.expected(ordering))
+
+    def test_backward(self):
+        ids, before = [], None
+        while True:
+            page, info = self.page(orderBy="PRICE_ASC", last=2, before=before)
+            self.assertEqual(info["hasNextPage"], before is not None)
+            ids = page + ids
+            before = info["startCursor"]
+            if not info["hasPreviousPage"]:
+                break
+        self.assertEqual(ids, self.expected("price"))
+
+    def test_cursor_round_trip(self):
+        ids, info = self.page(orderBy="PRICE_ASC", first=3)
+        # the last three share a price, only the primary key tells them apart
+        after, _ = self.page(orderBy="PRICE_ASC", first=2, after=info["endCursor"])
+        before, _ = self.page(orderBy="PRICE_ASC", last=3, before=info["endCursor"])
+        self.assertEqual(after, self.expected("price")[3:])
+        self.assertEqual(before, ids[:2])
+
+        with CaptureQueriesContext(connection) as captured:
+            self.page(orderBy="PRICE_ASC", first=2, after=info["endCursor"])
+        self.assertIn('"price" >= 300', captured[-1]["sql"])
+
+    def test_invalid_arguments(self):
+        self.assertEqual(self.page(first=2, after="not a cursor"), "Invalid cursor")
+        self.assertEqual(self.page(first=-1), "first must be between 0 and 100")
+
+    def test_orderings_are_indexed(self):
+        indexes = {tuple(index.fields) for index in Product._meta.indexes}
+        for ordering in ProductOrdering._meta.enum:
+            # seeks on (key, id), filtered by kind or not
+            columns = tuple(dict.fromkeys([ordering.value.lstrip("-"), "id"]))
+            with self.subTest(ordering.name):
+                self.assertTrue(columns == ("id",) or columns in indexes)
+                self.assertIn(("kind", *columns), indexes)
+
+
+@override_settings(CATALOG_CACHE_ENABLED=False)
+class SearchTest(TestCase):
+    def setUp(self):
+        Product.objects.create(
+            name="Silk Saree", price=500, kind="Cloth", description="Woven silk"
+        )
+        Product.objects.create(
+            name="Golden Necklace",
+            price=1000,
+            kind="Jewellery",
+            description="Pairs with a silk saree",
+        )
+        Product.objects.create(name="Silver Ring", price=800, kind="Jewellery")
+        # the test transaction isn't committed, update_search_vector doesn't run
+        search.product_index.invalidate()
+
+    def search(self, text):
+        result = (
+            Client()
+            .post(
+                "/graphql/",
+                json.dumps({"query": f'{{ products(search: "{text}") {{ name }} }}'}),
+                content_type="application/json",
+            )
+            .json()
+        )
+        return [product["name"] for product in result["data"]["products"]]
+
+    def test_index(self):
+        # name matches rank above description matches
+        self.assertEqual(self.search("saree"), ["Silk Saree", "Golden Necklace"])
+        # prefixes and misspelt words match
+        self.assertEqual(self.search("neck"), ["Golden Necklace"])
+        self.assertEqual(self.search("neckless"), ["Golden Necklace"])
+        self.assertEqual(self.search("sherwani"), [])
+        self.assertEqual(self.search("!"), [])
+
+    def test_index_invalidated(self):
+        self.assertEqual(self.search("ring"), ["Silver Ring"])
+        Product.objects.get(name="Silver Ring").delete()
+        self.assertEqual(self.search("ring"), [])
+
+    def test_postgres(self):
+        connection = PostgresWrapper(
+            {
+                **connections["default"].settings_dict,
+                "ENGINE": "django.db.backends.postgresql",
+            },
+            "postgres",
+        )
+        queryset = search._search_postgres(Product.objects.all(), "gold ring")
+        sql, params = queryset.query.get_compiler(connection=connection).as_sql()
+
+        # matched with indexable operators, similarity() only orders the matches
+        where = sql[sql.index(" WHERE ") :]
+        self.assertIn('"search_vector" @@ to_tsquery(%s)', where)
+        self.assertIn('"name" %%> %s', where)
+        self.assertNotIn("SIMILARITY", where)
+        self.assertIn('WORD_SIMILARITY(%s, "ecommerce_product"."name")', sql)
+        self.assertIn("gold:* & ring:*", params)
+
+
+@override_settings(CATALOG_CACHE_ENABLED=False)
+class PersistedQueryTest(TestCase):
+    query = "{ products { name } }"
+
+    def setUp(self):
+        documents.get_cache().clear()
+        documents.registered_queries.clear()
+        documents.missing_queries.clear()
+        self.sha256 = documents.query_hash(self.query)
+
+    def post(self, query=None, sha256=None):
+        body = {"extensions": {"persistedQuery": {"version": 1, "sha256Hash": sha256}}}
+        if sha256 is None:
+            body = {}
+        if query is not None:
+            body["query"] = query
+        result = (
+            Client()
+            .post("/graphql/", json.dumps(body), content_type="application/json")
+            .json()
+        )
+        if "errors" in result:
+            return result["errors"][0]["extensions"]["code"]
+        return result["data"]
+
+    def test_client_registration(self):
+        self.assertEqual(self.post(sha256=self.sha256), "PERSISTED_QUERY_NOT_FOUND")
+
+        cache = documents.get_cache()
+        with mock.patch.object(cache, "set", wraps=cache.set) as set_:
+            self.assertEqual(self.post(self.query, self.sha256), {"products": []})
+        set_.assert_any_call(documents.client_query_key(self.sha256), self.query, 86400)
+        self.assertFalse(PersistedQuery.objects.exists())
+
+        # served from the cache table, then the products are queried
+        with self.assertNumQueries(2):
+            self.assertEqual(self.post(sha256=self.sha256), {"products": []})
+
+        # expired
+        cache.delete(documents.client_query_key(self.sha256))
+        self.assertEqual(self.post(sha256=self.sha256), "PERSISTED_QUERY_NOT_FOUND")
+
+    def test_misses_are_cached(self):
+        self.assertEqual(self.post(sha256=self.sha256), "PERSISTED_QUERY_NOT_FOUND")
+        with self.assertNumQueries(0):
+            self.assertEqual(self.post(sha256=self.sha256), "PERSISTED_QUERY_NOT_FOUND")
+
+        with mock.patch.object(
+            documents.time, "monotonic", return_value=time.monotonic() + 11
+        ):
+            with self.assertNumQueries(2):
+                self.post(sha256=self.sha256)
+
+    def test_hash_mismatch(self):
+        sha256 = documents.query_hash("{ me { name } }")
+        self.assertEqual(self.post(self.query, sha256), "BAD_REQUEST")
+        self.assertEqual(self.post(sha256=sha256), "PERSISTED_QUERY_NOT_FOUND")
+
+    @override_settings(GRAPHQL_PERSISTED_QUERIES_ONLY=True)
+    def test_persisted_queries_only(self):
+        self.assertEqual(self.post(self.query), "PERSISTED_QUERY_NOT_SUPPORTED")
+        self.assertEqual(
+            self.post(self.query, self.sha256), "PERSISTED_QUERY_NOT_SUPPORTED"
+        )
+        documents.register_client_query(self.sha256, self.query)
+        self.assertEqual(self.post(sha256=self.sha256), "PERSISTED_QUERY_NOT_FOUND")
+
+        documents.register(self.query)
+        documents.registered_queries.clear()
+        self.assertEqual(self.post(sha256=self.sha256), {"products": []})
+        self.assertEqual(self.post(self.query), {"products": []})
+
+
+class CatalogCacheTest(TransactionTestCase):
+    # invalidations are applied once the transaction commits
+
+    def setUp(self):
+        self.ring = Product.objects.create(name="Ring", price=1000, kind="Jewellery")
+        cache.get_cache().clear()
+
+    def names(self):
+        result = (
+            Client()
+            .post(
+                "/graphql/",
+                json.dumps({"query": "{ products { name } }"}),
+                content_type="application/json",
+            )
+            .json()
+        )
+        return [product["name"] for product in result["data"]["products"]]
+
+    def test_invalidated_on_commit(self):
+        self.assertEqual(self.names(), ["Ring"])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.names(), ["Ring"])
+
+        with transaction.atomic():
+            self.ring.name = "Gold Ring"
+            self.ring.save()
+            # other requests can't see the new row yet
+            self.assertEqual(self.names(), ["Ring"])
+        self.assertEqual(self.names(), ["Gold Ring"])
+        self.assertEqual(cache.stats(), {"hit": 2, "stale": 0, "miss": 2})
+
+    def test_evicted_version(self):
+        self.assertEqual(self.names(), ["Ring"])
+        self.ring.name = "Gold Ring"
+        self.ring.save()
+        # the cache drops the version bumped by the save
+        cache.get_cache().delete(cache.version_key("products"))
+
+        self.assertEqual(self.names(), ["Gold Ring"])
+
+    def test_kept_on_orders(self):
+        def stock():
+            result = Client().post(
+                "/graphql/",
+                json.dumps({"query": "{ products { availableStock } }"}),
+                content_type="application/json",
+            )
+            return result.json()["data"]["products"][0]["availableStock"]
+
+        inventory.restock(self.ring.pk, 5)
+        self.assertEqual(stock(), 5)
+        user, _ = create_user("buyer@larena.test")
+        with transaction.atomic():
+            inventory.convert(user, [(self.ring, 2)])
+
+        self.assertEqual(stock(), 3)
+        self.assertEqual(cache.stats(), {"hit": 1, "stale": 0, "miss": 1})
+
+
+class ComplexityTest(TestCase):
+    def query(self, query):
+        response = Client().post(
+            "/graphql/", json.dumps({"query": query}), content_type="application/json"
+        )
+        return response.status_code, response.json()
+
+    def assertRejected(self, query, code):
+        status, result = self.query(query)
+        self.assertEqual(status, 400)
+        self.assertEqual(result["errors"][0]["extensions"]["code"], code)
+        self.assertNotIn("data", result)
+
+    def test_cost(self):
+        status, result = self.query("{ products(first: 5) { reviews { id } } }")
+        self.assertEqual(status, 200)
+        # 5 products, each with DEFAULT_LIST_SIZE reviews
+        self.assertEqual(result["extensions"]["complexity"]["cost"], 5 * (1 + 20))
+
+        self.assertRejected(
+            "{ products { reviews { user { addressSet { id } } } } }", "QUERY_TOO_COMPLEX"
+        )
+
+    def test_negative_page_size(self):
+        self.assertRejected(
+            """
+            {
+              x: products(first: -100000) { id }
+              a: products { reviews { user { addressSet { id } } } }
+            }
+            """,
+            "QUERY_TOO_COMPLEX",
+        )
+
+    @override_settings(GRAPHQL_MAX_DEPTH=3)
+    def test_depth(self):
+        status, _ = self.query("{ products(first: 1) { reviews { user { name } } } }")
+        self.assertEqual(status, 200)
+        self.assertRejected(
+            "{ products(first: 1) { reviews { user { addressSet { id } } } } }",
+            "QUERY_TOO_DEEP",
+        )
+
+
+@override_settings(GRAPHQL_COMPRESS_MIN_SIZE=0, CATALOG_CACHE_ENABLED=False)
+class ResponseTest(TestCase):
+    def setUp(self):
+        Product.objects.create(name="Ring", price=1000, stock=5, kind="Jewellery")
+
+    def get(self, **headers):
+        return Client().get("/graphql/", {"query": "{ products { name } }"}, **headers)
+
+    def test_compression(self):
+        response = self.get(HTTP_ACCEPT_ENCODING="gzip, deflate")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(
+            json.loads(gzip.decompress(response.content))["data"],
+            {"products": [{"name": "Ring"}]},
+        )
+
+        response = self.get(HTTP_ACCEPT_ENCODING="gzip;q=0.5, br")
+        self.assertEqual(response["Content-Encoding"], "br")
+        self.assertEqual(
+            json.loads(brotli.decompress(response.content))["data"],
+            {"products": [{"name": "Ring"}]},
+        )
+
+        self.assertFalse(
+            self.get(HTTP_ACCEPT_ENCODING="gzip;q=0").has_header("Content-Encoding")
+        )
+
+    def test_not_modified(self):
+        etag = self.get()["ETag"]
+
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        Product.objects.create(name="Shirt", price=500, stock=5, kind="Cloth")
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+@fast_hashing
+class SiteMiddlewareTest(TestCase):
+    def test_api_skips_the_site_middleware(self):
+        user, _ = create_user("buyer@larena.test")
+        user.is_staff = user.is_superuser = True
+        user.save()
+        client = Client(HTTP_AUTHORIZATION=f"JWT {get_token(user)}")
+        client.force_login(user, backend="django.contrib.auth.backends.ModelBackend")
+
+        response = client.get("/admin/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["X-Frame-Options"], "DENY")
+
+        def me():
+            return client.post(
+                "/graphql/",
+                json.dumps({"query": "{ me { name } }"}),
+                content_type="application/json",
+            )
+
+        me()
+        # the user is cached, and the session isn't loaded
+        with self.assertNumQueries(0):
+            response = me()
+        self.assertEqual(response.json()["data"], {"me": {"name": "Test"}})
+        self.assertFalse(hasattr(response.wsgi_request, "session"))
+        self.assertFalse(response.has_header("X-Frame-Options"))
+
+
+@fast_hashing
+class AuthenticationTest(TestCase):
+    def setUp(self):
+        self.user, _ = create_user("buyer@larena.test")
+
+    def test_cached_user_is_invalidated(self):
+        self.assertEqual(
+            graphql(self.user, "{ me { name } }")["data"]["me"]["name"], "Test"
+        )
+        with self.assertNumQueries(0):
+            graphql(self.user, "{ me { name } }")
+
+        graphql(self.user, 'mutation { updateMe(name: "Renamed") { user { name } } }')
+
+        self.assertEqual(
+            graphql(self.user, "{ me { name } }")["data"]["me"]["name"], "Renamed"
+        )
+
+    def test_evicted_version(self):
+        auth.cache.clear()
+        graphql(self.user, "{ me { name } }")
+        User.objects.filter(pk=self.user.pk).update(name="Renamed")
+        auth.invalidate_user(self.user)
+        # the cache drops the version bumped by the change
+        auth.cache.delete(auth.version_key(self.user.email))
+
+        self.assertEqual(
+            graphql(self.user, "{ me { name } }")["data"]["me"]["name"], "Renamed"
+        )
+
+    def test_invalid_token(self):
+        client = Client(HTTP_AUTHORIZATION="JWT invalid")
+        result = client.post(
+            "/graphql/",
+            json.dumps({"query": "{ me { name } bookedDates }"}),
+            content_type="application/json",
+        ).json()
+
+        self.assertEqual(
+            [(error["path"], error["message"]) for error in result["errors"]],
+            [
+                (["me"], "Error decoding signature"),
+                (["bookedDates"], "Error decoding signature"),
+            ],
+        )
+
+
+@fast_hashing
+class MetricsTest(TestCase):
+    def setUp(self):
+        metrics.known_operations.cache_clear()
+
+    def test_operation_label(self):
+        self.assertEqual(metrics.operation_label("OrderCart"), "OrderCart")
+        self.assertEqual(metrics.operation_label(None), "anonymous")
+        self.assertEqual(metrics.operation_label("Random123"), "other")
+
+        documents.register("query Registered { bookedDates }")
+        self.assertEqual(metrics.operation_label("Registered"), "Registered")
+
+    def test_internal(self):
+        for url in ["/metrics/", "/metrics/catalog-cache/"]:
+            with self.subTest(url):
+                self.assertEqual(Client().get(url).status_code, 403)
+                with override_settings(INTERNAL_IPS=["127.0.0.1"]):
+                    self.assertEqual(Client().get(url).status_code, 200)
+
+        user, _ = create_user("staff@larena.test")
+        user.is_staff = True
+        user.save()
+        client = Client()
+        client.force_login(user, backend="django.contrib.auth.backends.ModelBackend")
+        self.assertEqual(client.get("/metrics/").status_code, 200)
+
+
+@fast_hashing
+class TracingTest(TestCase):
+    def setUp(self):
+        self.user, _ = create_user("buyer@larena.test")
+
+    def trace(self):
+        client = Client(
+            HTTP_AUTHORIZATION=f"JWT {get_token(self.user)}", HTTP_X_DEBUG_TRACING="1"
+        )
+        result = client.post(
+            "/graphql/",
+            json.dumps({"query": "{ orders { id } }"}),
+            content_type="application/json",
+        ).json()
+        self.assertEqual(result["data"], {"orders": []})
+        return result.get("extensions", {}).get("tracing")
+
+    def test_only_for_staff(self):
+        self.assertIsNone(self.trace())
+
+        self.user.is_staff = True
+        self.user.save()
+        trace = self.trace()
+
+        resolvers = {
+            tuple(record["path"]): record for record in trace["execution"]["resolvers"]
+        }
+        # the QuerySet of orders is evaluated within the resolver
+        self.assertEqual(resolvers[("orders",)]["sqlQueries"], 1)
+
+    @override_settings(DEBUG=True)
+    def test_debug(self):
+        self.assertIsNotNone(self.trace())
+
+
+@fast_hashing
+class BatchTest(TestCase):
+    def setUp(self):
+        self.user, _ = create_user("buyer@larena.test")
+        self.product = Product.objects.create(
+            name="Ring", price=1000, stock=5, kind="Jewellery"
+        )
+
+    def batch(self, operations):
+        client = Client(HTTP_AUTHORIZATION=f"JWT {get_token(self.user)}")
+        return client.post(
+            "/graphql/", json.dumps(operations), content_type="application/json"
+        )
+
+    def test_operations_share_the_request(self):
+        cart = "{ me { cart { qty } } }"
+        response = self.batch(
+            [
+                {"id": "before", "query": cart},
+                {
+                    "query": SET_CART_ITEMS,
+                    "variables": {"items": [{"productId": self.product.pk, "qty": 2}]},
+                },
+                {"id": "after", "query": cart},
+                {"query": "{ me { missing } }"},
+            ]
+        )
+
+        self.assertEqual(response.status_code, 400)
+        results = response.json()
+        self.assertEqual(results[0]["id"], "before")
+        self.assertEqual(results[0]["data"], {"me": {"cart": []}})
+        self.assertEqual(results[2]["data"], {"me": {"cart": [{"qty": 2}]}})
+        self.assertEqual([result["status"] for result in results], [200, 200, 200, 400])
+        self.assertNotIn("data", results[3])
+
+    @override_settings(GRAPHQL_MAX_BATCH_SIZE=2, GRAPHQL_MAX_BATCH_COST=1)
+    def test_limits(self):
+        self.assertEqual(self.batch([]).status_code, 400)
+        self.assertEqual(self.batch([{"query": "{ bookedDates }"}] * 3).status_code, 400)
+
+        results = self.batch([{"query": "{ me { name } }"}] * 2).json()
+        self.assertEqual(results[0]["extensions"]["complexity"]["batchCost"], 1)
+        self.assertEqual(
+            results[1]["errors"][0]["extensions"]["code"], "BATCH_TOO_COMPLEX"
+        )
+
+
+@fast_hashing
+@override_settings(CATALOG_CACHE_ENABLED=False, AUTH_USER_CACHE_TIMEOUT=0)
+class LoadersTest(TestCase):
+    def setUp(self):
+        self.user, _ = create_user("buyer@larena.test")
+        self.reviewer, _ = create_user("reviewer@larena.test")
+
+    def add_products(self, count):
+        for i in range(count):
+            product = Product.objects.create(
+                name=f"Ring {i}", price=1000, stock=5, kind="Jewellery"
+            )
+            for user in (self.user, self.reviewer):
+                review = Review.objects.create(user=user, product=product, rating=4)
+            counters.like_added(Like.objects.create(user=self.user, review=review))
+
+    def test_reviews_are_batched(self):
+        query = "{ products { stock reviews { likesCount isLiked } } }"
+        self.add_products(1)
+        with CaptureQueriesContext(connection) as one:
+            graphql(self.user, query)
+        self.add_products(9)
+
+        # a query per loader, however many products and reviews are returned
+        with self.assertNumQueries(len(one)):
+            result = graphql(self.user, query)
+        self.assertEqual(len(result["data"]["products"]), 10)
+        for product in result["data"]["products"]:
+            self.assertEqual(product["stock"], 5)
+            self.assertEqual(
+                product["reviews"],
+                [
+                    {"likesCount": 0, "isLiked": False},
+                    {"likesCount": 1, "isLiked": True},
+                ],
+            )
+
+    def test_batch(self):
+        self.add_products(2)
+        reviews = list(Review.objects.order_by("pk").values_list("pk", flat=True))
+        liked = loaders.ExistsLoader(Like.objects.filter(user=self.user), "review_id")
+        rows = loaders.ListLoader(Review.objects.all(), "product_id")
+        product_ids = list(Product.objects.order_by("pk").values_list("pk", flat=True))
+
+        def load(_):
+            # like resolvers, run from a promise so the loads are batched
+            return Promise.all(
+                [liked.load_many(reviews), rows.load_many(product_ids + [0])]
+            )
+
+        with self.assertNumQueries(2):
+            is_liked, grouped = Promise.resolve(None).then(load).get()
+        self.assertEqual(is_liked, [False, True, False, True])
+        self.assertEqual(
+            [[review.pk for review in group] for group in grouped],
+            [reviews[:2], reviews[2:], []],
+        )
+
+
+@fast_hashing
+@override_settings(CATALOG_CACHE_ENABLED=False, AUTH_USER_CACHE_TIMEOUT=0)
+class OptimizerTest(TestCase):
+    def setUp(self):
+        self.user, _ = create_user("buyer@larena.test")
+
+    def add_products(self, count):
+        start = Product.objects.count()
+        for i in range(start, start + count):
+            product = Product.objects.create(
+                name=f"Ring {i}", price=1000, stock=5, kind="Jewellery"
+            )
+            Photo.objects.create(product=product, url=f"https://larena.test/{i}.jpg")
+            reviewer, _ = create_user(f"reviewer{i}@larena.test")
+            Review.objects.create(user=reviewer, product=product, rating=4)
+            CartObj.objects.create(user=self.user, product=product, qty=1)
+
+    def assertQueriesDontGrow(self, query):
+        self.add_products(1)
+        with CaptureQueriesContext(connection) as one:
+            graphql(self.user, query)
+        self.add_products(9)
+        with self.assertNumQueries(len(one)):
+            return graphql(self.user, query)["data"]
+
+    def test_products(self):
+        data = self.assertQueriesDontGrow(
+            "{ products { name photos { url } reviews { rating user { name } } } }"
+        )
+        self.assertEqual(len(data["products"]), 10)
+        self.assertEqual(
+            data["products"][0],
+            {
+                "name": "Ring 0",
+                "photos": [{"url": "https://larena.test/0.jpg"}],
+                "reviews": [{"rating": 4, "user": {"name": "Test"}}],
+            },
+        )
+
+    def test_cart(self):
+        data = self.assertQueriesDontGrow("{ me { cart { qty product { name } } } }")
+        self.assertEqual(
+            sorted(item["product"]["name"] for item in data["me"]["cart"]),
+            [f"Ring {i}" for i in range(10)],
+        )
+
+    def test_only_selected_columns(self):
+        self.add_products(1)
+        with CaptureQueriesContext(connection) as captured:
+            graphql(self.user, "{ products { name } }")
+        (sql,) = [q["sql"] for q in captured if 'FROM "ecommerce_product"' in q["sql"]]
+        self.assertIn('"ecommerce_product"."name"', sql)
+        self.assertNotIn('"ecommerce_product"."description"', sql)
+
+
+SET_CART_ITEMS = """
+mutation SetCartItems($items: [ProductOrderInputType!]!, $mode: CartMode) {
+  setCartItems(items: $items, mode: $mode) { cart { qty product { name } } }
+}
+"""
+
+
+@fast_hashing
+class SetCartItemsTest(TestCase):
+    def setUp(self):
+        self.user, self.address = create_user("buyer@larena.test")
+        self.ring = Product.objects.create(
+            name="Ring", price=1000, stock=5, kind="Jewellery"
+        )
+        self.shirt = Product.objects.create(
+            name="Shirt", price=500, stock=5, kind="Cloth"
+        )
+        self.hat = Product.objects.create(name="Hat", price=200, stock=5, kind="Cloth")
+        CartObj.objects.create(user=self.user, product=self.ring, qty=1)
+        CartObj.objects.create(user=self.user, product=self.shirt, qty=2)
+
+    def set_cart_items(self, items, mode):
+        items = [{"productId": str(product.id), "qty": qty} for product, qty in items]
+        return graphql(self.user, SET_CART_ITEMS, {"items": items, "mode": mode})
+
+    def cart(self):
+        return dict(
+            CartObj.objects.filter(user=self.user).values_list("product__name", "qty")
+        )
+
+    def test_replace(self):
+        result = self.set_cart_items([(self.shirt, 5), (self.hat, 1)], "REPLACE")
+
+        self.assertEqual(
+            sorted(
+                (row["product"]["name"], row["qty"])
+                for row in result["data"]["setCartItems"]["cart"]
+            ),
+            [("Hat", 1), ("Shirt", 5)],
+        )
+        self.assertEqual(self.cart(), {"Shirt": 5, "Hat": 1})
+
+    def test_merge(self):
+        self.set_cart_items([(self.ring, 2), (self.shirt, -2), (self.hat, 1)], "MERGE")
+
+        self.assertEqual(self.cart(), {"Ring": 3, "Hat": 1})
+
+    def test_unknown_product(self):
+        result = graphql(
+            self.user,
+            SET_CART_ITEMS,
+            {"items": [{"productId": "0", "qty": 1}], "mode": "MERGE"},
+        )
+
+        self.assertEqual(result["errors"][0]["message"], "Product 0 does not exist")
+        self.assertEqual(self.cart(), {"Ring": 1, "Shirt": 2})
+
+
+SET_CART = """
+mutation SetCart($productId: String!, $qty: Int!) {
+  setCart(cartObj: {productId: $productId, qty: $qty}) { cart { qty } }
+}
+"""
+
+
+@fast_hashing
+class InventoryTest(TestCase):
+    def setUp(self):
+        self.user, self.address = create_user("buyer@larena.test")
+        self.other, _ = create_user("other@larena.test")
+        self.ring = Product.objects.create(
+            name="Ring", price=1000, stock=5, kind="Jewellery"
+        )
+
+    def set_cart(self, user, qty):
+        return graphql(user, SET_CART, {"productId": str(self.ring.id), "qty": qty})
+
+    def available(self):
+        result = graphql(
+            self.user,
+            "query($id: String) { product(id: $id) { availableStock } }",
+            {"id": str(self.ring.id)},
+        )
+        return result["data"]["product"]["availableStock"]
+
+    def test_cart_holds_stock(self):
+        self.set_cart(self.user, 4)
+        self.assertEqual(self.available(), 1)
+
+        result = self.set_cart(self.other, 2)
+        self.assertEqual(result["errors"][0]["message"], "Stock Error")
+        self.assertFalse(CartObj.objects.filter(user=self.other).exists())
+
+        self.set_cart(self.user, 1)
+        self.assertEqual(self.available(), 4)
+
+    def test_admin_restocks_by_delta(self):
+        self.set_cart(self.user, 1)
+        with transaction.atomic():
+            inventory.convert(self.other, [(self.ring, 2)])
+        self.user.is_staff = self.user.is_superuser = True
+        self.user.save()
+        client = Client()
+        client.force_login(self.user, backend="django.contrib.auth.backends.ModelBackend")
+        url = f"/admin/ecommerce/product/{self.ring.pk}/change/"
+
+        self.assertContains(client.get(url), '<div class="readonly">3</div>')
+
+        def save(restock):
+            fields = {"name": "Ring", "price": 1000, "discount": 0, "kind": "Jewellery"}
+            response = client.post(
+                url, {**fields, "description": "Gold", "restock": restock}
+            )
+            self.assertEqual(response.status_code, 302)
+
+        # saving the product doesn't bring the units sold back
+        save("")
+        self.assertEqual(inventory.on_hand([self.ring.pk]), {self.ring.pk: 3})
+        save(4)
+        self.assertEqual(inventory.on_hand([self.ring.pk]), {self.ring.pk: 7})
+        self.assertEqual(self.available(), 6)
+
+    def test_expired_holds_are_released(self):
+        self.set_cart(self.user, 5)
+        StockHold.objects.update(expires_at=timezone.now())
+
+        call_command("release_expired_holds", stdout=StringIO())
+
+        self.assertFalse(StockHold.objects.exists())
+        self.assertEqual(self.available(), 5)
+
+    def test_expired_holds_are_reclaimed(self):
+        self.set_cart(self.user, 4)
+        self.set_cart(self.other, 1)
+        StockHold.objects.update(expires_at=timezone.now())
+
+        # without the sweep, the expired holds of other users come back
+        self.assertNotIn("errors", self.set_cart(self.other, 3))
+        self.assertFalse(StockHold.objects.filter(user=self.user).exists())
+        self.assertEqual(
+            StockHold.objects.filter(user=self.other).aggregate(Sum("qty")),
+            {"qty__sum": 3},
+        )
+        self.assertEqual(self.available(), 2)
+
+    def test_own_expired_holds_are_extended(self):
+        self.set_cart(self.user, 2)
+        StockHold.objects.update(expires_at=timezone.now())
+
+        self.set_cart(self.user, 4)
+
+        self.assertEqual(
+            StockHold.objects.filter(expires_at__gt=timezone.now()).aggregate(Sum("qty")),
+            {"qty__sum": 4},
+        )
+        self.assertEqual(self.available(), 1)
+
+    def test_checkout_converts_holds(self):
+        self.set_cart(self.user, 5)
+
+        result = graphql(self.user, ORDER_CART, {"addressId": str(self.address.id)})
+
+        self.assertNotIn("errors", result)
+        self.assertFalse(StockHold.objects.exists())
+        self.assertEqual(self.available(), 0)
+        result = graphql(
+            self.user,
+            "query($id: String) { product(id: $id) { stock } }",
+            {"id": str(self.ring.id)},
+        )
+        self.assertEqual(result["data"]["product"]["stock"], 0)
+        # the product row isn't locked by orders
+        self.assertEqual(Product.objects.get(pk=self.ring.pk).stock, 5)
+
+    def test_saving_keeps_sold_units(self):
+        checkout.order_product(self.user, self.address, self.ring.pk, 2)
+
+        product = Product.objects.get(pk=self.ring.pk)
+        product.price = 900
+        product.save()
+
+        self.assertEqual(self.available(), 3)
+
+    def test_restock(self):
+        self.set_cart(self.user, 2)
+        self.ring.stock = 8
+        self.ring.save()
+
+        self.assertEqual(self.available(), 6)
+        self.assertEqual(StockSlot.objects.filter(product=self.ring).count(), 8)
+
+
+BOOK_APPOINTMENT = """
+mutation BookAppointment($timestamp: DateTime) {
+  bookAppointment(timestamp: $timestamp) { appointment { date slot } }
+}
+"""
+
+AVAILABLE_SLOTS = """
+query AvailableSlots($from: Date!, $to: Date!) {
+  availableSlots(from: $from, to: $to) { date available }
+}
+"""
+
+
+@fast_hashing
+class AppointmentTest(TestCase):
+    def setUp(self):
+        self.user, _ = create_user("buyer@larena.test")
+        self.day = timezone.localdate() + datetime.timedelta(days=10)
+
+    def book(self, hour):
+        timestamp = datetime.datetime.combine(
+            self.day, datetime.time(hour, tzinfo=datetime.timezone.utc)
+        )
+        return graphql(self.user, BOOK_APPOINTMENT, {"timestamp": timestamp.isoformat()})
+
+    def available(self):
+        result = graphql(
+            self.user,
+            AVAILABLE_SLOTS,
+            {"from": self.day.isoformat(), "to": self.day.isoformat()},
+        )
+        return result["data"]["availableSlots"]
+
+    def test_one_booking_per_day(self):
+        self.assertEqual(
+            self.available(), [{"date": self.day.isoformat(), "available": 1}]
+        )
+        self.assertNotIn("errors", self.book(10))
+
+        self.assertEqual(self.book(12)["errors"][0]["message"], "No slot on that day!")
+        self.assertEqual(self.available(), [])
+
+    @override_settings(APPOINTMENT_SLOTS_PER_DAY=2)
+    def test_slots_per_day(self):
+        self.assertEqual(
+            self.book(10)["data"]["bookAppointment"]["appointment"],
+            {"date": self.day.isoformat(), "slot": 0},
+        )
+        self.assertEqual(
+            self.available(), [{"date": self.day.isoformat(), "available": 1}]
+        )
+        self.assertEqual(
+            self.book(12)["data"]["bookAppointment"]["appointment"]["slot"], 1
+        )
+
+    @override_settings(
+        APPOINTMENT_SLOTS_PER_DAY=2, ADMINS=[("Admin", "admin@larena.test")]
+    )
+    def test_emails_are_queued_with_the_booking(self):
+        self.assertNotIn("errors", self.book(10))
+        self.assertEqual(
+            sorted(OutboxEmail.objects.values_list("recipients", flat=True)),
+            [["admin@larena.test"], ["buyer@larena.test"]],
+        )
+
+        with mock.patch.object(outbox, "mail_admins", side_effect=Exception("Down")):
+            self.assertEqual(self.book(12)["errors"][0]["message"], "Down")
+        self.assertEqual(Appointment.objects.count(), 1)
+        self.assertEqual(OutboxEmail.objects.count(), 2)
+
+    @override_settings(APPOINTMENT_TIME_ZONE="Europe/London")
+    def test_email_in_the_appointment_time_zone(self):
+        self.day = datetime.date(2030, 1, 15)
+        self.assertNotIn("errors", self.book(10))
+        self.assertIn(
+            "Your appointment is at 10:00 on Tuesday, 15th January",
+            OutboxEmail.objects.get(recipients=[self.user.email]).body,
+        )
+
+
+@override_settings(
+    OUTBOX_IN_PROCESS=False,
+    OUTBOX_RETRY_DELAY=30,
+    OUTBOX_MAX_ATTEMPTS=3,
+    EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend",
+)
+class OutboxTest(TestCase):
+    def queue(self, count=1):
+        for i in range(count):
+            outbox.send_mail(f"Order {i}", "Thanks", None, ["buyer@larena.test"])
+
+    def failing(self):
+        return mock.patch(
+            "django.core.mail.backends.locmem.EmailBackend.send_messages",
+            side_effect=Exception("SMTP down"),
+        )
+
+    def test_delivery(self):
+        self.queue()
+        self.assertEqual(outbox.deliver(), 1)
+
+        self.assertEqual([message.subject for message in mail.outbox], ["Order 0"])
+        email = OutboxEmail.objects.get()
+        self.assertEqual((email.status, email.attempts), (OutboxEmail.Status.SENT, 1))
+        self.assertEqual(outbox.deliver(), 0)
+
+    def test_queued_with_the_transaction(self):
+        with self.assertRaises(Exception), transaction.atomic():
+            self.queue()
+            raise Exception("Rolled back")
+        self.assertFalse(OutboxEmail.objects.exists())
+
+    def test_retry_backoff(self):
+        self.queue()
+        for attempt, delay in ((1, 30), (2, 60)):
+            with self.failing():
+                start = timezone.now()
+                outbox.deliver()
+            email = OutboxEmail.objects.get()
+            self.assertEqual(email.status, OutboxEmail.Status.PENDING)
+            self.assertEqual(email.attempts, attempt)
+            self.assertEqual(email.last_error, "SMTP down")
+            self.assertGreaterEqual(
+                email.next_attempt_at, start + datetime.timedelta(seconds=delay)
+            )
+            # not due yet
+            self.assertEqual(outbox.deliver(), 0)
+            OutboxEmail.objects.update(next_attempt_at=timezone.now())
+
+        outbox.deliver()
+        self.assertEqual(OutboxEmail.objects.get().status, OutboxEmail.Status.SENT)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_failed_after_max_attempts(self):
+        self.queue()
+        with self.failing():
+            for _ in range(3):
+                outbox.deliver()
+                OutboxEmail.objects.update(next_attempt_at=timezone.now())
+
+        email = OutboxEmail.objects.get()
+        self.assertEqual((email.status, email.attempts), (OutboxEmail.Status.FAILED, 3))
+        self.assertEqual(outbox.deliver(), 0)
+        self.assertEqual(mail.outbox, [])
+
+    def test_worker_schedules_the_retry(self):
+        worker = outbox.Worker()
+        self.queue()
+        with self.failing():
+            outbox.deliver()
+        with mock.patch.object(outbox.threading, "Timer") as timer:
+            worker.schedule_retry()
+            worker.schedule_retry()
+
+        # a single timer, kicking the worker when the email is due
+        timer.assert_called_once()
+        delay, kick = timer.call_args[0]
+        self.assertAlmostEqual(delay, 30, delta=5)
+        self.assertEqual(kick, worker.kick)
+
+    @override_settings(OUTBOX_BATCH_SIZE=2)
+    def test_drain_command(self):
+        self.queue(5)
+        out = StringIO()
+        call_command("drain_outbox", stdout=out)
+
+        self.assertEqual(out.getvalue(), "Processed 5 emails\n")
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertFalse(
+            OutboxEmail.objects.exclude(status=OutboxEmail.Status.SENT).exists()
+        )
+
+
+@fast_hashing
+@override_settings(OUTBOX_IN_PROCESS=False)
+class ConcurrentCheckoutTest(TransactionTestCase):
+    buyers = 200
+    stock = 25
+
+    def test_no_oversell(self):
+        product = Product.objects.create(
+            name="Limited", price=100, stock=self.stock, kind="Jewellery"
+        )
+        buyers = []
+        for i in range(self.buyers):
+            user, address = create_user(f"buyer{i}@larena.test")
+            CartObj.objects.create(user=user, product=product, qty=1)
+            buyers.append((user, address))
+
+        def checkout(buyer):
+            user, address = buyer
+            try:
+                return graphql(user, ORDER_CART, {"addressId": str(address.id)})
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            results = list(pool.map(checkout, buyers))
+
+        succeeded = [result for result in results if not result.get("errors")]
+        on_hand = inventory.on_hand([product.pk])[product.pk]
+        self.assertGreaterEqual(on_hand, 0)
+        self.assertEqual(len(succeeded), self.stock - on_hand)
+        self.assertEqual(Order.objects.count(), len(succeeded))
+        self.assertEqual(OrderObj.objects.count(), len(succeeded))
+
+
+# served by AsyncViewTest, backend.urls picks the view from GRAPHQL_ASYNC
+urlpatterns = [path("graphql/", AsyncGraphQLView.as_view())]
+
+
+@fast_hashing
+@override_settings(ROOT_URLCONF="ecommerce.tests", CATALOG_CACHE_ENABLED=False)
+class AsyncViewTest(TransactionTestCase):
+    # the async view queries the database from worker threads, so the data
+    # must be committed
+
+    def setUp(self):
+        self.user, self.address = create_user("buyer@larena.test")
+        self.product = Product.objects.create(
+            name="Ring", price=1000, stock=5, kind="Jewellery"
+        )
+        Photo.objects.create(product=self.product, url="ring.jpg")
+        CartObj.objects.create(user=self.user, product=self.product, qty=2)
+        order = Order.objects.create(
+            user=self.user,
+            name="Test",
+            phone="9999999999",
+            address1="Street",
+            address2="Area",
+            pincode=110001,
+            city="Delhi",
+            state="Delhi",
+            country="India",
+        )
+        OrderObj.objects.create(order=order, product=self.product, qty=1, price=1000)
+
+    async def query(self, query):
+        response = await AsyncClient().post(
+            "/graphql/",
+            json.dumps({"query": query}),
+            content_type="application/json",
+            AUTHORIZATION=f"JWT {get_token(self.user)}",
+        )
+        return response.json()["data"]
+
+    async def test_orders(self):
+        self.assertEqual(
+            await self.query("{ orders { productObjects { qty product { name } } } }"),
+            {"orders": [{"productObjects": [{"qty": 1, "product": {"name": "Ring"}}]}]},
+        )
+
+    async def test_me(self):
+        self.assertEqual(
+            await self.query("{ me { name cart { qty product { name } } } }"),
+            {"me": {"name": "Test", "cart": [{"qty": 2, "product": {"name": "Ring"}}]}},
+        )
+
+    async def test_products(self):
+        self.assertEqual(
+            await self.query("{ products { name photos { url } } }"),
+            {"products": [{"name": "Ring", "photos": [{"url": "ring.jpg"}]}]},
+        )
+
+
+ADD_REVIEW = """
+mutation AddReview($productId: String, $rating: Int) {
+  addReview(productId: $productId, rating: $rating, text: "Nice") { id }
+}
+"""
+
+
+@fast_hashing
+class CountersTest(TestCase):
+    def setUp(self):
+        self.user, _ = create_user("buyer@larena.test")
+        self.other, _ = create_user("other@larena.test")
+        self.ring = Product.objects.create(name="Ring", price=1000, kind="Jewellery")
+
+    def mutate(self, user, mutation, variables):
+        result = graphql(user, mutation, variables)
+        self.assertNotIn("errors", result)
+        return result["data"]
+
+    def add_review(self, user, rating):
+        variables = {"productId": str(self.ring.pk), "rating": rating}
+        return self.mutate(user, ADD_REVIEW, variables)["addReview"]["id"]
+
+    def set_like(self, user, review_id, like=True):
+        name = "likeReview" if like else "unlikeReview"
+        mutation = f"mutation($id: String) {{ {name}(reviewId: $id) {{ id }} }}"
+        self.mutate(user, mutation, {"id": review_id})
+
+    def delete_review(self, user, review_id):
+        mutation = "mutation($id: String) { deleteReview(reviewId: $id) { id } }"
+        self.mutate(user, mutation, {"id": review_id})
+
+    def counters(self):
+        self.ring.refresh_from_db()
+        return self.ring.review_count, self.ring.rating_sum
+
+    def test_mutations(self):
+        first = self.add_review(self.user, 4)
+        second = self.add_review(self.other, 2)
+        self.assertEqual(self.counters(), (2, 6))
+
+        self.set_like(self.user, second)
+        self.set_like(self.other, second)
+        self.assertEqual(Review.objects.get(pk=second).likes_count, 2)
+        self.set_like(self.user, second, like=False)
+        self.assertEqual(Review.objects.get(pk=second).likes_count, 1)
+
+        self.delete_review(self.user, first)
+        self.assertEqual(self.counters(), (1, 2))
+        self.assertEqual(counters.recompute(fix=False), {"product": 0, "review": 0})
+
+    def test_concurrent_deletes(self):
+        review_id = self.add_review(self.user, 4)
+        self.set_like(self.other, review_id)
+
+        def deleted_first(model, remove):
+            # another request deletes the row between the get() and the delete()
+            delete = model.delete
+
+            def concurrent_delete(obj, *args, **kwargs):
+                model.objects.filter(pk=obj.pk).delete()
+                remove(obj)
+                return delete(obj, *args, **kwargs)
+
+            return mock.patch.object(model, "delete", concurrent_delete)
+
+        with deleted_first(Like, counters.like_removed):
+            self.set_like(self.other, review_id, like=False)
+        self.assertEqual(Review.objects.get(pk=review_id).likes_count, 0)
+
+        with deleted_first(Review, counters.review_removed):
+            self.delete_review(self.user, review_id)
+        self.assertEqual(self.counters(), (0, 0))
+
+    def test_recompute_command(self):
+        review_id = self.add_review(self.user, 5)
+        self.set_like(self.other, review_id)
+        Product.objects.update(review_count=3, rating_sum=1)
+        Review.objects.update(likes_count=0)
+
+        out = StringIO()
+        call_command("recompute_counters", "--dry-run", stdout=out)
+        self.assertIn("product: 1 drifted rows found", out.getvalue())
+        self.assertEqual(self.counters(), (3, 1))
+
+        call_command("recompute_counters", stdout=StringIO())
+        self.assertEqual(self.counters(), (1, 5))
+        self.assertEqual(Review.objects.get(pk=review_id).likes_count, 1)
+
+
+@override_settings(DATABASE_HEALTH_CHECKS=True)
+class HealthCheckTest(TransactionTestCase):
+    # connections are never checked inside the atomic block of a TestCase
+
+    def setUp(self):
+        connection.ensure_connection()
+        patcher = mock.patch.object(
+            type(connections[DEFAULT_DB_ALIAS]),
+            "is_usable",
+            autospec=True,
+            return_value=True,
+        )
+        self.is_usable = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def checked(self):
+        return [call[0][0] for call in self.is_usable.call_args_list]
+
+    @mock.patch.dict(connection.settings_dict, {"CONN_MAX_AGE": 60})
+    def test_once_per_request(self):
+        request_started.send(sender=None)
+        db.check_connections()
+        self.assertEqual(self.checked(), [connections[DEFAULT_DB_ALIAS]])
+
+        request_started.send(sender=None)
+        self.assertEqual(len(self.checked()), 2)
+
+        self.is_usable.return_value = False
+        with mock.patch.object(type(connections[DEFAULT_DB_ALIAS]), "close") as close:
+            request_started.send(sender=None)
+        close.assert_called_with()
+
+    def test_not_persistent(self):
+        request_started.send(sender=None)
+        self.assertEqual(self.checked(), [])
+
+    async def test_async_hops(self):
+        def query():
+            # opened during the request, no need to check it on the next hop
+            with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+                cursor.execute("SELECT 1")
+            return connections[DEFAULT_DB_ALIAS]
+
+        with mock.patch.dict(connection.settings_dict, {"CONN_MAX_AGE": 60}):
+            await database_sync_to_async(request_started.send)(sender=None)
+            hops = [await database_sync_to_async(query)() for _ in range(5)]
+        # connections left open by earlier requests are checked once
+        checked = self.checked()
+        self.assertEqual(len(checked), len(set(checked)))
+        self.assertLessEqual(set(checked), set(hops) | {connections[DEFAULT_DB_ALIAS]})
+
+
+class WorkloadTest(TestCase):
+    def test_seed(self):
+        created = workload.seed(
+            products=20, users=5, reviews=60, likes=200, orders=10, batch_size=7
+        )
+
+        self.assertEqual(created["order_obj"], 30)
+        self.assertEqual(Like.objects.count(), 200)
+        self.assertEqual(counters.recompute(fix=False), {"product": 0, "review": 0})
+        self.assertEqual(
+            StockSlot.objects.aggregate(total=Sum("available"))["total"], 20 * 1000
+        )
+
+        user = User.objects.order_by("pk").first()
+        address = Address.objects.get(user=user)
+        product = Product.objects.first()
+        documents = workload.operations()
+        for name in workload.VISIT:
+            variables = workload.operation_variables(name, product.pk, address.pk)
+            self.assertNotIn("errors", graphql(user, documents[name], variables), name)
+
+
+def operation_queries(cart_size, **volumes):
+    """
+    Seeds `volumes` of data and returns the number of SQL queries of every
+    operation, visiting as the first seeded user with `cart_size` products in
+    the cart. The data is rolled back afterwards.
+    """
+    documents = workload.operations()
+    queries = {}
+    with transaction.atomic():
+        workload.seed(**volumes)
+        user = User.objects.filter(email__startswith="bench").order_by("pk").first()
+        address = Address.objects.get(user=user)
+        product_ids = list(
+            Product.objects.order_by("-pk").values_list("pk", flat=True)[
+                : volumes["products"]
+            ]
+        )
+        checkout.set_cart_items(user, [(pk, 1) for pk in product_ids[1 : cart_size + 1]])
+        for name in workload.VISIT:
+            variables = workload.operation_variables(name, product_ids[0], address.pk)
+            with CaptureQueriesContext(connection) as captured:
+                result = graphql(user, documents[name], variables)
+            assert "errors" not in result, (name, result)
+            queries[name] = len(captured)
+        transaction.set_rollback(True)
+    return queries
+
+
+@fast_hashing
+@override_settings(CATALOG_CACHE_ENABLED=False, AUTH_USER_CACHE_TIMEOUT=0)
+class QueryBudgetTest(TestCase):
+    """
+    Runs every operation of ecommerce/operations on a small and a 10 times larger
+    dataset. Their queries must not grow with the rows they return, and must stay
+    within the budgets of operations/query_budgets.json. To change the budgets
+    on purpose, run the test with UPDATE_QUERY_BUDGETS=1.
+    """
+
+    def test_operations(self):
+        small = operation_queries(
+            2, products=4, users=2, reviews=8, likes=16, orders=4, items_per_order=2
+        )
+        large = operation_queries(
+            20, products=40, users=10, reviews=400, likes=1000, orders=100
+        )
+        if os.environ.get("UPDATE_QUERY_BUDGETS"):
+            with open(workload.QUERY_BUDGETS, "w") as f:
+                json.dump(large, f, indent=2, sort_keys=True)
+                f.write("\n")
+
+        with open(workload.QUERY_BUDGETS) as f:
+            budgets = json.load(f)
+        self.assertEqual(sorted(budgets), sorted(workload.operations()))
+        for name in workload.VISIT:
+            with self.subTest(name):
+                self.assertEqual(
+                    large[name],
+                    small[name],
+                    f"the queries of {name} grow with the number of rows",
+                )
+                self.assertLessEqual(
+                    large[name], budgets[name], f"{name} is over its query budget"
+                )
+
+
+@override_settings(DATABASE_REPLICAS=["replica1", "replica2"])
+class ReplicaRouterTest(SimpleTestCase):
+    def setUp(self):
+        self.router = routers.ReplicaRouter()
+        self.request = RequestFactory().post("/graphql/")
+        routers._unavailable.clear()
+        available = mock.patch.object(routers, "is_available", return_value=True)
+        self.is_available = available.start()
+        self.addCleanup(available.stop)
+
+    def read(self, operation_type="query", request=None):
+        with routers.route_request(request or self.request, operation_type):
+            return [self.router.db_for_read(Product) for i in range(2)]
+
+    def test_round_robin(self):
+        first, second = self.read(), self.read()
+        self.assertEqual(first[0], first[1])
+        self.assertEqual({first[0], second[0]}, {"replica1", "replica2"})
+
+    def test_failover(self):
+        self.is_available.side_effect = lambda alias: alias == "replica2"
+        self.assertEqual(self.read(), ["replica2", "replica2"])
+        self.is_available.return_value = False
+        self.is_available.side_effect = None
+        self.assertEqual(self.read(), [DEFAULT_DB_ALIAS, DEFAULT_DB_ALIAS])
+
+    def test_primary_after_write(self):
+        with routers.route_request(self.request, "query"):
+            self.assertIn(self.router.db_for_read(Product), ["replica1", "replica2"])
+            self.assertEqual(self.router.db_for_write(Product), DEFAULT_DB_ALIAS)
+            self.assertEqual(self.router.db_for_read(Product), DEFAULT_DB_ALIAS)
+
+    @override_settings(DATABASE_READ_YOUR_WRITES_WINDOW=5)
+    def test_read_your_writes(self):
+        response = HttpResponse()
+        routers.pin_response(self.request, response)
+        self.assertFalse(response.cookies)
+
+        # outside of a transaction, pinned right away
+        with mock.patch.object(routers.transaction, "on_commit", lambda func: func()):
+            routers.pin_to_primary(self.request)
+        routers.pin_response(self.request, response)
+        cookie = response.cookies[routers.PIN_COOKIE]
+        self.assertEqual(cookie["max-age"], 5)
+
+        request = RequestFactory().post("/graphql/")
+        request.COOKIES[routers.PIN_COOKIE] = cookie.value
+        self.assertEqual(self.read(request=request), [DEFAULT_DB_ALIAS, DEFAULT_DB_ALIAS])
+        with mock.patch("django.core.signing.time.time", return_value=time.time() + 6):
+            self.assertNotEqual(self.read(request=request)[0], DEFAULT_DB_ALIAS)
+
+        request.COOKIES[routers.PIN_COOKIE] = "1"
+        self.assertNotEqual(self.read(request=request)[0], DEFAULT_DB_ALIAS)
+
+    @override_settings(ROOT_URLCONF="ecommerce.tests")
+    async def test_async_view_pins(self):
+        async def execute(view, request, *args):
+            routers.pin_to_primary(request)
+            return ExecutionResult(data={"setCart": None})
+
+        with mock.patch.object(
+            AsyncGraphQLView, "execute_graphql_request_async", execute
+        ), mock.patch.object(routers.transaction, "on_commit", lambda func: func()):
+            response = await AsyncClient().post(
+                "/graphql/",
+                json.dumps({"query": "mutation { setCart }"}),
+                content_type="application/json",
+            )
+
+        self.assertEqual(response.json(), {"data": {"setCart": None}})
+        self.assertIn(routers.PIN_COOKIE, response.cookies)
+
+    def test_mutations_read_the_primary(self):
+        self.assertEqual(self.read("mutation"), [DEFAULT_DB_ALIAS, DEFAULT_DB_ALIAS])
+        self.assertEqual(self.router.db_for_read(Product), DEFAULT_DB_ALIAS)
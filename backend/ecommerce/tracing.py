@@ -0,0 +1,165 @@
+import time
+from contextlib import ExitStack, contextmanager
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import connections
+from promise import Promise, is_thenable
+
+from . import auth, metrics
+from .asynchronous import evaluate
+
+
+def get_setting(name, default):
+    return getattr(settings, f"GRAPHQL_TRACING_{name}", default)
+
+
+def has_header(request):
+    header = get_setting("HEADER", "X-Debug-Tracing")
+    return bool(header) and f"HTTP_{header.upper().replace('-', '_')}" in request.META
+
+
+def is_requested(request):
+    """
+    Whether the request asked for its trace, which is only returned with DEBUG
+    or to staff users as it reveals the timings and queries of the server.
+    """
+    if not has_header(request):
+        return False
+    if settings.DEBUG:
+        return True
+    return auth.authenticate_request(request) and request.user.is_staff
+
+
+class Tracer:
+    """
+    Times the resolvers of a single request and counts the SQL queries issued
+    while each of them runs. Queries issued outside of any resolver, like the
+    batches of DataLoaders, are only counted in the totals.
+    """
+
+    def __init__(self, requested=False):
+        # whether the client asked for the trace in the response
+        self.requested = requested
+        self.start_time = datetime.now(timezone.utc)
+        self.start = time.perf_counter_ns()
+        self.resolvers = []
+        self.stack = []
+        self.queries = 0
+        self.sql_duration = 0
+
+    def offset(self):
+        return time.perf_counter_ns() - self.start
+
+    def execute_sql(self, execute, sql, params, many, context):
+        start = time.perf_counter_ns()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter_ns() - start
+            self.queries += 1
+            self.sql_duration += duration
+            for record in self.stack:
+                record["sqlQueries"] += 1
+                record["sqlDuration"] += duration
+
+    def resolve(self, next, root, info, args):
+        record = {
+            "path": list(info.path),
+            "parentType": info.parent_type.name,
+            "fieldName": info.field_name,
+            "returnType": str(info.return_type),
+            "startOffset": self.offset(),
+            "duration": 0,
+            "sqlQueries": 0,
+            "sqlDuration": 0,
+        }
+        self.resolvers.append(record)
+        self.stack.append(record)
+        try:
+            result = next(root, info, **args)
+            if isinstance(result, Promise) and result.is_fulfilled:
+                # a lazy QuerySet would only query once the executor iterates
+                # it, after the resolver's span
+                result = Promise.resolve(evaluate(result.get()))
+        except Exception:
+            self.finish(record)
+            raise
+        finally:
+            self.stack.pop()
+        # resolvers are wrapped in promises, most of them already settled
+        if not is_thenable(result) or not getattr(result, "is_pending", True):
+            self.finish(record)
+            return result
+
+        def resolved(value):
+            self.finish(record)
+            return value
+
+        def rejected(error):
+            self.finish(record)
+            raise error
+
+        return Promise.resolve(result).then(resolved, rejected)
+
+    def finish(self, record):
+        record["duration"] = self.offset() - record["startOffset"]
+
+    def observe(self):
+        for record in self.resolvers:
+            field = f"{record['parentType']}.{record['fieldName']}"
+            metrics.RESOLVER_DURATION.labels(field).observe(record["duration"] / 1e9)
+            metrics.RESOLVER_QUERIES.labels(field).observe(record["sqlQueries"])
+
+    def report(self):
+        """Returns the trace in the Apollo tracing format."""
+        duration = self.offset()
+        end_time = datetime.now(timezone.utc)
+        return {
+            "version": 1,
+            "startTime": self.start_time.isoformat(),
+            "endTime": end_time.isoformat(),
+            "duration": duration,
+            "execution": {
+                "resolvers": self.resolvers,
+                "sqlQueries": self.queries,
+                "sqlDuration": self.sql_duration,
+            },
+        }
+
+
+@contextmanager
+def trace(request):
+    """
+    Traces the GraphQL execution run inside the block when metrics collection
+    is enabled or the request asked for its trace, yielding the Tracer or None.
+    """
+    collect = get_setting("ENABLED", False)
+    requested = is_requested(request)
+    if not (collect or requested):
+        yield None
+        return
+
+    tracer = request.tracer = Tracer(requested)
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(tracer.execute_sql))
+            yield tracer
+    finally:
+        del request.tracer
+    if collect:
+        tracer.observe()
+
+
+class TracingMiddleware:
+    """
+    Graphene middleware timing every resolver of traced requests. The view only
+    installs it for those, so untraced requests don't pay for the extra call.
+    """
+
+    def resolve(self, next, root, info, **args):
+        tracer = getattr(info.context, "tracer", None)
+        if tracer is None:
+            return next(root, info, **args)
+        return tracer.resolve(next, root, info, args)
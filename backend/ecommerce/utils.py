@@ -1,5 +0,0 @@
-import threading
-
-
-def run_async(func, args):
-    threading.Thread(target=func, args=args).start()
\ No newline at end of file
@@ -1,3 +1,270 @@
-from django.shortcuts import render
+import time
+from functools import update_wrapper, wraps
 
-# Create your views here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import (
+    HttpResponse,
+    HttpResponseBadRequest,
+    HttpResponseForbidden,
+    JsonResponse,
+)
+from graphene_django.views import GraphQLView as BaseGraphQLView
+from graphene_django.views import HttpError
+from graphql.execution import ExecutionResult
+from prometheus_client import CONTENT_TYPE_LATEST
+from promise import is_thenable
+
+from . import auth, cache, complexity, documents, metrics, responses, routers, tracing
+from .asynchronous import (
+    ThreadedAsyncioExecutor,
+    database_sync_to_async,
+    get_running_loop,
+)
+
+
+class GraphQLView(BaseGraphQLView):
+    """
+    GraphQL endpoint with parsed document caching, automatic persisted queries
+    and the complexity of each operation in the response extensions.
+
+    A JSON array of operations is executed as a batch, one after the other in
+    the same request so they share its authentication, DataLoaders and
+    database connection.
+    """
+
+    def get_backend(self, request):
+        return documents.backend
+
+    def dispatch(self, request, *args, **kwargs):
+        response = super().dispatch(request, *args, **kwargs)
+        routers.pin_response(request, response)
+        if response.get("Content-Type") != "application/json":
+            # GraphiQL
+            return response
+        return responses.finalize(request, response)
+
+    def parse_body(self, request):
+        if (
+            self.get_content_type(request) != "application/json"
+            or request.body.lstrip()[:1] != b"["
+        ):
+            return super().parse_body(request)
+
+        # a fresh view handles every request
+        self.batch = True
+        data = super().parse_body(request)
+        max_size = complexity.get_setting("MAX_BATCH_SIZE", 10)
+        if not data:
+            raise HttpError(HttpResponseBadRequest("Batch must contain an operation."))
+        if len(data) > max_size:
+            raise HttpError(
+                HttpResponseBadRequest(
+                    f"Batch of {len(data)} operations exceeds the maximum of {max_size}"
+                )
+            )
+        if not all(isinstance(entry, dict) for entry in data):
+            raise HttpError(HttpResponseBadRequest("Batch entries must be JSON queries."))
+        request.batch_cost = 0
+        return data
+
+    def json_encode(self, request, d, pretty=False):
+        if pretty or self.pretty or request.GET.get("pretty"):
+            return super().json_encode(request, d, pretty)
+        content = responses.get_encoder()(d)
+        # the base dispatch joins the results of a batch as text
+        return content.decode() if self.batch else content
+
+    def get_middleware(self, request):
+        skipped = ()
+        if getattr(request, "tracer", None) is None:
+            skipped += (tracing.TracingMiddleware,)
+        if auth.authenticate_request(request):
+            skipped += (auth.JSONWebTokenMiddleware,)
+        return [m for m in self.middleware if not isinstance(m, skipped)]
+
+    def execute_graphql_request(
+        self, request, data, query, variables, operation_name, show_graphiql=False
+    ):
+        extensions = request.GET.get("extensions") or data.get("extensions")
+        try:
+            query = documents.resolve_query(query, extensions)
+        except documents.PersistedQueryError as e:
+            return ExecutionResult(errors=[e])
+        operation_type = self.get_operation_type(request, query, operation_name)
+        start = time.perf_counter()
+        with tracing.trace(request) as tracer, routers.route_request(
+            request, operation_type
+        ):
+            result = super().execute_graphql_request(
+                request, data, query, variables, operation_name, show_graphiql
+            )
+        metrics.observe_operation(
+            self.schema, operation_name, result, time.perf_counter() - start
+        )
+        if self.batch and operation_type == "mutation":
+            # the next operations of the batch must not see rows cached before it,
+            # by the loaders or prefetched on the shared user
+            request.loaders = None
+            prefetched = getattr(request.user, "_prefetched_objects_cache", None)
+            if prefetched:
+                prefetched.clear()
+        if tracer is not None and tracer.requested and result is not None:
+            result.extensions["tracing"] = tracer.report()
+        return result
+
+    def get_operation_type(self, request, query, operation_name):
+        try:
+            document = self.get_backend(request).document_from_string(self.schema, query)
+        except Exception:
+            # reported by the base view
+            return None
+        return document.get_operation_type(operation_name)
+
+    def get_response(self, request, data, show_graphiql=False):
+        query, variables, operation_name, id = self.get_graphql_params(request, data)
+
+        execution_result = self.execute_graphql_request(
+            request, data, query, variables, operation_name, show_graphiql
+        )
+        return self.format_result(request, execution_result, id, show_graphiql)
+
+    def format_result(self, request, execution_result, id=None, show_graphiql=False):
+        # same as the base view's get_response, with the extensions of the result
+        if not execution_result:
+            return None, 200
+
+        status_code = 200
+        response = {}
+        if execution_result.errors:
+            response["errors"] = [self.format_error(e) for e in execution_result.errors]
+        if execution_result.invalid:
+            status_code = 400
+        else:
+            response["data"] = execution_result.data
+        if execution_result.extensions:
+            response["extensions"] = execution_result.extensions
+        if self.batch:
+            response["id"] = id
+            response["status"] = status_code
+
+        return self.json_encode(request, response, pretty=show_graphiql), status_code
+
+
+class AsyncGraphQLView(GraphQLView):
+    """
+    Executes queries on the event loop, with their root fields resolved
+    concurrently in worker threads. Mutations, batches, traced requests and
+    GraphiQL go through the synchronous view in a thread.
+    """
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+
+        async def async_view(request, *args, **kwargs):
+            return await view(request, *args, **kwargs)
+
+        # csrf_exempt() would hide that the view is a coroutine function
+        async_view.csrf_exempt = True
+        return update_wrapper(async_view, view)
+
+    async def dispatch(self, request, *args, **kwargs):
+        sync_dispatch = sync_to_async(super().dispatch)
+        try:
+            if request.method.lower() != "post":
+                return await sync_dispatch(request, *args, **kwargs)
+            # whether the user may see the trace is checked in the thread
+            if tracing.get_setting("ENABLED", False) or tracing.has_header(request):
+                return await sync_dispatch(request, *args, **kwargs)
+
+            data = self.parse_body(request)
+            if self.batch:
+                return await sync_dispatch(request, *args, **kwargs)
+            query, variables, operation_name, id = self.get_graphql_params(request, data)
+            result = await self.execute_graphql_request_async(
+                request, data, query, variables, operation_name
+            )
+            content, status_code = self.format_result(request, result, id)
+            response = HttpResponse(
+                status=status_code, content=content, content_type="application/json"
+            )
+        except HttpError as e:
+            response = e.response
+            response["Content-Type"] = "application/json"
+            response.content = self.json_encode(
+                request, {"errors": [self.format_error(e)]}
+            )
+        routers.pin_response(request, response)
+        return responses.finalize(request, response)
+
+    async def execute_graphql_request_async(
+        self, request, data, query, variables, operation_name
+    ):
+        extensions = request.GET.get("extensions") or data.get("extensions")
+        try:
+            query = await database_sync_to_async(documents.resolve_query)(
+                query, extensions
+            )
+        except documents.PersistedQueryError as e:
+            return ExecutionResult(errors=[e])
+        if not query:
+            raise HttpError(HttpResponseBadRequest("Must provide query string."))
+
+        try:
+            document = self.get_backend(request).document_from_string(self.schema, query)
+        except Exception as e:
+            return ExecutionResult(errors=[e], invalid=True)
+
+        authenticated = await database_sync_to_async(auth.authenticate_request)(request)
+        if not authenticated or document.get_operation_type(operation_name) != "query":
+            # mutations run serially anyway
+            return await sync_to_async(self.execute_graphql_request)(
+                request, data, query, variables, operation_name
+            )
+
+        start = time.perf_counter()
+        with routers.route_request(request, "query"):
+            result = document.execute(
+                root_value=self.get_root_value(request),
+                variable_values=variables,
+                operation_name=operation_name,
+                context_value=self.get_context(request),
+                middleware=self.get_middleware(request),
+                executor=ThreadedAsyncioExecutor(get_running_loop()),
+                return_promise=True,
+            )
+            if is_thenable(result):
+                result = await result
+        metrics.observe_operation(
+            self.schema, operation_name, result, time.perf_counter() - start
+        )
+        return result
+
+
+def internal(view):
+    """
+    Serves `view` to the INTERNAL_IPS, eg. the Prometheus server, and to staff
+    users logged into the site.
+    """
+
+    @wraps(view)
+    def internal_view(request, *args, **kwargs):
+        if not (
+            request.META.get("REMOTE_ADDR") in settings.INTERNAL_IPS
+            or request.user.is_staff
+        ):
+            return HttpResponseForbidden()
+        return view(request, *args, **kwargs)
+
+    return internal_view
+
+
+@internal
+def catalog_cache_stats(request):
+    return JsonResponse(cache.stats())
+
+
+@internal
+def prometheus_metrics(request):
+    return HttpResponse(metrics.export(), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,241 @@
+import os
+import random
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connection
+from django.db.models import Max
+
+from . import cache, counters, inventory
+from .checkout import discounted_price
+from .models import Address, Like, Order, OrderObj, Photo, Product, Review, User
+from .search import update_search_vector
+
+# GraphQL documents of the operations the frontend sends, one per .graphql file
+OPERATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "operations")
+# SQL queries allowed per operation, see QueryBudgetTest
+QUERY_BUDGETS = os.path.join(OPERATIONS_DIR, "query_budgets.json")
+
+# the operations in the order of a visit, setCart fills the cart orderCart orders
+VISIT = ["products", "product", "me", "orders", "setCart", "orderCart"]
+
+ADJECTIVES = [
+    "Golden",
+    "Silver",
+    "Silk",
+    "Cotton",
+    "Antique",
+    "Royal",
+    "Classic",
+    "Bridal",
+]
+NOUNS = {
+    Product.Kind.Jewellery: ["Ring", "Necklace", "Bangle", "Earrings", "Pendant"],
+    Product.Kind.Cloth: ["Saree", "Kurta", "Lehenga", "Dupatta", "Sherwani"],
+}
+CITIES = [("Delhi", "Delhi"), ("Mumbai", "Maharashtra"), ("Jaipur", "Rajasthan")]
+
+
+def operations():
+    """Returns the text of every known operation, by name."""
+    documents = {}
+    for name in sorted(os.listdir(OPERATIONS_DIR)):
+        if name.endswith(".graphql"):
+            with open(os.path.join(OPERATIONS_DIR, name)) as f:
+                documents[name[: -len(".graphql")]] = f.read()
+    return documents
+
+
+def operation_variables(name, product_id, address_id):
+    """Variables of the operation `name` for a product and address of the user."""
+    return {
+        "products": {"first": 20},
+        "product": {"id": str(product_id)},
+        "setCart": {"productId": str(product_id), "qty": 1},
+        "orderCart": {"addressId": str(address_id)},
+    }.get(name, {})
+
+
+def batches(objects, size):
+    objects = iter(objects)
+    while True:
+        batch = list(islice(objects, size))
+        if not batch:
+            return
+        yield batch
+
+
+def insert(model, objects, batch_size):
+    """bulk_create the `objects` generator in batches, returns their number."""
+    count = 0
+    for batch in batches(objects, batch_size):
+        model.objects.bulk_create(batch)
+        count += len(batch)
+    return count
+
+
+def next_pk(model):
+    return (model.objects.aggregate(pk=Max("pk"))["pk"] or 0) + 1
+
+
+def address_fields(user_pk):
+    city, state = CITIES[user_pk % len(CITIES)]
+    return {
+        "name": f"Bench user {user_pk}",
+        "phone": "9999999999",
+        "address1": f"{user_pk} Main Street",
+        "address2": "Market Area",
+        "pincode": 110000 + user_pk % 890000,
+        "city": city,
+        "state": state,
+        "country": "India",
+    }
+
+
+def seed(
+    products=1000,
+    users=100,
+    reviews=10000,
+    likes=50000,
+    orders=5000,
+    photos_per_product=2,
+    items_per_order=3,
+    stock=1000,
+    batch_size=1000,
+    random_seed=0,
+):
+    """
+    Adds synthetic rows for benchmarks, with deterministic contents for a given
+    `random_seed`. Rows get explicit primary keys following the existing ones,
+    so related rows are created without reading back what was inserted. Every
+    user gets an address and the password "password".
+
+    Returns the number of rows created per model.
+    """
+    if reviews > products * users:
+        raise Exception("At most one review per product and user")
+    if likes > reviews * users:
+        raise Exception("At most one like per review and user")
+    rng = random.Random(random_seed)
+
+    user_ids = range(next_pk(User), next_pk(User) + users)
+    product_ids = range(next_pk(Product), next_pk(Product) + products)
+    review_ids = range(next_pk(Review), next_pk(Review) + reviews)
+    order_ids = range(next_pk(Order), next_pk(Order) + orders)
+    password = make_password("password")
+    created = {}
+
+    created["user"] = insert(
+        User,
+        (
+            User(
+                pk=pk,
+                email=f"bench{pk}@larena.test",
+                name=f"Bench user {pk}",
+                phone="9999999999",
+                password=password,
+            )
+            for pk in user_ids
+        ),
+        batch_size,
+    )
+    created["address"] = insert(
+        Address,
+        (Address(user_id=pk, **address_fields(pk)) for pk in user_ids),
+        batch_size,
+    )
+
+    # prices the orders are placed at
+    prices = {}
+
+    def product(pk):
+        kind = rng.choice(Product.Kind.values)
+        name = f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS[kind])} {pk}"
+        obj = Product(
+            pk=pk,
+            name=name,
+            price=rng.randrange(100, 100000),
+            discount=rng.choice([0, 0, 5, 10, 20]),
+            stock=stock,
+            kind=kind,
+            description=f"{name}, handpicked for the Larena collection.",
+        )
+        prices[pk] = discounted_price(obj)
+        return obj
+
+    created["product"] = insert(Product, map(product, product_ids), batch_size)
+    created["photo"] = insert(
+        Photo,
+        (
+            Photo(product_id=pk, url=f"https://picsum.photos/seed/{pk}-{i}/600")
+            for pk in product_ids
+            for i in range(photos_per_product)
+        ),
+        batch_size,
+    )
+
+    # review i is by user i // products, like j of review j % reviews, so both
+    # stay unique per user
+    created["review"] = insert(
+        Review,
+        (
+            Review(
+                pk=pk,
+                user_id=user_ids[i // products],
+                product_id=product_ids[i % products],
+                rating=rng.randint(1, 5),
+                text=rng.choice(["Loved it", "Good value", "As pictured", None]),
+            )
+            for i, pk in enumerate(review_ids)
+        ),
+        batch_size,
+    )
+    created["like"] = insert(
+        Like,
+        (
+            Like(user_id=user_ids[i // reviews], review_id=review_ids[i % reviews])
+            for i in range(likes)
+        ),
+        batch_size,
+    )
+
+    created["order"] = insert(
+        Order,
+        (
+            Order(
+                pk=pk, user_id=user_ids[i % users], **address_fields(user_ids[i % users])
+            )
+            for i, pk in enumerate(order_ids)
+        ),
+        batch_size,
+    )
+
+    def order_objects(order_id):
+        for product_id in rng.sample(product_ids, min(items_per_order, products)):
+            yield OrderObj(
+                order_id=order_id,
+                product_id=product_id,
+                qty=rng.randint(1, 3),
+                price=prices[product_id],
+            )
+
+    created["order_obj"] = insert(
+        OrderObj,
+        (obj for order_id in order_ids for obj in order_objects(order_id)),
+        batch_size,
+    )
+
+    # the primary keys were given explicitly (postgres only)
+    with connection.cursor() as cursor:
+        models = [User, Product, Review, Order]
+        for sql in connection.ops.sequence_reset_sql(no_style(), models):
+            cursor.execute(sql)
+
+    # what the signals and mutations maintain for rows created one by one
+    for batch in batches(product_ids, batch_size):
+        inventory.rebalance(batch)
+        update_search_vector(batch)
+    counters.recompute(batch_size=batch_size)
+    cache.invalidate("products")
+    return created
@@ -0,0 +1,18 @@
+import os
+
+from prometheus_client import multiprocess
+
+
+def on_starting(server):
+    # metrics of previous runs would be aggregated with the new workers'
+    path = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if path:
+        # the directory itself is created by the image, and may not be ours
+        os.makedirs(path, exist_ok=True)
+        for name in os.listdir(path):
+            os.remove(os.path.join(path, name))
+
+
+def child_exit(server, worker):
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(worker.pid)